@@ -0,0 +1,196 @@
+"""
+Offline backtest of the live strategy over the pipeline datasets.
+
+Features are computed once over the whole series with the feature graph.
+AIModel.walk_forward then gives each candle the prediction the bot would
+have made at its close: labels use the Lorentzian threshold of the window
+the bot holds (LIMIT - 1 candles minus the warmup trims), and the model is
+trained on the window_size_AI candles before it. Trading follows TradingSimulation: SL is
+checked before TP on every candle, an opposite signal reverses the trade at
+the close, a new trade opens on the candle that closed the last one, and an
+SL multiplies the risk percent until the next TP. Rather than stepping
+candle by candle, each trade's exit is found with one vectorized search over
+the candles until the signal flips.
+
+    python backtest.py --csv ../Others/Data/BTC_1h.csv ../Others/Data/ETH_1h.csv
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from bot import (
+    AIModel, FeatureGraph, MarketDataFetcher, StrategyConfig,
+    TradeAnalysys, TradingSimulation, WarmupCalculator, logger
+)
+
+# ---------- BACKTEST SIMULATION ----------
+class BacktestSimulation(TradingSimulation):
+    """
+    TradingSimulation with its trades kept in a list: no Mongo, no backend
+    calls and no analysis per close. Trade levels, PnL and the risk update
+    are the live ones.
+    """
+    def __init__(self, config: StrategyConfig):
+        self.config = config
+        self.symbol = self.config.SYMBOL
+        self.initial_balance = self.config.initial_balance
+        self.current_risk_percent = self.config.risk_per_trade
+        self.lock = threading.RLock()
+        self.fence = None
+        self.trades = []
+
+    def get_open_trade(self):
+        if self.trades and self.trades[-1]["status"] == "OPEN":
+            return self.trades[-1]
+        return None
+
+    def open_trade(self, row):
+        self.trades.append(self.new_trade(row))
+
+    def close_trade(self, open_trade, reason: str, row, forced_exit_price=None):
+        open_trade.update(self.closing_update(open_trade, reason, row, forced_exit_price))
+        self.update_investment_per_trade(reason)
+
+    def closed_trades(self) -> list:
+        return [trade for trade in self.trades if trade["status"] != "OPEN"]
+
+    def run(self, candles: pd.DataFrame, predictions: np.ndarray) -> list:
+        """
+        Trades `predictions` (aligned with `candles`, NaN until the first one)
+        with the same outcome as calling handle_signal on every candle from
+        the first prediction on. The last trade is left open.
+        """
+        timestamps = candles['timestamp'].array
+        high = candles['high'].to_numpy()
+        low = candles['low'].to_numpy()
+        close = candles['close'].to_numpy()
+        atr = candles['ATR'].to_numpy()
+
+        predicted = np.flatnonzero(~np.isnan(predictions))
+        if not len(predicted):
+            return self.trades
+        n = len(candles)
+
+        # Candles whose signal points the other way than the one before
+        is_long = predictions == 1
+        flips = np.flatnonzero(is_long[1:] != is_long[:-1]) + 1
+
+        def row(i):
+            return {"timestamp": timestamps[i], "close": close[i], "ATR": atr[i], "prediction": predictions[i]}
+
+        i = predicted[0]
+        self.open_trade(row(i))
+        while True:
+            trade = self.trades[-1]
+            sl = trade["stop_loss"]
+            tp = trade["take_profit"]
+            flip = np.searchsorted(flips, i, side='right')
+            reverse_at = flips[flip] if flip < len(flips) else n
+
+            path = slice(i + 1, min(reverse_at + 1, n))
+            if trade["direction"] == "LONG":
+                sl_hit = low[path] <= sl
+                tp_hit = high[path] >= tp
+            else:
+                sl_hit = high[path] >= sl
+                tp_hit = low[path] <= tp
+            hits = np.flatnonzero(sl_hit | tp_hit)
+
+            if len(hits):
+                j = i + 1 + hits[0]
+                if sl_hit[hits[0]]:
+                    self.close_trade(trade, "SL", row(j), forced_exit_price=sl)
+                else:
+                    self.close_trade(trade, "TP", row(j), forced_exit_price=tp)
+            elif reverse_at < n:
+                j = reverse_at
+                self.close_trade(trade, self.reversal_reason(trade, close[j]), row(j))
+            else:
+                break
+
+            self.open_trade(row(j))
+            i = j
+        return self.trades
+
+# ---------- BACKTESTER ----------
+class Backtester:
+    """
+    Replays one symbol's candles through the feature graph, the model and a
+    BacktestSimulation, and returns the TradeAnalysys metrics.
+    """
+    def __init__(self, config: StrategyConfig, candles: pd.DataFrame):
+        self.config = config
+        WarmupCalculator.resolve_limit(config)
+        self.candles = candles
+        self.feature_graph = FeatureGraph.for_config(config)
+        self.ai_model = AIModel(config, connect_db=False)
+        self.trades = []
+
+    def features(self) -> pd.DataFrame:
+        return self.feature_graph.compute(self.candles.copy()).reset_index(drop=True)
+
+    def predictions(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        The live prediction for every candle that has a full window behind it.
+        """
+        labeled = self.config.LIMIT - 1 - self.feature_graph.trimmed_rows()
+        return self.ai_model.walk_forward(features, labeled)
+
+    def run(self) -> dict:
+        features = self.features()
+        predictions = self.predictions(features)
+        simulation = BacktestSimulation(self.config)
+        self.trades = simulation.run(features, predictions)
+        return TradeAnalysys.compute_metrics(simulation.closed_trades(), self.config)
+
+def config_for_csv(path: str) -> StrategyConfig:
+    """
+    StrategyConfig for an Others/Data/{SYMBOL}_{interval}.csv dataset.
+    """
+    symbol, interval = os.path.splitext(os.path.basename(path))[0].rsplit('_', 1)
+    return StrategyConfig(SYMBOL=f"{symbol}/USDT", TIMEFRAME=interval)
+
+def backtest_csv(path: str, start: str = None, end: str = None, trades_dir: str = None) -> dict:
+    started = time.perf_counter()
+    config = config_for_csv(path)
+    candles = MarketDataFetcher.load_pipeline_csv(path)
+    if start:
+        candles = candles[candles['timestamp'] >= pd.Timestamp(start)]
+    if end:
+        candles = candles[candles['timestamp'] < pd.Timestamp(end)]
+
+    backtester = Backtester(config, candles.reset_index(drop=True))
+    metrics = backtester.run()
+    if trades_dir:
+        os.makedirs(trades_dir, exist_ok=True)
+        pd.DataFrame(backtester.trades).to_csv(
+            os.path.join(trades_dir, f"{config.collection_name}_{config.TIMEFRAME}.csv"), index=False)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"[{config.SYMBOL} {config.TIMEFRAME}] Backtested {len(candles)} candles in {elapsed:.1f}s.")
+    return {"symbol": config.SYMBOL, "timeframe": config.TIMEFRAME, "candles": len(candles),
+            "seconds": round(elapsed, 2), **metrics}
+
+# ---------- MAIN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the strategy on pipeline CSVs.")
+    parser.add_argument("--csv", nargs="+", required=True, help="Others/Data/{SYMBOL}_{interval}.csv datasets")
+    parser.add_argument("--start", default=None, help="First candle to load, e.g. 2024-01-01")
+    parser.add_argument("--end", default=None, help="Load candles before this date")
+    parser.add_argument("--workers", type=int, default=None, help="Processes to spread the datasets over")
+    parser.add_argument("--trades", default=None, help="Directory to write each dataset's trades to")
+    args = parser.parse_args()
+
+    workers = args.workers or min(len(args.csv), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        run = partial(backtest_csv, start=args.start, end=args.end, trades_dir=args.trades)
+        results = list(pool.map(run, args.csv))
+
+    print(json.dumps(results, indent=2, default=str))
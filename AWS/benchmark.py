@@ -0,0 +1,239 @@
+"""
+Benchmarks of the signal pipeline on seeded synthetic OHLCV.
+
+Each size gets a random-walk candle series with drifting volatility; the
+same seed always gives the same candles. The batch stages (indicators,
+derived features, labeling features, labeling, and all of them as
+`pipeline`) run over the whole series, `feature_graph` is the live feature
+path, `walk_forward` the backtest model pass, and `live_candle` is what
+SymbolRunner.predict costs at every candle close on a LIMIT window. The
+last two are skipped for sizes shorter than LIMIT plus the live candles. Each
+stage keeps its fastest of --repeat runs; peak memory comes from one more
+run under tracemalloc, so tracing does not skew the timings.
+
+Results can be stored as a baseline; a later run is compared against it
+and exits with status 1 when a stage got slower by more than --threshold.
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.2
+    python benchmark.py --sizes 1000 10000 --stages indicators labeling --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from bot import (
+    AIModel, CandelLabeling, DerivedFeatures, FeatureGraph, LabelingFeature, MarketDataFetcher,
+    StrategyConfig, SymbolRunner, TechnicalIndicators, WarmupCalculator, logger
+)
+
+STAGES = ['indicators', 'derived_features', 'labeling_features', 'labeling', 'pipeline',
+          'feature_graph', 'walk_forward', 'live_candle']
+WINDOW_STAGES = ['walk_forward', 'live_candle']  # need LIMIT + LIVE_CANDLES bars
+LIVE_CANDLES = 20  # closes timed by live_candle
+
+# ---------- SYNTHETIC DATA ----------
+def synthetic_candles(n: int, seed: int = 7, timeframe: str = '1h') -> pd.DataFrame:
+    """
+    `n` OHLCV candles: log-normal returns whose volatility follows a slow
+    AR(1) process, so there are calm and volatile regimes for the ATR and
+    volatility percentiles to separate.
+    """
+    rng = np.random.default_rng(seed)
+    log_vol = np.zeros(n)
+    shocks = rng.normal(0, 0.1, n)
+    for i in range(1, n):
+        log_vol[i] = 0.98 * log_vol[i - 1] + shocks[i]
+    sigma = 0.006 * np.exp(log_vol)
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0, sigma)))
+    open_ = np.concatenate([[100.0], close[:-1]])
+    wick = np.abs(rng.normal(0, sigma, (2, n))) * close
+    minutes = MarketDataFetcher.timeframe_to_minutes(timeframe)
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2020-01-01', periods=n, freq=f'{minutes}min'),
+        'open': open_,
+        'high': np.maximum(open_, close) + wick[0],
+        'low': np.minimum(open_, close) - wick[1],
+        'close': close,
+        'volume': rng.lognormal(10, 1, n)
+    })
+
+# ---------- STAGES ----------
+def labeling_features(df: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
+    df = LabelingFeature.compute_lookahead_period(df, config)
+    df = LabelingFeature.compute_market_structure(df, config)
+    df = LabelingFeature.compute_momentum_features(df, config)
+    return LabelingFeature.compute_lorentzian_distance(df, config)
+
+def batch_pipeline(candles: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
+    df = TechnicalIndicators.calculate_indicators(candles.copy(), config)
+    df = DerivedFeatures.calculate_features(df, config)
+    df = labeling_features(df, config)
+    return CandelLabeling.label_candles(df, config)
+
+def live_candles(candles: pd.DataFrame, config: StrategyConfig):
+    """
+    The last LIVE_CANDLES closes of the series through a fresh SymbolRunner,
+    one LIMIT window each, as the live loop sees them.
+    """
+    runner = SymbolRunner(config, trading=False)
+    capacity = runner.candle_buffer.capacity
+    for end in range(len(candles) - LIVE_CANDLES + 1, len(candles) + 1):
+        runner.predict(candles.iloc[end - capacity:end].reset_index(drop=True))
+
+def stage_runs(candles: pd.DataFrame, config: StrategyConfig) -> dict:
+    """
+    Stage name -> (callable, units it processes). Inputs of the later stages
+    are computed once here, outside the timings.
+    """
+    indicators = TechnicalIndicators.calculate_indicators(candles.copy(), config)
+    derived = DerivedFeatures.calculate_features(indicators.copy(), config)
+    labeled_input = labeling_features(derived.copy(), config)
+    graph = FeatureGraph.for_config(config)
+    features = graph.compute(candles.copy()).reset_index(drop=True)
+    model = AIModel(config, connect_db=False)
+    labeled = config.LIMIT - 1 - graph.trimmed_rows()
+
+    return {
+        'indicators': (lambda: TechnicalIndicators.calculate_indicators(candles.copy(), config), len(candles)),
+        'derived_features': (lambda: DerivedFeatures.calculate_features(indicators.copy(), config), len(candles)),
+        'labeling_features': (lambda: labeling_features(derived.copy(), config), len(candles)),
+        'labeling': (lambda: CandelLabeling.label_candles(labeled_input.copy(), config), len(candles)),
+        'pipeline': (lambda: batch_pipeline(candles, config), len(candles)),
+        'feature_graph': (lambda: graph.compute(candles.copy()), len(candles)),
+        'walk_forward': (lambda: model.walk_forward(features, labeled), len(features)),
+        'live_candle': (lambda: live_candles(candles, config), LIVE_CANDLES),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silences the pipeline's per-call logging and prints while it is timed.
+    """
+    logging.disable(logging.INFO)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+def measure(run, repeat: int) -> tuple:
+    """
+    Fastest of `repeat` runs in seconds, and the peak traced memory of one more in bytes.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+# ---------- BENCHMARK ----------
+def benchmark(sizes: list, stages: list, repeat: int = 3, seed: int = 7) -> dict:
+    results = {}
+    for size in sizes:
+        config = StrategyConfig(SYMBOL='SYN/USDT', TIMEFRAME='1h')
+        WarmupCalculator.resolve_limit(config)
+        sized = stages
+        if size < config.LIMIT + LIVE_CANDLES:
+            sized = [name for name in stages if name not in WINDOW_STAGES]
+            skipped = [name for name in stages if name in WINDOW_STAGES]
+            if skipped:
+                logger.info(f"{size:>7} bars  skipping {', '.join(skipped)}: shorter than LIMIT ({config.LIMIT}) "
+                            f"plus {LIVE_CANDLES} live candles")
+        candles = synthetic_candles(size, seed)
+        with quiet():
+            runs = stage_runs(candles, config)
+
+        results[str(size)] = {}
+        for name in sized:
+            run, units = runs[name]
+            with quiet():
+                seconds, peak = measure(run, repeat)
+            results[str(size)][name] = {
+                "seconds": seconds,
+                "per_second": units / seconds,
+                "peak_mib": peak / 2**20
+            }
+            logger.info(f"{size:>7} bars  {name:<18} {seconds:9.4f}s  {units / seconds:12.0f}/s  {peak / 2**20:8.1f} MiB")
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Rows of (size, stage, seconds, baseline seconds, change) for every stage
+    in both, and whether it regressed past `threshold`.
+    """
+    rows = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            change = result["seconds"] / base["seconds"] - 1
+            rows.append((size, name, result["seconds"], base["seconds"], change, change > threshold))
+    return rows
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor()
+    }
+
+# ---------- MAIN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the signal pipeline on synthetic OHLCV.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Bars per series")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown vs the baseline (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", default=None, help="Write the results as a baseline JSON")
+    parser.add_argument("--out", default=None, help="Write the results JSON")
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.stages, args.repeat, args.seed)
+    report = {"environment": environment(), "seed": args.seed, "repeat": args.repeat, "results": results}
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            logger.info(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            logger.warning("Baseline was recorded in a different environment; timings may not compare.")
+        rows = compare(results, baseline, args.threshold)
+        print(f"{'bars':>7}  {'stage':<18}{'seconds':>10}{'baseline':>10}{'change':>9}")
+        for size, name, seconds, base, change, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{size:>7}  {name:<18}{seconds:>10.4f}{base:>10.4f}{change:>+9.1%}{flag}")
+        regressions = [row for row in rows if row[-1]]
+        if regressions:
+            logger.error(f"{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}.")
+            sys.exit(1)
@@ -1,17 +1,43 @@
 import os
+import json
+import math
+import io
+import hashlib
+import asyncio
+import aiohttp
 import ccxt
+import ccxt.async_support as ccxt_async
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import time
 import logging
 import threading
-from datetime import datetime, timezone
+import multiprocessing
+import atexit
+import queue
+import signal
+import cProfile
+import tracemalloc
+import sys
+import sqlite3
+import socket
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 from typing import Optional
-from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neighbors import KNeighborsClassifier, KDTree, BallTree
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
-from pymongo import MongoClient
-from flask import Flask
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from bson import ObjectId
+from flask import Flask, jsonify
 from dotenv import load_dotenv
 import requests
 
@@ -24,11 +50,260 @@ DB_NAME = os.getenv("DB_NAME")
 # Retrieve backend host and port; provide defaults if they are not set
 backend_uri = os.getenv("BACKEND_URI")
 backend_port = os.getenv("BACKEND_PORT")
+# "poll" runs a thread per symbol that sleeps until each candle close and polls REST,
+# "async" fetches all symbols concurrently from one event loop, "stream" reacts to closed-kline events,
+# "sharded" runs the polling loop for the symbols this node holds a lease on (see ShardManager)
+BOT_MODE = os.getenv("BOT_MODE", "poll")
+BYBIT_WS_URL = os.getenv("BYBIT_WS_URL", "wss://stream.bybit.com/v5/public/linear")
+SNAPSHOT_STORE = os.getenv("SNAPSHOT_STORE", "")  # "", "disk" or "mongo"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")  # undelivered backend notifications
+# "publicTrade" or "tickers" closes trades on SL/TP as the stream prices cross them, "" only at candle close
+EXIT_MONITOR = os.getenv("EXIT_MONITOR", "")
+# "all" or comma-separated symbols (BTC/USDT,ETH/USDT) whose candles are profiled into PROFILE_DIR
+BOT_PROFILE = os.getenv("BOT_PROFILE", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "500"))  # newest profile files kept
+# Comma-separated SYMBOL or SYMBOL:TIMEFRAME entries (5m when omitted)
+BOT_SYMBOLS = os.getenv("BOT_SYMBOLS", "BTC/USDT,ETH/USDT,BNB/USDT,SOL/USDT,1000PEPE/USDT")
+BOT_NODE_ID = os.getenv("BOT_NODE_ID", f"{socket.gethostname()}-{os.getpid()}")  # this node's name in shard leases
 
 # ----- LOGGER SETUP -----
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ---------- CLOCK ----------
+class Clock:
+    """
+    Time source of the trading loop: candle-close sleeps, the candle buffer's
+    "now" and the close-to-signal lag. The replay harness installs a virtual
+    clock (replay.VirtualClock) so the loop runs as fast as the CPU allows.
+    """
+    current = None  # the installed clock
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    @classmethod
+    def install(cls, clock: "Clock") -> "Clock":
+        """
+        Makes `clock` the current clock and returns the previous one.
+        """
+        previous, cls.current = cls.current, clock
+        return previous
+
+Clock.current = Clock()
+
+# ---------- METRICS ----------
+class Metrics:
+    """
+    Process-wide latency histograms, counters and gauges for the /metrics
+    endpoint, keyed by a label such as "BTC/USDT 5m". Histograms have fixed
+    buckets, so recording is a counter increment under one lock.
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    started = time.time()
+    _lock = threading.Lock()
+    _histograms = {}  # label -> stage -> {"count", "sum", "max", "buckets"}
+    _counters = {}    # label -> name -> int
+    _gauges = {}      # label -> name -> float
+
+    @classmethod
+    def observe(cls, label: str, stage: str, seconds: float):
+        with cls._lock:
+            histogram = cls._histograms.setdefault(label, {}).get(stage)
+            if histogram is None:
+                histogram = cls._histograms[label][stage] = {
+                    "count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(cls.BUCKETS) + 1)
+                }
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+            histogram["buckets"][bisect_left(cls.BUCKETS, seconds)] += 1
+
+    @classmethod
+    def increment(cls, label: str, name: str, amount: int = 1):
+        with cls._lock:
+            counters = cls._counters.setdefault(label, {})
+            counters[name] = counters.get(name, 0) + amount
+
+    @classmethod
+    def set_gauge(cls, label: str, name: str, value: float):
+        with cls._lock:
+            cls._gauges.setdefault(label, {})[name] = value
+
+    @classmethod
+    def export(cls, label: str) -> dict:
+        """
+        Takes the histograms and counters recorded for `label` out of this
+        process, for merge() in another (the process-mode workers).
+        """
+        with cls._lock:
+            return {"label": label, "histograms": cls._histograms.pop(label, {}), "counters": cls._counters.pop(label, {})}
+
+    @classmethod
+    def merge(cls, exported: dict):
+        label = exported["label"]
+        with cls._lock:
+            for stage, other in exported["histograms"].items():
+                histogram = cls._histograms.setdefault(label, {}).get(stage)
+                if histogram is None:
+                    cls._histograms[label][stage] = other
+                    continue
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["max"] = max(histogram["max"], other["max"])
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+            counters = cls._counters.setdefault(label, {})
+            for name, value in exported["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+    @classmethod
+    def quantile(cls, histogram: dict, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th observation (max past the last bucket).
+        """
+        rank = q * histogram["count"]
+        seen = 0
+        for bound, count in zip(cls.BUCKETS, histogram["buckets"]):
+            seen += count
+            if seen >= rank:
+                return min(bound, histogram["max"])
+        return histogram["max"]
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        now = time.time()
+        with cls._lock:
+            labels = sorted(set(cls._histograms) | set(cls._counters) | set(cls._gauges))
+            symbols = {}
+            for label in labels:
+                stages = {}
+                for stage, histogram in cls._histograms.get(label, {}).items():
+                    stages[stage] = {
+                        "count": histogram["count"],
+                        "mean": histogram["sum"] / histogram["count"],
+                        "p50": cls.quantile(histogram, 0.5),
+                        "p95": cls.quantile(histogram, 0.95),
+                        "max": histogram["max"],
+                        "buckets": dict(zip([str(b) for b in cls.BUCKETS] + ["+Inf"], histogram["buckets"]))
+                    }
+                gauges = dict(cls._gauges.get(label, {}))
+                last_close = gauges.pop("last_candle_close", None)
+                if last_close is not None:
+                    gauges["last_candle_age"] = now - last_close
+                symbols[label] = {"stages": stages, "counters": dict(cls._counters.get(label, {})), **gauges}
+        return {"uptime": now - cls.started, "symbols": symbols}
+
+@contextmanager
+def stage(label: str, name: str):
+    """
+    Times the enclosed block into the `name` histogram of `label`, and
+    profiles it when its thread is inside a Profiler.candle().
+    """
+    profile = Profiler.start_stage()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        Metrics.observe(label, name, elapsed)
+        if profile is not None:
+            Profiler.end_stage(name, profile, elapsed)
+
+# ---------- PROFILING ----------
+class Profiler:
+    """
+    Opt-in (BOT_PROFILE) capture of where a candle's time and memory went.
+    Every stage() of a profiled candle is run under its own cProfile and
+    written as <prefix>_<stage>.prof (pstats format, e.g. snakeviz or
+    `python -m pstats`); <prefix>.txt lists each stage's time and peak traced
+    memory and the allocation sites that grew most over the candle.
+    Profilers and tracemalloc are process-wide, so one candle is profiled at
+    a time and a candle closing meanwhile is only timed; tracing stops when
+    the candle ends. Allocations of other threads running during the candle
+    show up in its summary too. Files past the newest PROFILE_KEEP are
+    deleted. In process mode only the stages of the main process are
+    profiled.
+    """
+    TOP_ALLOCATIONS = 25
+    _lock = threading.Lock()
+    _local = threading.local()
+
+    @staticmethod
+    def enabled_for(symbol: str) -> bool:
+        return BOT_PROFILE == "all" or symbol in BOT_PROFILE.split(",")
+
+    @classmethod
+    @contextmanager
+    def candle(cls, label: str, symbol: str):
+        if not BOT_PROFILE or not cls.enabled_for(symbol) or not cls._lock.acquire(blocking=False):
+            yield
+            return
+        started_tracing = not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{label.replace('/', '').replace(' ', '_')}_{datetime.now(timezone.utc):%Y%m%dT%H%M%S}"
+            session = cls._local.session = {"label": label, "prefix": os.path.join(PROFILE_DIR, name), "stages": []}
+            before = tracemalloc.take_snapshot()
+            started = time.perf_counter()
+            yield
+        finally:
+            if getattr(cls._local, "session", None) is not None:
+                cls._local.session = None
+                try:
+                    cls._write_summary(session, time.perf_counter() - started, before, tracemalloc.take_snapshot())
+                    cls._rotate()
+                except OSError as e:
+                    logger.error(f"[{label}] Could not write the profile: {e}")
+            # Tracing slows every allocation in the process, so it only runs during the candle
+            if started_tracing:
+                tracemalloc.stop()
+            cls._lock.release()
+
+    @classmethod
+    def start_stage(cls) -> Optional[cProfile.Profile]:
+        if getattr(cls._local, "session", None) is None:
+            return None
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    @classmethod
+    def end_stage(cls, name: str, profile: cProfile.Profile, elapsed: float):
+        profile.disable()
+        session = cls._local.session
+        _, peak = tracemalloc.get_traced_memory()
+        session["stages"].append((name, elapsed, peak))
+        profile.dump_stats(f"{session['prefix']}_{name}.prof")
+
+    @classmethod
+    def _write_summary(cls, session: dict, elapsed: float, before, after):
+        lines = [f"{session['label']} candle: {elapsed:.4f}s", "", f"{'stage':<16}{'seconds':>10}{'peak MiB':>12}"]
+        for name, seconds, peak in session["stages"]:
+            lines.append(f"{name:<16}{seconds:>10.4f}{peak / 2**20:>12.1f}")
+        lines += ["", f"Top {cls.TOP_ALLOCATIONS} allocation sites by growth over the candle:"]
+        # Leave out what the profiling itself allocated
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__)]
+        growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        lines += [str(stat) for stat in growth[:cls.TOP_ALLOCATIONS]]
+        with open(f"{session['prefix']}.txt", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        logger.info(f"[{session['label']}] Profile written to {session['prefix']}.txt")
+
+    @staticmethod
+    def _rotate():
+        paths = [os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:-PROFILE_KEEP]:
+            os.remove(path)
+
 # ---------- CONFIGURATION CLASS ----------
 class StrategyConfig:
     def __init__(self, SYMBOL, TIMEFRAME):
@@ -54,9 +329,18 @@ class StrategyConfig:
         # Labeling & AI
         self.Lookahead_window = 100
         self.window_size_AI = 200
-        self.LIMIT = 1001  # to fetch data
+        self.LIMIT = 1001  # to fetch data; None derives it from the pipeline warmup (see WarmupCalculator)
+        self.EMA_CONVERGENCE_TOL = 0.01  # max weight the EMA seed may keep on the first training row
         self.use_logistic_smoothing = True
         self.random_state = 42
+        self.use_incremental_indicators = True
+        self.verify_incremental_indicators = False  # diff against the batch indicators every candle
+        self.use_feature_graph = True  # evaluate only the features the model needs, trimming once
+        self.use_incremental_model = False  # slide the scaler/KNN window instead of refitting every candle
+        self.verify_incremental_model = False  # also run the batch refit and warn when predictions differ
+        self.use_numpy_model = True  # NumPy scaler/KNN/logistic instead of sklearn (same model, less overhead)
+        self.KNN_BACKEND = 'auto'  # 'brute', 'tree', 'approx' or 'auto' (picked by window size and feature count)
+        self.KNN_METRIC = 'euclidean'  # or 'lorentzian'
 
         # Trading
         self.stop_atr_multiplier = 0.75
@@ -73,6 +357,140 @@ class StrategyConfig:
         self.collection_name = f"{SYMBOL.replace('/', '_')}"
         #self.collection_name = f"{SYMBOL.replace('/', '_')}_{TIMEFRAME}"
 
+def build_configs(spec: str = BOT_SYMBOLS) -> list:
+    """
+    StrategyConfigs for a BOT_SYMBOLS list, e.g. "BTC/USDT,ETH/USDT:15m".
+    """
+    configs = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if entry:
+            symbol, _, timeframe = entry.partition(":")
+            configs.append(StrategyConfig(SYMBOL=symbol, TIMEFRAME=timeframe or '5m'))
+    return require_unique_symbols(configs)
+
+def require_unique_symbols(configs: list) -> list:
+    """
+    Trades, the open trade and the risk percent are kept per symbol
+    (collection_name), so two timeframes of one symbol would trade against
+    each other's stale in-memory view.
+    """
+    timeframes = {}
+    for conf in configs:
+        timeframes.setdefault(conf.SYMBOL, []).append(conf.TIMEFRAME)
+    duplicates = {symbol: tfs for symbol, tfs in timeframes.items() if len(tfs) > 1}
+    if duplicates:
+        raise ValueError(f"One timeframe per symbol is supported, got {duplicates}")
+    return configs
+
+# ---------- EXCHANGE CLIENTS ----------
+class ExchangeRegistry:
+    """
+    Process-wide ccxt clients, one per (exchange, market type).
+    Markets are loaded once and refreshed every MARKETS_TTL seconds. The HTTP
+    session, its keep-alive connection pool and the rate limiter state are
+    shared by every symbol thread.
+    """
+    MARKETS_TTL = 3600  # seconds
+    POOL_MAXSIZE = 16   # keep-alive connections per host
+    _clients = {}
+    _async_clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, exchange_id: str = 'bybit', market_type: str = 'linear'):
+        key = (exchange_id, market_type)
+        with cls._lock:
+            entry = cls._clients.get(key)
+            if entry is None:
+                entry = cls._create(exchange_id, market_type)
+                cls._clients[key] = entry
+        cls._refresh_markets(entry)
+        return entry["client"]
+
+    @classmethod
+    def register(cls, client, exchange_id: str = 'bybit', market_type: str = 'linear'):
+        """
+        Serves `client` (anything with ccxt's fetch_ohlcv and load_markets) for
+        (exchange, market type) instead of a ccxt client, e.g. a replay exchange.
+        """
+        with cls._lock:
+            cls._clients[(exchange_id, market_type)] = {
+                "client": client, "markets_loaded_at": time.monotonic(), "lock": threading.Lock()
+            }
+
+    @classmethod
+    def _create(cls, exchange_id: str, market_type: str) -> dict:
+        exchange = getattr(ccxt, exchange_id)({
+            'enableRateLimit': True,
+            'options': {
+                'defaultType': market_type
+            }
+        })
+        # requests' default pool keeps a single connection per host, which the
+        # symbol threads would keep tearing down and re-handshaking
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=cls.POOL_MAXSIZE)
+        exchange.session.mount("https://", adapter)
+        logger.info(f"Created shared {exchange_id} ({market_type}) exchange client.")
+        return {"client": exchange, "markets_loaded_at": None, "lock": threading.Lock()}
+
+    @classmethod
+    def _refresh_markets(cls, entry: dict):
+        loaded_at = entry["markets_loaded_at"]
+        if loaded_at is not None and time.monotonic() - loaded_at < cls.MARKETS_TTL:
+            return
+        with entry["lock"]:
+            # Another thread may have refreshed while we waited for the lock
+            loaded_at = entry["markets_loaded_at"]
+            if loaded_at is not None and time.monotonic() - loaded_at < cls.MARKETS_TTL:
+                return
+            exchange = entry["client"]
+            try:
+                exchange.load_markets(reload=loaded_at is not None)
+                entry["markets_loaded_at"] = time.monotonic()
+                logger.info(f"Loaded {len(exchange.markets)} {exchange.id} markets.")
+            except Exception as e:
+                # Keep serving with the previous markets; retried on the next call
+                logger.error(f"Error loading {exchange.id} markets: {e}")
+
+    @classmethod
+    async def get_async(cls, exchange_id: str = 'bybit', market_type: str = 'linear'):
+        """
+        Async counterpart of get() returning a ccxt.async_support client. Async
+        clients are bound to the event loop that created them, so this must be
+        called from the loop that uses the client.
+        """
+        key = (exchange_id, market_type)
+        entry = cls._async_clients.get(key)
+        if entry is None:
+            exchange = getattr(ccxt_async, exchange_id)({
+                'enableRateLimit': True,
+                'options': {
+                    'defaultType': market_type
+                }
+            })
+            logger.info(f"Created shared async {exchange_id} ({market_type}) exchange client.")
+            entry = {"client": exchange, "markets_loaded_at": None, "lock": asyncio.Lock()}
+            cls._async_clients[key] = entry
+
+        async with entry["lock"]:
+            loaded_at = entry["markets_loaded_at"]
+            if loaded_at is None or time.monotonic() - loaded_at >= cls.MARKETS_TTL:
+                exchange = entry["client"]
+                try:
+                    await exchange.load_markets(reload=loaded_at is not None)
+                    entry["markets_loaded_at"] = time.monotonic()
+                    logger.info(f"Loaded {len(exchange.markets)} {exchange.id} markets.")
+                except Exception as e:
+                    logger.error(f"Error loading {exchange.id} markets: {e}")
+        return entry["client"]
+
+    @classmethod
+    async def close_async(cls):
+        for entry in cls._async_clients.values():
+            await entry["client"].close()
+        cls._async_clients.clear()
+
 # ---------- MARKET DATA FETCHER ----------
 class MarketDataFetcher:
     @staticmethod
@@ -87,13 +505,51 @@ class MarketDataFetcher:
         else:
             raise ValueError(f"Unrecognized timeframe: {tf}")
 
+    @staticmethod
+    def timeframe_to_bybit_interval(tf: str) -> str:
+        """
+        Converts a ccxt timeframe to Bybit's kline interval (5m → 5, 1h → 60, 1d → D).
+        """
+        minutes = MarketDataFetcher.timeframe_to_minutes(tf)
+        if minutes % (60 * 24) == 0:
+            return "D"
+        return str(minutes)
+
+    @staticmethod
+    def to_futures_symbol(symbol: str) -> str:
+        # Convert symbol to Bybit futures format (BTC/USDT → BTCUSDT)
+        if "/" in symbol:
+            base, quote = symbol.split("/")
+            return f"{base}{quote}"  # BTCUSDT
+        return symbol
+
+    @staticmethod
+    def load_pipeline_csv(path: str) -> pd.DataFrame:
+        """
+        Loads an Others/Data/{SYMBOL}_{interval}.csv dataset as OHLCV rows.
+        The pipeline only stores quote volume, so that is used as volume.
+        """
+        raw = pd.read_csv(path)
+        df = pd.DataFrame({
+            'timestamp': pd.to_datetime(raw['Open Time']),
+            'open': raw['Open'].astype(float),
+            'high': raw['High'].astype(float),
+            'low': raw['Low'].astype(float),
+            'close': raw['Close'].astype(float),
+            'volume': raw['Quote Asset Volume'].astype(float),
+        })
+        df.drop_duplicates(subset=['timestamp'], inplace=True)
+        df.sort_values('timestamp', inplace=True)
+        df.reset_index(drop=True, inplace=True)
+        return df
+
     @staticmethod
     def sleep_until_candle_close(tf_minutes: int):
         """
         Sleeps until the next candle is (almost) closed.
         """
         reducedelay = 54
-        now_utc = datetime.now(timezone.utc)
+        now_utc = Clock.current.now()
         minute = now_utc.minute
         second = now_utc.second
 
@@ -111,7 +567,7 @@ class MarketDataFetcher:
         if total_sleep > 0:
             logger.info("---------------------------------------------------")
             logger.info(f"Sleeping {total_sleep} seconds until next {tf_minutes}m candle close...")
-            time.sleep(total_sleep)
+            Clock.current.sleep(total_sleep)
 
     @staticmethod
     def delete_database(db_name: str):
@@ -171,57 +627,228 @@ class MarketDataFetcher:
     def fetch_binance_futures_ohlcv(symbol: str, timeframe: str, limit: int, last_known_ts: pd.Timestamp = None) -> Optional[pd.DataFrame]:
         """
         Fetches OHLCV data from Bybit Futures (modified for Bybit)
+        If last_known_ts is given, only candles opened after it are requested.
         """
-        exchange = ccxt.bybit({
-            'options': {
-                'defaultType': 'linear'  # For USDT perpetual contracts
-            }
-        })
+        exchange = ExchangeRegistry.get('bybit', 'linear')  # For USDT perpetual contracts
+
+        futures_symbol = MarketDataFetcher.to_futures_symbol(symbol)
+        since, min_rows = MarketDataFetcher._since(timeframe, last_known_ts)
 
-        # Convert symbol to Bybit futures format (BTC/USDT → BTCUSDT)
-        if "/" in symbol:
-            base, quote = symbol.split("/")
-            futures_symbol = f"{base}{quote}"  # BTCUSDT
-        else:
-            futures_symbol = symbol
-            
         max_retries = 2
         retry_delay = 15  # seconds
 
         for attempt in range(max_retries):
             try:
                 logger.info(f"Fetching {limit} bars for {symbol} on {timeframe} (Attempt {attempt+1}/{max_retries})...")
-                ohlcv = exchange.fetch_ohlcv(futures_symbol, timeframe, since=None, limit=limit)
+                with stage(f"{symbol} {timeframe}", "fetch"):
+                    ohlcv = exchange.fetch_ohlcv(futures_symbol, timeframe, since=since, limit=limit)
 
                 # Rest of the code remains unchanged
-                if not ohlcv or len(ohlcv) < 2:
+                if not ohlcv or len(ohlcv) < min_rows:
                     logger.warning("No or insufficient data from Binance.")
                     return None
 
-                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                df.drop_duplicates(subset=['timestamp'], inplace=True)
-                df.sort_values('timestamp', inplace=True)
-                df.reset_index(drop=True, inplace=True)
+                return MarketDataFetcher._closed_candles(ohlcv)
+
+            except Exception as e:
+                logger.error(f"Error fetching data: {e}")
+                Metrics.increment(f"{symbol} {timeframe}", "fetch_errors")
+                if attempt < max_retries - 1:
+                    Metrics.increment(f"{symbol} {timeframe}", "fetch_retries")
+                    logger.info(f"Retrying in {retry_delay} seconds...")
+                    time.sleep(retry_delay)
+                else:
+                    logger.error("❌ Maximum retries reached. Skipping this iteration.")
+                    return None
+
+    @staticmethod
+    async def fetch_ohlcv_async(exchange, symbol: str, timeframe: str, limit: int, last_known_ts: pd.Timestamp = None) -> Optional[pd.DataFrame]:
+        """
+        Async counterpart of fetch_binance_futures_ohlcv for a ccxt.async_support client.
+        """
+        futures_symbol = MarketDataFetcher.to_futures_symbol(symbol)
+        since, min_rows = MarketDataFetcher._since(timeframe, last_known_ts)
+
+        max_retries = 2
+        retry_delay = 15  # seconds
+
+        for attempt in range(max_retries):
+            try:
+                logger.info(f"Fetching {limit} bars for {symbol} on {timeframe} (Attempt {attempt+1}/{max_retries})...")
+                with stage(f"{symbol} {timeframe}", "fetch"):
+                    ohlcv = await exchange.fetch_ohlcv(futures_symbol, timeframe, since=since, limit=limit)
 
-                if len(df) > 0:
-                    last_candle_time = df.iloc[-1]['timestamp']
-                    logger.info(f"Dropping the last row to ensure we skip the unfinished candle. Time: {last_candle_time}")
-                    df = df.iloc[:-1]
+                if not ohlcv or len(ohlcv) < min_rows:
+                    logger.warning("No or insufficient data from Bybit.")
+                    return None
 
-                logger.info(f"✅ Successfully fetched {len(df)} fully closed bars.")
-                return df
+                return MarketDataFetcher._closed_candles(ohlcv)
 
             except Exception as e:
                 logger.error(f"Error fetching data: {e}")
+                Metrics.increment(f"{symbol} {timeframe}", "fetch_errors")
                 if attempt < max_retries - 1:
+                    Metrics.increment(f"{symbol} {timeframe}", "fetch_retries")
                     logger.info(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                 else:
                     logger.error("❌ Maximum retries reached. Skipping this iteration.")
                     return None
 
+    @staticmethod
+    def _since(timeframe: str, last_known_ts: Optional[pd.Timestamp]):
+        """
+        Returns the `since` (ms) of a delta fetch after last_known_ts and the
+        minimum number of bars a useful response has.
+        """
+        if last_known_ts is None:
+            return None, 2
+        tf_ms = MarketDataFetcher.timeframe_to_minutes(timeframe) * 60 * 1000
+        # Only the still-open candle means there is nothing new yet
+        return pd.Timestamp(last_known_ts).value // 1_000_000 + tf_ms, 1
+
+    @staticmethod
+    def _closed_candles(ohlcv: list) -> pd.DataFrame:
+        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.drop_duplicates(subset=['timestamp'], inplace=True)
+        df.sort_values('timestamp', inplace=True)
+        df.reset_index(drop=True, inplace=True)
+
+        if len(df) > 0:
+            last_candle_time = df.iloc[-1]['timestamp']
+            logger.info(f"Dropping the last row to ensure we skip the unfinished candle. Time: {last_candle_time}")
+            df = df.iloc[:-1]
+
+        logger.info(f"✅ Successfully fetched {len(df)} fully closed bars.")
+        return df
+
 ####
+# ---------- CANDLE BUFFER ----------
+class CandleBuffer:
+    """
+    Rolling window of fully closed candles for one (symbol, timeframe).
+    After the first full load only candles newer than the last closed one are
+    fetched and appended; the oldest ones are evicted. A gap in the returned
+    candles triggers a full reload.
+    """
+    _buffers = {}
+    _buffers_lock = threading.Lock()
+
+    def __init__(self, symbol: str, timeframe: str, limit: int):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.limit = limit
+        # A full fetch returns `limit` bars and the last one is still open
+        self.capacity = limit - 1
+        self.tf_delta = pd.Timedelta(minutes=MarketDataFetcher.timeframe_to_minutes(timeframe))
+        self.df = None
+
+    @classmethod
+    def get(cls, symbol: str, timeframe: str, limit: int) -> "CandleBuffer":
+        """
+        Returns the shared buffer for (symbol, timeframe), creating it on first use.
+        """
+        key = (symbol, timeframe)
+        with cls._buffers_lock:
+            buffer = cls._buffers.get(key)
+            if buffer is None or buffer.limit != limit:
+                buffer = cls(symbol, timeframe, limit)
+                cls._buffers[key] = buffer
+            return buffer
+
+    @property
+    def last_ts(self) -> Optional[pd.Timestamp]:
+        if self.df is None or self.df.empty:
+            return None
+        return self.df["timestamp"].iloc[-1]
+
+    def window(self) -> pd.DataFrame:
+        """
+        Returns a copy of the buffered candles; the pipeline mutates its input.
+        """
+        return self.df.copy()
+
+    def next_request(self) -> dict:
+        """
+        Fetch arguments that bring the buffer up to date: a delta after the last
+        closed candle, or a full window when the buffer is empty or too far behind.
+        """
+        if self.last_ts is None:
+            return {"limit": self.limit, "last_known_ts": None}
+
+        now = pd.Timestamp(Clock.current.now().replace(tzinfo=None))
+        missing = int((now - self.last_ts) // self.tf_delta)
+        if missing > self.capacity:
+            return {"limit": self.limit, "last_known_ts": None}
+
+        # One extra bar for the still-open candle plus one for clock skew
+        return {"limit": max(missing, 0) + 2, "last_known_ts": self.last_ts}
+
+    def replace(self, df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        if df is None or df.empty:
+            return None
+        self.df = df.iloc[-self.capacity:].reset_index(drop=True)
+        return self.window()
+
+    def reload(self) -> Optional[pd.DataFrame]:
+        logger.info(f"[{self.symbol} {self.timeframe}] Full reload of the candle buffer.")
+        return self.replace(MarketDataFetcher.fetch_binance_futures_ohlcv(self.symbol, self.timeframe, self.limit))
+
+    def append(self, new_rows: pd.DataFrame) -> bool:
+        """
+        Appends closed candles newer than the buffer. Returns False on a gap.
+        """
+        new_rows = new_rows[new_rows["timestamp"] > self.last_ts]
+        if new_rows.empty:
+            return True
+
+        steps = new_rows["timestamp"].diff()
+        steps.iloc[0] = new_rows["timestamp"].iloc[0] - self.last_ts
+        if not (steps == self.tf_delta).all():
+            logger.warning(f"[{self.symbol} {self.timeframe}] Gap after {self.last_ts}, buffer needs a full reload.")
+            return False
+
+        self.df = pd.concat([self.df, new_rows], ignore_index=True)
+        self.df = self.df.iloc[-self.capacity:].reset_index(drop=True)
+        return True
+
+    def update(self) -> Optional[pd.DataFrame]:
+        """
+        Brings the buffer up to the last closed candle and returns the window.
+        """
+        request = self.next_request()
+        if request["last_known_ts"] is None:
+            return self.reload()
+
+        new_rows = MarketDataFetcher.fetch_binance_futures_ohlcv(self.symbol, self.timeframe, **request)
+        if new_rows is None:
+            return None
+        if not self.append(new_rows):
+            return self.reload()
+
+        logger.info(f"[{self.symbol} {self.timeframe}] Buffer holds {len(self.df)} bars up to {self.last_ts}.")
+        return self.window()
+
+    async def update_async(self, exchange) -> Optional[pd.DataFrame]:
+        """
+        update() through a ccxt.async_support client.
+        """
+        request = self.next_request()
+        if request["last_known_ts"] is None:
+            logger.info(f"[{self.symbol} {self.timeframe}] Full reload of the candle buffer.")
+            return self.replace(await MarketDataFetcher.fetch_ohlcv_async(exchange, self.symbol, self.timeframe, self.limit))
+
+        new_rows = await MarketDataFetcher.fetch_ohlcv_async(exchange, self.symbol, self.timeframe, **request)
+        if new_rows is None:
+            return None
+        if not self.append(new_rows):
+            logger.info(f"[{self.symbol} {self.timeframe}] Full reload of the candle buffer.")
+            return self.replace(await MarketDataFetcher.fetch_ohlcv_async(exchange, self.symbol, self.timeframe, self.limit))
+
+        logger.info(f"[{self.symbol} {self.timeframe}] Buffer holds {len(self.df)} bars up to {self.last_ts}.")
+        return self.window()
+
 # ---------- TECHNICAL INDICATORS ----------
 class TechnicalIndicators:
     @staticmethod
@@ -230,18 +857,11 @@ class TechnicalIndicators:
 
         # RSI
         if 'RSI' not in df.columns:
-            delta = df["close"].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=config.RSI_PERIOD).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=config.RSI_PERIOD).mean()
-            rs = gain / loss
-            df["RSI"] = 100 - (100 / (1 + rs))
+            df["RSI"] = TechnicalIndicators.rsi(df["close"], config.RSI_PERIOD)
 
         # CCI
         if 'CCI' not in df.columns:
-            tp = (df["high"] + df["low"] + df["close"]) / 3
-            cci_mean = tp.rolling(window=config.CCI_PERIOD).mean()
-            mean_dev = (tp - cci_mean).abs().rolling(window=config.CCI_PERIOD).mean()
-            df["CCI"] = (tp - cci_mean) / (0.015 * mean_dev)
+            df["CCI"] = TechnicalIndicators.cci(df["high"], df["low"], df["close"], config.CCI_PERIOD)
 
         # EMA, SMA
         if 'EMA' not in df.columns:
@@ -255,43 +875,456 @@ class TechnicalIndicators:
 
         # ADX
         if 'ADX' not in df.columns:
-            adx_len = config.ADX_PERIOD
-            di_len = config.ADX_PERIOD
-            df["TR"] = np.maximum(
-                df["high"] - df["low"],
-                np.maximum(
-                    abs(df["high"] - df["close"].shift(1)),
-                    abs(df["low"] - df["close"].shift(1))
-                )
-            )
-            up_move = df["high"].diff()
-            down_move = -df["low"].diff()
-            df["+DM"] = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
-            df["-DM"] = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
-
-            df["+DI"] = 100 * (df["+DM"].rolling(window=di_len).mean() / df["TR"].rolling(window=di_len).mean())
-            df["-DI"] = 100 * (df["-DM"].rolling(window=di_len).mean() / df["TR"].rolling(window=di_len).mean())
-
-            df["DX"] = 100 * (abs(df["+DI"] - df["-DI"]) / (df["+DI"] + df["-DI"]))
-            df["ADX"] = df["DX"].rolling(window=adx_len).mean()
-
-            df.drop(columns=["TR", "+DM", "-DM", "+DI", "-DI", "DX"], inplace=True)
+            df["ADX"] = TechnicalIndicators.adx(df["high"], df["low"], df["close"], config.ADX_PERIOD)
 
         # WaveTrend
         if 'WT' not in df.columns:
-            hlc3 = (df["high"] + df["low"] + df["close"]) / 3
-            esa = hlc3.ewm(span=config.WT_CHANNEL_LENGTH, adjust=False).mean()
-            d = abs(hlc3 - esa).ewm(span=config.WT_ATR_LENGTH, adjust=False).mean()
-            df["WT"] = (hlc3 - esa) / (0.015 * d)
+            df["WT"] = TechnicalIndicators.wavetrend(df["high"], df["low"], df["close"],
+                                                     config.WT_CHANNEL_LENGTH, config.WT_ATR_LENGTH)
 
         df.dropna(inplace=True)
         logger.info("Indicators calculated.")
         return df
 
+    @staticmethod
+    def rsi(close: pd.Series, period: int) -> pd.Series:
+        delta = close.diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+    @staticmethod
+    def cci(high: pd.Series, low: pd.Series, close: pd.Series, period: int) -> pd.Series:
+        tp = (high + low + close) / 3
+        cci_mean = tp.rolling(window=period).mean()
+        mean_dev = (tp - cci_mean).abs().rolling(window=period).mean()
+        return (tp - cci_mean) / (0.015 * mean_dev)
+
+    @staticmethod
+    def adx(high: pd.Series, low: pd.Series, close: pd.Series, period: int) -> pd.Series:
+        adx_len = period
+        di_len = period
+        tr = np.maximum(
+            high - low,
+            np.maximum(
+                abs(high - close.shift(1)),
+                abs(low - close.shift(1))
+            )
+        )
+        up_move = high.diff()
+        down_move = -low.diff()
+        plus_dm = pd.Series(np.where((up_move > down_move) & (up_move > 0), up_move, 0), index=high.index)
+        minus_dm = pd.Series(np.where((down_move > up_move) & (down_move > 0), down_move, 0), index=high.index)
+
+        plus_di = 100 * (plus_dm.rolling(window=di_len).mean() / tr.rolling(window=di_len).mean())
+        minus_di = 100 * (minus_dm.rolling(window=di_len).mean() / tr.rolling(window=di_len).mean())
+
+        dx = 100 * (abs(plus_di - minus_di) / (plus_di + minus_di))
+        return dx.rolling(window=adx_len).mean()
+
+    @staticmethod
+    def wavetrend(high: pd.Series, low: pd.Series, close: pd.Series, channel_length: int, atr_length: int) -> pd.Series:
+        hlc3 = (high + low + close) / 3
+        esa = hlc3.ewm(span=channel_length, adjust=False).mean()
+        d = abs(hlc3 - esa).ewm(span=atr_length, adjust=False).mean()
+        return (hlc3 - esa) / (0.015 * d)
+
+# ---------- INCREMENTAL INDICATORS ----------
+def _div(a: float, b: float) -> float:
+    """
+    Float division with numpy semantics (x/0 -> ±inf, 0/0 -> nan) instead of raising.
+    """
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+def _maximum(a: float, b: float) -> float:
+    """
+    np.maximum for scalars: nan if either side is nan.
+    """
+    if math.isnan(a) or math.isnan(b):
+        return math.nan
+    return a if a >= b else b
+
+class RollingMean:
+    """
+    O(1) equivalent of Series.rolling(window).mean(): nan until the window is
+    full and while it holds a nan. Mirrors pandas' exact results for constant
+    runs and its sign clamping; the sum is rebuilt once per window to stop
+    floating-point drift from accumulating.
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self.warmup = window - 1
+        self.values = deque()
+        self.total = 0.0
+        self.nan_count = 0
+        self.neg_count = 0
+        self.same_count = 0
+        self.since_resum = 0
+
+    def update(self, x: float) -> float:
+        if self.values and x == self.values[-1]:
+            self.same_count += 1
+        else:
+            self.same_count = 1
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+            self.neg_count += x < 0
+
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.total -= old
+                self.neg_count -= old < 0
+
+        self.since_resum += 1
+        if self.since_resum >= self.window:
+            self.total = math.fsum(v for v in self.values if not math.isnan(v))
+            self.since_resum = 0
+
+        if len(self.values) < self.window or self.nan_count:
+            return math.nan
+        if self.same_count >= self.window:
+            return x
+        result = self.total / self.window
+        if self.neg_count == 0 and result < 0:
+            return 0.0
+        if self.neg_count == self.window and result > 0:
+            return 0.0
+        return result
+
+class EWMMean:
+    """
+    O(1) equivalent of Series.ewm(span=span, adjust=False).mean(), following
+    pandas' recursion step for step (including its normalisation and the
+    handling of nans) so the results match the batch version bit for bit.
+    """
+    def __init__(self, span: int):
+        self.alpha = 2.0 / (span + 1.0)
+        self.warmup = 0
+        self.weighted = math.nan
+        self.old_wt = 1.0
+
+    def update(self, x: float) -> float:
+        is_observation = not math.isnan(x)
+        if not math.isnan(self.weighted):
+            self.old_wt *= 1.0 - self.alpha
+            if is_observation:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif is_observation:
+            self.weighted = x
+        return self.weighted
+
+class RSIState:
+    def __init__(self, period: int):
+        self.gain = RollingMean(period)
+        self.loss = RollingMean(period)
+        self.warmup = period - 1
+        self.prev_close = math.nan
+
+    def update(self, close: float) -> float:
+        delta = close - self.prev_close
+        self.prev_close = close
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-(delta if delta < 0 else 0.0))
+        rs = _div(gain, loss)
+        return 100 - _div(100, 1 + rs)
+
+class CCIState:
+    def __init__(self, period: int):
+        self.mean = RollingMean(period)
+        self.mean_dev = RollingMean(period)
+        self.warmup = 2 * (period - 1)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        tp = (high + low + close) / 3
+        cci_mean = self.mean.update(tp)
+        mean_dev = self.mean_dev.update(abs(tp - cci_mean))
+        return _div(tp - cci_mean, 0.015 * mean_dev)
+
+class ADXState:
+    def __init__(self, period: int):
+        self.tr = RollingMean(period)
+        self.plus_dm = RollingMean(period)
+        self.minus_dm = RollingMean(period)
+        self.dx = RollingMean(period)
+        self.warmup = 2 * period - 1
+        self.prev_high = math.nan
+        self.prev_low = math.nan
+        self.prev_close = math.nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        tr = _maximum(high - low, _maximum(abs(high - self.prev_close), abs(low - self.prev_close)))
+        up_move = high - self.prev_high
+        down_move = -(low - self.prev_low)
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+
+        plus_dm = up_move if (up_move > down_move) and (up_move > 0) else 0.0
+        minus_dm = down_move if (down_move > up_move) and (down_move > 0) else 0.0
+        tr_mean = self.tr.update(tr)
+        plus_di = 100 * _div(self.plus_dm.update(plus_dm), tr_mean)
+        minus_di = 100 * _div(self.minus_dm.update(minus_dm), tr_mean)
+        dx = 100 * _div(abs(plus_di - minus_di), plus_di + minus_di)
+        return self.dx.update(dx)
+
+class WaveTrendState:
+    def __init__(self, channel_length: int, atr_length: int):
+        self.esa = EWMMean(channel_length)
+        self.d = EWMMean(atr_length)
+        # The first bar is always 0/0
+        self.warmup = 1
+
+    def update(self, high: float, low: float, close: float) -> float:
+        hlc3 = (high + low + close) / 3
+        esa = self.esa.update(hlc3)
+        d = self.d.update(abs(hlc3 - esa))
+        return _div(hlc3 - esa, 0.015 * d)
+
+class IndicatorState:
+    """
+    Incremental TechnicalIndicators for one config. The indicator objects are
+    seeded from the candle window once and then updated in O(1) per new closed
+    candle. apply() fills the indicator columns of a window (with the same
+    warmup rows as the batch version left as nan), so calculate_indicators
+    keeps them and only drops the warmup rows.
+    """
+    COLUMNS = ['RSI', 'CCI', 'EMA', 'SMA', 'ATR', 'ADX', 'WT']
+    # Seed weight below which an EMA seeded earlier is considered converged
+    VERIFY_EMA_TOLERANCE = 1e-9
+
+    def __init__(self, config: StrategyConfig):
+        self.config = config
+        self.reset()
+
+    def reset(self):
+        config = self.config
+        self.rsi = RSIState(config.RSI_PERIOD)
+        self.cci = CCIState(config.CCI_PERIOD)
+        self.ema = EWMMean(config.EMA_PERIOD)
+        self.sma = RollingMean(config.SMA_PERIOD)
+        self.atr = RollingMean(config.ATR_PERIOD)
+        self.adx = ADXState(config.ADX_PERIOD)
+        self.wt = WaveTrendState(config.WT_CHANNEL_LENGTH, config.WT_ATR_LENGTH)
+        self.timestamps = deque(maxlen=config.LIMIT)
+        self.values = deque(maxlen=config.LIMIT)
+
+    @property
+    def last_ts(self) -> Optional[pd.Timestamp]:
+        return self.timestamps[-1] if self.timestamps else None
+
+    @property
+    def warmups(self) -> list:
+        return [self.rsi.warmup, self.cci.warmup, self.ema.warmup, self.sma.warmup,
+                self.atr.warmup, self.adx.warmup, self.wt.warmup]
+
+    def update(self, timestamp: pd.Timestamp, high: float, low: float, close: float):
+        self.timestamps.append(timestamp)
+        self.values.append((
+            self.rsi.update(close),
+            self.cci.update(high, low, close),
+            self.ema.update(close),
+            self.sma.update(close),
+            self.atr.update(high - low),
+            self.adx.update(high, low, close),
+            self.wt.update(high, low, close),
+        ))
+
+    def seed(self, df: pd.DataFrame):
+        logger.info(f"[{self.config.SYMBOL} {self.config.TIMEFRAME}] Seeding incremental indicators from {len(df)} bars.")
+        self.reset()
+        for ts, high, low, close in zip(df["timestamp"], df["high"].to_numpy(float), df["low"].to_numpy(float), df["close"].to_numpy(float)):
+            self.update(ts, high, low, close)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Brings the state up to the last candle of `df` and adds the indicator columns.
+        """
+        timestamps = df["timestamp"]
+        if self.last_ts is None or self.last_ts < timestamps.iloc[0] or self.last_ts > timestamps.iloc[-1]:
+            self.seed(df)
+        else:
+            new_rows = df[timestamps > self.last_ts]
+            for ts, high, low, close in zip(new_rows["timestamp"], new_rows["high"].to_numpy(float), new_rows["low"].to_numpy(float), new_rows["close"].to_numpy(float)):
+                self.update(ts, high, low, close)
+            # A window that does not line up with the state (e.g. after a gap reload) reseeds it
+            if len(self.timestamps) < len(df) or self.timestamps[-len(df)] != timestamps.iloc[0]:
+                self.seed(df)
+
+        values = np.array(self.values, dtype=float)[-len(df):]
+        for i, warmup in enumerate(self.warmups):
+            values[:warmup, i] = np.nan
+        df[self.COLUMNS] = values
+        return df
+
+    def verify(self, df: pd.DataFrame) -> dict:
+        """
+        Diffs the incremental columns of `df` against TechnicalIndicators on the
+        same candles. Rows before the batch EMAs converge are skipped, since the
+        incremental EMAs were seeded further back.
+        """
+        batch = TechnicalIndicators.calculate_indicators(df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].copy(), self.config)
+        longest_span = max(self.config.EMA_PERIOD, self.config.WT_CHANNEL_LENGTH, self.config.WT_ATR_LENGTH)
+        converged = int(np.ceil(np.log(self.VERIFY_EMA_TOLERANCE) / np.log(1 - 2.0 / (longest_span + 1))))
+        rows = batch.index[batch.index >= df.index[0] + converged]
+
+        diffs = {}
+        for column in self.COLUMNS:
+            expected = batch.loc[rows, column].to_numpy(float)
+            actual = df.loc[rows, column].to_numpy(float)
+            scale = np.maximum(np.abs(expected), 1.0)
+            diffs[column] = float(np.nanmax(np.abs(actual - expected) / scale)) if len(rows) else 0.0
+
+        worst = max(diffs.values()) if diffs else 0.0
+        if worst > 1e-6:
+            logger.warning(f"[{self.config.SYMBOL} {self.config.TIMEFRAME}] Incremental indicators differ from batch: {diffs}")
+        else:
+            logger.info(f"[{self.config.SYMBOL} {self.config.TIMEFRAME}] Incremental indicators match batch (max rel diff {worst:.2e}).")
+        return diffs
+
+# ---------- ROLLING ORDER STATISTICS ----------
+class SortedWindow:
+    """
+    Sliding window kept in sorted order with bisect insert/delete, giving the
+    rank of a value and the quantiles of the window in O(log w) search per bar.
+    Matches pandas rolling(window).rank(pct=True) (average ties) and
+    rolling(window).quantile(q) (linear interpolation): nan until the window is
+    full and while it holds a nan.
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque()
+        self.sorted = []
+        self.nan_count = 0
+
+    def push(self, x: float):
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            insort(self.sorted, x)
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                del self.sorted[bisect_left(self.sorted, old)]
+
+    @property
+    def ready(self) -> bool:
+        return len(self.values) == self.window and not self.nan_count
+
+    def rank_pct(self, x: float) -> float:
+        if not self.ready or math.isnan(x):
+            return math.nan
+        lo = bisect_left(self.sorted, x)
+        hi = bisect_right(self.sorted, x)
+        return (lo + 1 + hi) / 2 / self.window
+
+    def quantile(self, q: float) -> float:
+        if not self.ready:
+            return math.nan
+        position = q * (self.window - 1)
+        idx = int(position)
+        if idx == position:
+            return self.sorted[idx]
+        low, high = self.sorted[idx], self.sorted[idx + 1]
+        return low + (high - low) * (position - idx)
+
+    @staticmethod
+    def rolling_rank(values, window: int) -> np.ndarray:
+        """
+        Batch mode: rank (pct) of each value within its trailing window.
+        """
+        sorted_window = SortedWindow(window)
+        out = np.empty(len(values))
+        for i, x in enumerate(np.asarray(values, dtype=float).tolist()):
+            sorted_window.push(x)
+            out[i] = sorted_window.rank_pct(x)
+        return out
+
+    @staticmethod
+    def rolling_quantile(values, window: int, q: float) -> np.ndarray:
+        """
+        Batch mode: q-quantile of each trailing window.
+        """
+        sorted_window = SortedWindow(window)
+        out = np.empty(len(values))
+        for i, x in enumerate(np.asarray(values, dtype=float).tolist()):
+            sorted_window.push(x)
+            out[i] = sorted_window.quantile(q)
+        return out
+
+class RollingStatCache:
+    """
+    Push-one-bar mode of SortedWindow for the live loop. Outputs are kept per
+    candle timestamp, so each call only inserts the candles newer than the last
+    one pushed; apply() returns exactly what the batch rank/quantile would give
+    on the same column. Any mismatch with the cached inputs (gap reload,
+    changed history) re-pushes the whole column.
+    """
+    def __init__(self, window: int, capacity: int, q: float = None):
+        self.window = window
+        self.capacity = capacity
+        self.q = q
+        self.reset()
+
+    def reset(self):
+        self.sorted_window = SortedWindow(self.window)
+        self.timestamps = deque(maxlen=self.capacity)
+        self.inputs = deque(maxlen=self.capacity)
+        self.outputs = deque(maxlen=self.capacity)
+
+    def _push(self, timestamp, x: float):
+        self.sorted_window.push(x)
+        self.timestamps.append(timestamp)
+        self.inputs.append(x)
+        if self.q is None:
+            self.outputs.append(self.sorted_window.rank_pct(x))
+        else:
+            self.outputs.append(self.sorted_window.quantile(self.q))
+
+    def apply(self, timestamps: pd.Series, values: pd.Series) -> np.ndarray:
+        values = values.to_numpy(dtype=float)
+        n = len(values)
+        # Leading nans (e.g. the pct_change warmup of ROC) move with the start of
+        # the column; the windows that touch them are nan in the batch version
+        valid = np.flatnonzero(~np.isnan(values))
+        lead = int(valid[0]) if len(valid) else n
+
+        known = 0
+        if self.timestamps:
+            known = int((timestamps <= self.timestamps[-1]).sum())
+        lines_up = known > 0 and known <= len(self.timestamps) and self.timestamps[-known] == timestamps.iloc[0]
+        if lines_up:
+            cached_inputs = np.array(self.inputs, dtype=float)[len(self.inputs) - known:]
+            lines_up = np.array_equal(cached_inputs[lead:], values[lead:known], equal_nan=True)
+        if not lines_up:
+            self.reset()
+            known = 0
+
+        for timestamp, x in zip(timestamps.iloc[known:], values[known:].tolist()):
+            self._push(timestamp, x)
+
+        out = np.array(self.outputs, dtype=float)[-n:]
+        # Batch results start over at the first row of the column
+        out[:lead + self.window - 1] = np.nan
+        return out
+
 # ---------- DERIVED FEATURES ----------
 class DerivedFeatures:
     @staticmethod
-    def calculate_features(df: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
+    def calculate_features(df: pd.DataFrame, config: StrategyConfig, quantile_cache: RollingStatCache = None) -> pd.DataFrame:
         logger.info("Calculating derived features...")
 
         # Ensure needed columns
@@ -310,7 +1343,10 @@ class DerivedFeatures:
 
         # Volatility Filter
         df["Volatility_Filter"] = df["ATR"] / df["close"]
-        percentile_80 = df["Volatility_Filter"].rolling(window=config.VOLATILITY_WINDOW).quantile(config.VOLATILITY_PERCENTILE)
+        if quantile_cache is not None:
+            percentile_80 = quantile_cache.apply(df["timestamp"], df["Volatility_Filter"])
+        else:
+            percentile_80 = df["Volatility_Filter"].rolling(window=config.VOLATILITY_WINDOW).quantile(config.VOLATILITY_PERCENTILE)
         df["High_Volatility"] = df["Volatility_Filter"] > percentile_80
 
         df.dropna(inplace=True)
@@ -321,11 +1357,14 @@ class DerivedFeatures:
 # ---------- LABELING FEATURES ----------
 class LabelingFeature:
     @staticmethod
-    def compute_lookahead_period(df: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
+    def compute_lookahead_period(df: pd.DataFrame, config: StrategyConfig, rank_cache: RollingStatCache = None) -> pd.DataFrame:
         logger.info("Computing lookahead period (ATR-based)...")
         window = config.Lookahead_window
 
-        df['ATR_Percentile'] = df['ATR'].rolling(window=window).rank(pct=True)
+        if rank_cache is not None:
+            df['ATR_Percentile'] = rank_cache.apply(df['timestamp'], df['ATR'])
+        else:
+            df['ATR_Percentile'] = df['ATR'].rolling(window=window).rank(pct=True)
         df.dropna(subset=['ATR_Percentile'], inplace=True)
         df['Lookahead_Period'] = np.clip(((df['ATR_Percentile'] * 7) + 7).round(), 7, 14).astype(int)
         df.drop(columns=['ATR_Percentile'], inplace=True)
@@ -371,7 +1410,7 @@ class LabelingFeature:
 ###
 
     @staticmethod
-    def compute_momentum_features(df: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
+    def compute_momentum_features(df: pd.DataFrame, config: StrategyConfig, rank_cache: RollingStatCache = None) -> pd.DataFrame:
         logger.info("Computing momentum-based features...")
         window = config.Lookahead_window
 
@@ -379,7 +1418,10 @@ class LabelingFeature:
         df['ROC'] = df['close'].pct_change(periods=window) * 100  # No fillna
         
         # 2. Keep original rolling rank logic
-        df['Momentum_Percentile'] = df['ROC'].rolling(window=window).rank(pct=True)
+        if rank_cache is not None:
+            df['Momentum_Percentile'] = rank_cache.apply(df['timestamp'], df['ROC'])
+        else:
+            df['Momentum_Percentile'] = df['ROC'].rolling(window=window).rank(pct=True)
         
         # 3. Maintain condition structure but eliminate NaNs
         df['Momentum_Confirm'] = np.where(
@@ -406,12 +1448,359 @@ class LabelingFeature:
         df.dropna(inplace=True)
         return df
 
+# ---------- FEATURE GRAPH ----------
+class Feature:
+    """
+    One node of a FeatureGraph. `inputs` are OHLCV columns, other features or
+    trims (names starting with '@'). `compute` receives the non-trim inputs as
+    arrays restricted to the node's scope (the rows kept by the deepest trim
+    among its inputs) and returns the output for those rows. `warmup` is the
+    number of rows after its inputs become valid that the output is still nan.
+    Cacheable features also receive the RollingStatCache registered under
+    their name, if any.
+    A trim has no compute: it keeps the rows of its scope where every input is
+    valid, which is what the dropna calls between the feature stages do.
+    """
+    def __init__(self, name: str, inputs: list, compute=None, warmup: int = 0, dtype=float, cacheable: bool = False):
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+        self.warmup = warmup
+        self.dtype = dtype
+        self.cacheable = cacheable
+
+    @property
+    def is_trim(self) -> bool:
+        return self.name.startswith('@')
+
+    @property
+    def data_inputs(self) -> list:
+        return [name for name in self.inputs if not name.startswith('@')]
+
+class FeatureGraph:
+    """
+    Declarative form of the feature stages (indicators -> derived features ->
+    lookahead -> market structure -> momentum -> Lorentzian distance).
+    compute() only evaluates what the requested outputs depend on, so columns
+    the model never reads (Regime_Label, High_Volatility and the rolling
+    volatility quantile behind it) are skipped. Every output array is
+    allocated once at full length, each feature runs on a view of the rows its
+    trim keeps, and the result is trimmed a single time at the end. Rows and
+    values are identical to running the stages in sequence.
+    """
+    BASE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    # Everything CandelLabeling.label_candles and AIModel.train_and_predict read
+    MODEL_OUTPUTS = [
+        'RSI', 'CCI', 'EMA', 'SMA', 'ATR', 'ADX', 'WT', 'ROC', 'Lorentzian_Distance',
+        'EMA_LONG', 'SMA_SHORT', 'Support_Level', 'Resistance_Level',
+        'Breakout_Confirm', 'Momentum_Confirm', 'Lookahead_Period', '@lorentzian'
+    ]
+    # Metrics stage of a feature, by the trim scope it runs in; deeper scopes are labeling features
+    STAGES = {None: 'indicators', '@indicators': 'derived_features'}
+
+    def __init__(self, features: list):
+        self.features = {feature.name: feature for feature in features}
+
+    @classmethod
+    def for_config(cls, config: StrategyConfig) -> "FeatureGraph":
+        S = lambda values: pd.Series(values, copy=False)
+        window = config.Lookahead_window
+
+        def rolling_rank(timestamps, values, cache=None):
+            if cache is not None:
+                return cache.apply(S(timestamps), S(values))
+            return S(values).rolling(window=window).rank(pct=True).to_numpy()
+
+        def regime_label(gradient):
+            std_dev = S(gradient).rolling(window=config.SMA_SHORT).std().to_numpy()
+            return np.where(gradient > std_dev, "Uptrend",
+                            np.where(gradient < -std_dev, "Downtrend", "Ranging"))
+
+        def high_volatility(timestamps, volatility, cache=None):
+            if cache is not None:
+                percentile_80 = cache.apply(S(timestamps), S(volatility))
+            else:
+                percentile_80 = S(volatility).rolling(window=config.VOLATILITY_WINDOW).quantile(config.VOLATILITY_PERCENTILE).to_numpy()
+            return volatility > percentile_80
+
+        def momentum_confirm(timestamps, roc, cache=None):
+            percentile = rolling_rank(timestamps, roc, cache)
+            return np.where(percentile >= 0.80, 1, np.where(percentile <= 0.20, -1, 0))
+
+        def lorentzian(*columns):
+            frame = pd.DataFrame(dict(zip(config.LORENTZIAN_FEATURES, columns)))
+            return np.log(1 + np.abs(frame.diff())).sum(axis=1).to_numpy()
+
+        indicators = ['RSI', 'CCI', 'EMA', 'SMA', 'ATR', 'ADX', 'WT']
+        return cls([
+            # TechnicalIndicators.calculate_indicators
+            Feature('RSI', ['close'], lambda c: TechnicalIndicators.rsi(S(c), config.RSI_PERIOD).to_numpy(),
+                    warmup=config.RSI_PERIOD - 1),
+            Feature('CCI', ['high', 'low', 'close'],
+                    lambda h, l, c: TechnicalIndicators.cci(S(h), S(l), S(c), config.CCI_PERIOD).to_numpy(),
+                    warmup=2 * (config.CCI_PERIOD - 1)),
+            Feature('EMA', ['close'], lambda c: S(c).ewm(span=config.EMA_PERIOD, adjust=False).mean().to_numpy()),
+            Feature('SMA', ['close'], lambda c: S(c).rolling(window=config.SMA_PERIOD).mean().to_numpy(),
+                    warmup=config.SMA_PERIOD - 1),
+            Feature('ATR', ['high', 'low'], lambda h, l: S(h - l).rolling(window=config.ATR_PERIOD).mean().to_numpy(),
+                    warmup=config.ATR_PERIOD - 1),
+            Feature('ADX', ['high', 'low', 'close'],
+                    lambda h, l, c: TechnicalIndicators.adx(S(h), S(l), S(c), config.ADX_PERIOD).to_numpy(),
+                    warmup=2 * config.ADX_PERIOD - 1),
+            Feature('WT', ['high', 'low', 'close'],
+                    lambda h, l, c: TechnicalIndicators.wavetrend(S(h), S(l), S(c), config.WT_CHANNEL_LENGTH,
+                                                                  config.WT_ATR_LENGTH).to_numpy(),
+                    warmup=1),
+            Feature('@indicators', ['open', 'high', 'low', 'close', 'volume'] + indicators),
+
+            # DerivedFeatures.calculate_features
+            Feature('EMA_LONG', ['close', '@indicators'],
+                    lambda c: S(c).ewm(span=config.EMA_LONG, adjust=False).mean().to_numpy()),
+            Feature('SMA_SHORT', ['close', '@indicators'],
+                    lambda c: S(c).rolling(window=config.SMA_SHORT).mean().to_numpy(), warmup=config.SMA_SHORT - 1),
+            Feature('Market_Regime', ['SMA_SHORT', 'EMA_LONG'], lambda sma, ema: sma / ema),
+            Feature('Regime_Gradient', ['Market_Regime'], lambda regime: S(regime).diff().to_numpy(), warmup=1),
+            Feature('Regime_Label', ['Regime_Gradient'], regime_label, dtype=object),
+            Feature('Volatility_Filter', ['ATR', 'close', '@indicators'], lambda atr, c: atr / c),
+            Feature('High_Volatility', ['timestamp', 'Volatility_Filter'], high_volatility, dtype=bool, cacheable=True),
+            Feature('@derived', ['EMA_LONG', 'SMA_SHORT', 'Market_Regime', 'Regime_Gradient', 'Volatility_Filter',
+                                 '@indicators']),
+
+            # LabelingFeature.compute_lookahead_period
+            Feature('ATR_Percentile', ['timestamp', 'ATR', '@derived'], rolling_rank, warmup=window - 1,
+                    cacheable=True),
+            Feature('@lookahead', ['ATR_Percentile', '@derived']),
+            Feature('Lookahead_Period', ['ATR_Percentile', '@lookahead'],
+                    lambda pct: np.clip(((pct * 7) + 7).round(), 7, 14).astype(int), dtype=int),
+
+            # LabelingFeature.compute_market_structure
+            Feature('Rolling_High', ['high', '@lookahead'], lambda h: S(h).rolling(window=window).max().to_numpy(),
+                    warmup=window - 1),
+            Feature('Rolling_Low', ['low', '@lookahead'], lambda l: S(l).rolling(window=window).min().to_numpy(),
+                    warmup=window - 1),
+            Feature('Support_Level', ['Rolling_Low'], lambda low: S(low).rolling(window=window).mean().to_numpy(),
+                    warmup=window - 1),
+            Feature('Resistance_Level', ['Rolling_High'],
+                    lambda high: S(high).rolling(window=window).mean().to_numpy(), warmup=window - 1),
+            Feature('Breakout_Confirm', ['close', 'Support_Level', 'Resistance_Level'],
+                    lambda c, support, resistance: np.where(c > resistance, 1, np.where(c < support, -1, 0)),
+                    dtype=int),
+            Feature('@structure', ['Support_Level', 'Resistance_Level', '@lookahead']),
+
+            # LabelingFeature.compute_momentum_features
+            Feature('ROC', ['close', '@structure'], lambda c: (S(c).pct_change(periods=window) * 100).to_numpy(),
+                    warmup=window),
+            # An unwarmed rank compares as neither bound, so these rows are 0 rather than nan and stay in
+            Feature('Momentum_Confirm', ['timestamp', 'ROC'], momentum_confirm, warmup=window - 1, dtype=int,
+                    cacheable=True),
+            Feature('@momentum', ['ROC', '@structure']),
+
+            # LabelingFeature.compute_lorentzian_distance
+            Feature('Lorentzian_Distance', config.LORENTZIAN_FEATURES + ['@momentum'], lorentzian),
+            Feature('@lorentzian', ['Lorentzian_Distance', '@momentum']),
+        ])
+
+    def plan(self, outputs: list) -> list:
+        """
+        Returns the features `outputs` depend on, in dependency order.
+        """
+        order, seen = [], set(self.BASE_COLUMNS)
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dependency in self.features[name].inputs:
+                visit(dependency)
+            order.append(self.features[name])
+
+        for name in outputs:
+            visit(name)
+        return order
+
+    def _valid_from(self, outputs: list = None) -> dict:
+        """
+        First row of a gap-free window at which each planned node is warmed
+        up, derived from the declared warmups.
+        """
+        valid_from = dict.fromkeys(self.BASE_COLUMNS, 0)
+        for feature in self.plan(outputs or self.MODEL_OUTPUTS):
+            start = max(valid_from[name] for name in feature.inputs)
+            valid_from[feature.name] = start if feature.is_trim else start + feature.warmup
+        return valid_from
+
+    def warmup_rows(self, outputs: list = None) -> int:
+        """
+        Number of leading candles before every output is warmed up. Features
+        that are not nan while warming up (Momentum_Confirm) keep their rows,
+        so this can exceed trimmed_rows.
+        """
+        return max(self._valid_from(outputs).values())
+
+    def trimmed_rows(self, outputs: list = None) -> int:
+        """
+        Number of leading candles the trims drop from a gap-free window before
+        the first row of output.
+        """
+        valid_from = self._valid_from(outputs)
+        return max((valid_from[name] for name in valid_from if name.startswith('@')), default=0)
+
+    def compute(self, df: pd.DataFrame, outputs: list = None, caches: dict = None, timer=None) -> pd.DataFrame:
+        """
+        Evaluates `outputs` (default: what labeling and the model need) over an
+        OHLCV window. Columns already present in `df` (e.g. indicators filled
+        by IndicatorState) are used as they are. Returns the rows kept by the
+        deepest trim, with the base columns, the requested features and the
+        original index. `timer(stage_name)`, e.g. partial(stage, label), is
+        entered around the features of each of STAGES that has any to compute;
+        the plan runs them one stage after another.
+        """
+        outputs = outputs or self.MODEL_OUTPUTS
+        caches = caches or {}
+        logger.info("Computing feature graph...")
+
+        n = len(df)
+        arrays = {name: df[name].to_numpy() for name in self.BASE_COLUMNS}
+        scope_of = dict.fromkeys(self.BASE_COLUMNS)
+        rows = {None: slice(0, n)}
+        depth = {None: 0}
+        timed = ExitStack()
+        timed_stage = None
+
+        with timed:
+            for feature in self.plan(outputs):
+                scope = max((name if name.startswith('@') else scope_of[name] for name in feature.inputs),
+                            key=depth.get)
+                scope_rows = rows[scope]
+                stage_name = self.STAGES.get(scope, 'labeling_features')
+                if timed_stage is not None and timed_stage != stage_name:
+                    timed.close()
+                    timed_stage = None
+
+                if feature.is_trim:
+                    valid = np.ones(len(arrays['timestamp'][scope_rows]), dtype=bool)
+                    for name in feature.data_inputs:
+                        valid &= pd.notna(arrays[name][scope_rows])
+                    rows[feature.name] = self._restrict(scope_rows, valid, n)
+                    depth[feature.name] = depth[scope] + 1
+                    continue
+
+                scope_of[feature.name] = scope
+                if feature.name in df.columns:
+                    arrays[feature.name] = df[feature.name].to_numpy()
+                    continue
+
+                if timer is not None and timed_stage is None:
+                    timed.enter_context(timer(stage_name))
+                    timed_stage = stage_name
+                args = [arrays[name][scope_rows] for name in feature.data_inputs]
+                kwargs = {'cache': caches.get(feature.name)} if feature.cacheable else {}
+                out = self._allocate(n, feature.dtype)
+                out[scope_rows] = feature.compute(*args, **kwargs)
+                arrays[feature.name] = out
+
+            final_rows = rows[max(rows, key=depth.get)]
+            columns = self.BASE_COLUMNS + [name for name in outputs if not name.startswith('@')]
+            return pd.DataFrame({name: arrays[name][final_rows] for name in columns}, index=df.index[final_rows])
+
+
+    @staticmethod
+    def _restrict(scope_rows, valid: np.ndarray, n: int):
+        """
+        Narrows a scope to its valid rows. Stays a slice (so inputs are views)
+        while the trim only cuts leading rows, which is the gap-free case.
+        """
+        if isinstance(scope_rows, slice):
+            first = int(np.argmax(valid)) if valid.any() else len(valid)
+            if valid[first:].all():
+                return slice(scope_rows.start + first, n)
+            scope_rows = np.arange(scope_rows.start, n)
+        return scope_rows[valid]
+
+    @staticmethod
+    def _allocate(n: int, dtype) -> np.ndarray:
+        if dtype is float:
+            return np.full(n, np.nan)
+        if dtype is object:
+            return np.empty(n, dtype=object)
+        return np.zeros(n, dtype=dtype)
+
+# ---------- WARMUP ----------
+class WarmupCalculator:
+    """
+    Derives how many candles a fetch has to return for the model to see
+    window_size_AI + 1 fully warmed-up rows: the rows until every feature is
+    warmed up (the trims and the Momentum_Confirm rank), plus enough history
+    for every EMA to forget its seed (weight below EMA_CONVERGENCE_TOL), plus
+    the still-open candle the fetch discards.
+    The derived window is opt-in (LIMIT=None). label_candles takes the
+    Lorentzian threshold over the whole window and the EMA seeds are only
+    forgotten to the tolerance, so a few predictions differ from the default
+    1001-candle window (1 in 400 on BTC_1h).
+    """
+    @staticmethod
+    def ema_convergence_bars(span: int, tol: float) -> int:
+        """
+        Bars until the seed's weight (1 - alpha)^n in an adjust=False EMA falls below tol.
+        """
+        alpha = 2 / (span + 1)
+        return math.ceil(math.log(tol) / math.log(1 - alpha))
+
+    @staticmethod
+    def required_limit(config: StrategyConfig) -> int:
+        graph = FeatureGraph.for_config(config)
+        tol = config.EMA_CONVERGENCE_TOL
+        bars = WarmupCalculator.ema_convergence_bars
+
+        # First row the model trains on, counted from the oldest fetched candle
+        first_row = max(
+            graph.warmup_rows(),
+            # EMA_LONG is seeded on the first row the indicator trim keeps
+            graph.trimmed_rows(['@indicators']) + bars(config.EMA_LONG, tol),
+            bars(config.EMA_PERIOD, tol),
+            bars(config.WT_CHANNEL_LENGTH, tol) + bars(config.WT_ATR_LENGTH, tol)
+        )
+        return first_row + config.window_size_AI + 1 + 1
+
+    @staticmethod
+    def resolve_limit(config: StrategyConfig) -> int:
+        """
+        Fills in config.LIMIT when unset and warns when a fixed LIMIT is too
+        short for the configured windows.
+        """
+        required = WarmupCalculator.required_limit(config)
+        if config.LIMIT is None:
+            config.LIMIT = required
+            logger.info(f"[{config.SYMBOL} {config.TIMEFRAME}] Fetch window derived from warmup: {required} candles.")
+        elif config.LIMIT < required:
+            logger.warning(
+                f"[{config.SYMBOL} {config.TIMEFRAME}] LIMIT={config.LIMIT} is shorter than the {required} candles "
+                f"the pipeline needs; indicators will not be warmed up or the model will skip training."
+            )
+        return config.LIMIT
+
 # ---------- CANDLE LABELING ----------
 class CandelLabeling:
     @staticmethod
     def label_candles(df: pd.DataFrame, config: StrategyConfig) -> pd.DataFrame:
         logger.info("Applying candle labeling...")
-        df['Candle_Label'] = 0
+        df['Candle_Label'] = CandelLabeling.base_labels(df)
+        df['Candle_Label'] = CandelLabeling.apply_outliers(
+            df['Candle_Label'].to_numpy(),
+            df['Lorentzian_Distance'].to_numpy(),
+            df['Breakout_Confirm'].to_numpy(),
+            CandelLabeling.low_confidence(df),
+            df['Lorentzian_Distance'].quantile(0.80)
+        )
+        return df
+
+    @staticmethod
+    def base_labels(df: pd.DataFrame) -> pd.Series:
+        """
+        Conditions 1-4. Each row is labeled from its own columns only, so these
+        can be computed once over a whole series.
+        """
+        df = df.assign(Candle_Label=0)
 
         # Condition 1
         df.loc[
@@ -462,35 +1851,660 @@ class CandelLabeling:
             'Candle_Label'
         ] = -1
 
+        return df['Candle_Label']
+
+    @staticmethod
+    def low_confidence(df: pd.DataFrame) -> np.ndarray:
+        return ((df['Momentum_Confirm'].abs() < 0.5) | (df['ADX'] < 20)).to_numpy()
+
+    @staticmethod
+    def apply_outliers(labels: np.ndarray, lorentzian: np.ndarray, breakout: np.ndarray,
+                       low_conf: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        Condition 5 and the low-confidence override on top of base_labels.
+        `threshold` is the 80th percentile of the Lorentzian distance over the
+        labeled window, the only part of labeling that depends on the window.
+        """
+        labels = labels.copy()
+
         # Condition 5: Lorentzian outliers
-        extreme_dist = df['Lorentzian_Distance'] > df['Lorentzian_Distance'].quantile(0.80)
-        df.loc[extreme_dist & (df['Breakout_Confirm'] == 1), 'Candle_Label'] = 1
-        df.loc[extreme_dist & (df['Breakout_Confirm'] == -1), 'Candle_Label'] = -1
+        extreme_dist = lorentzian > threshold
+        labels[extreme_dist & (breakout == 1)] = 1
+        labels[extreme_dist & (breakout == -1)] = -1
 
         # Meta: if confidence is low => 0
-        low_conf = (df['Momentum_Confirm'].abs() < 0.5) | (df['ADX'] < 20)
-        df.loc[low_conf, 'Candle_Label'] = 0
+        labels[low_conf] = 0
 
-        return df
+        return labels
 
-# ---------- AI MODEL ----------
+# ---------- NEIGHBOR INDEXES ----------
+def lorentzian_metric(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    sum(log(1 + |a - b|)), the distance compute_lorentzian_distance measures
+    between consecutive candles, as a point-to-point metric.
+    """
+    return float(np.log1p(np.abs(a - b)).sum())
+
+def pairwise_distances(Q: np.ndarray, X: np.ndarray, metric: str = 'euclidean') -> np.ndarray:
+    """
+    (len(Q) x len(X)) distances, accumulated one feature at a time. Euclidean
+    stays squared (same ordering, no sqrt) and uses exact differences rather
+    than the |a|^2 + |b|^2 - 2ab shortcut, so near-ties order the same way as
+    sklearn's tree search.
+    """
+    distances = np.zeros((len(Q), len(X)))
+    for j in range(Q.shape[1]):
+        diff = Q[:, j, None] - X[None, :, j]
+        if metric == 'lorentzian':
+            distances += np.log1p(np.abs(diff))
+        else:
+            distances += diff * diff
+    return distances
+
+class BruteIndex:
+    """
+    Exact search. Queries are processed in blocks so the distance matrix stays
+    around BLOCK_CELLS entries however large the window gets.
+    """
+    BLOCK_CELLS = 1 << 22
+
+    def __init__(self, metric: str = 'euclidean'):
+        self.metric = metric
+
+    def fit(self, X: np.ndarray):
+        self._X = X
+        return self
+
+    def query(self, Q: np.ndarray, k: int) -> np.ndarray:
+        block = max(1, self.BLOCK_CELLS // len(self._X))
+        return np.concatenate([
+            BruteIndex.nearest(pairwise_distances(Q[start:start + block], self._X, self.metric), k)
+            for start in range(0, len(Q), block)
+        ])
+
+    @staticmethod
+    def nearest(distances: np.ndarray, k: int) -> np.ndarray:
+        """
+        Column indices of the k smallest entries of every row, in column order;
+        ties at the k-th distance go to the earlier column.
+        """
+        kth = np.partition(distances, k - 1, axis=1)[:, k - 1, None]
+        closer = distances < kth
+        tied = distances == kth
+        needed = k - closer.sum(axis=1, keepdims=True)
+        chosen = closer | (tied & (np.cumsum(tied, axis=1) <= needed))
+        return np.nonzero(chosen)[1].reshape(len(distances), k)
+
+class TreeIndex:
+    """
+    sklearn KDTree for Euclidean distance, BallTree for Lorentzian (a Python
+    callable metric, so far slower). The scaler moves every candle, which
+    moves every point, so the tree is rebuilt on each fit; the O(n log n)
+    build is small next to querying every training row for the smoothing
+    features.
+    """
+    LEAF_SIZE = 40
+
+    def __init__(self, metric: str = 'euclidean'):
+        self.metric = metric
+
+    def fit(self, X: np.ndarray):
+        if self.metric == 'lorentzian':
+            self._tree = BallTree(X, leaf_size=self.LEAF_SIZE, metric=lorentzian_metric)
+        else:
+            self._tree = KDTree(X, leaf_size=self.LEAF_SIZE)
+        return self
+
+    def query(self, Q: np.ndarray, k: int) -> np.ndarray:
+        return self._tree.query(Q, k=k, return_distance=False)
+
+class IVFIndex:
+    """
+    Approximate search: rows are bucketed around about sqrt(n) k-means
+    centroids, and each query scans only the buckets of its n_probe nearest
+    centroids. n_probe defaults to PROBE_FRACTION of the buckets (at least
+    MIN_PROBES), which keeps recall@10 around 0.97-0.99 on scaled pipeline
+    features for either metric; a fixed probe count loses recall as the
+    number of buckets grows. Centroids are trained on a sample, and Euclidean
+    distances use the |a|^2 + |b|^2 - 2ab BLAS form; both are fine since the
+    result is approximate anyway.
+    """
+    PROBE_FRACTION = 0.1
+    MIN_PROBES = 4
+    KMEANS_ITERATIONS = 8
+    KMEANS_SAMPLE_PER_LIST = 64
+
+    def __init__(self, metric: str = 'euclidean', seed: int = 0, n_probe: int = None):
+        self.metric = metric
+        self.seed = seed
+        self.n_probe = n_probe
+
+    def fit(self, X: np.ndarray):
+        self._X = X
+        self._sq_norms = (X ** 2).sum(axis=1)
+        n = len(X)
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+        sample = X[rng.choice(n, min(n, n_lists * self.KMEANS_SAMPLE_PER_LIST), replace=False)]
+        centroids = sample[:n_lists].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            assign = self._closest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        assign = self._closest(X, centroids)
+        self._centroids = centroids
+        self._buckets = [np.flatnonzero(assign == c) for c in range(n_lists)]
+        probes = self.n_probe or max(self.MIN_PROBES, math.ceil(self.PROBE_FRACTION * n_lists))
+        self.n_probe_ = min(probes, n_lists)
+        return self
+
+    def _distances(self, Q: np.ndarray, X: np.ndarray, X_sq_norms: np.ndarray = None) -> np.ndarray:
+        if self.metric == 'lorentzian':
+            return pairwise_distances(Q, X, self.metric)
+        if X_sq_norms is None:
+            X_sq_norms = (X ** 2).sum(axis=1)
+        return (Q ** 2).sum(axis=1)[:, None] + X_sq_norms[None, :] - 2 * Q @ X.T
+
+    def _closest(self, X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        block = max(1, BruteIndex.BLOCK_CELLS // len(centroids))
+        return np.concatenate([
+            np.argmin(self._distances(X[start:start + block], centroids), axis=1)
+            for start in range(0, len(X), block)
+        ])
+
+    def query(self, Q: np.ndarray, k: int) -> np.ndarray:
+        probes = BruteIndex.nearest(self._distances(Q, self._centroids), self.n_probe_)
+        result = np.empty((len(Q), k), dtype=int)
+        for i, lists in enumerate(probes):
+            candidates = np.sort(np.concatenate([self._buckets[c] for c in lists]))
+            if len(candidates) < k:
+                candidates = np.arange(len(self._X))
+            distances = self._distances(Q[i:i + 1], self._X[candidates], self._sq_norms[candidates])
+            result[i] = candidates[BruteIndex.nearest(distances, k)]
+        return result
+
+# ---------- NUMPY MODEL ----------
+class NumpyScaler:
+    """
+    StandardScaler without sklearn's input validation.
+    """
+    def fit_transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=float)
+        self.mean_ = X.mean(axis=0)
+        var = X.var(axis=0)
+        self.scale_ = np.sqrt(var)
+        # Constant features keep scale 1, like StandardScaler
+        self.scale_[var < 10 * np.finfo(float).eps * np.maximum(self.mean_ ** 2, 1)] = 1.0
+        return self.transform(X)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+class NumpyKNN:
+    """
+    Uniformly weighted KNeighborsClassifier over a pluggable neighbor index:
+    'brute' (exact), 'tree' (sklearn KD/ball tree, exact), 'approx' (IVF) or
+    'auto', which picks by window size and feature count. `metric` is
+    'euclidean' or 'lorentzian'.
+    """
+    BRUTE_MAX_ROWS = 4096
+    TREE_MAX_FEATURES = 16
+    INDEXES = {'brute': BruteIndex, 'tree': TreeIndex, 'approx': IVFIndex}
+
+    def __init__(self, n_neighbors: int = 5, algorithm: str = 'auto', metric: str = 'euclidean'):
+        self.n_neighbors = n_neighbors
+        self.algorithm = algorithm
+        self.metric = metric
+
+    def set_params(self, n_neighbors: int):
+        self.n_neighbors = n_neighbors
+        return self
+
+    def select_algorithm(self, n_samples: int, n_features: int) -> str:
+        if self.algorithm != 'auto':
+            return self.algorithm
+        if n_samples <= self.BRUTE_MAX_ROWS:
+            return 'brute'
+        if self.metric == 'euclidean' and n_features <= self.TREE_MAX_FEATURES:
+            return 'tree'
+        return 'approx'
+
+    def fit(self, X: np.ndarray, y: np.ndarray):
+        X = np.asarray(X, dtype=float)
+        self.classes_, self._y = np.unique(y, return_inverse=True)
+        if self.n_neighbors > len(X):
+            raise ValueError(f"Expected n_neighbors <= n_samples, but n_samples = {len(X)}, "
+                             f"n_neighbors = {self.n_neighbors}")
+        algorithm = self.select_algorithm(*X.shape)
+        if algorithm == 'approx' and self.algorithm == 'auto' and getattr(self, 'algorithm_', None) != 'approx':
+            logger.info(f"KNN 'auto' switched to the approximate IVF index for {X.shape[0]} rows x {X.shape[1]} features.")
+        self.algorithm_ = algorithm
+        self._index = self.INDEXES[self.algorithm_](self.metric).fit(X)
+        return self
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        nearest = self._index.query(np.asarray(X, dtype=float), self.n_neighbors)
+        return NumpyKNN.vote(nearest, self._y, len(self.classes_))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    @staticmethod
+    def vote(nearest: np.ndarray, labels: np.ndarray, n_classes: int) -> np.ndarray:
+        """
+        Class shares among the neighbors of each query. `nearest` holds
+        (queries x k) training row indices, `labels` class indices.
+        """
+        return np.eye(n_classes)[labels[nearest]].sum(axis=1) / nearest.shape[1]
+
+class NumpyLogistic:
+    """
+    L2-regularised LogisticRegression (multinomial for three or more classes,
+    binary otherwise, unpenalised intercept) solved with Newton steps and a
+    backtracking line search. It minimises the same objective as sklearn's
+    lbfgs default, to a tighter tolerance. With warm_start, the previous
+    solution seeds the next fit whenever the class set is unchanged.
+    """
+    def __init__(self, C: float = 1.0, max_iter: int = 100, tol: float = 1e-10, warm_start: bool = False):
+        self.C = C
+        self.max_iter = max_iter
+        self.tol = tol
+        self.warm_start = warm_start
+        self.classes_ = None
+        self._W = None
+
+    def fit(self, X: np.ndarray, y: np.ndarray):
+        X = np.asarray(X, dtype=float)
+        classes, y_idx = np.unique(y, return_inverse=True)
+        if len(classes) < 2:
+            raise ValueError(f"This solver needs samples of at least 2 classes in the data, but the data contains "
+                             f"only one class: {classes[0]}")
+
+        Xb = np.concatenate([X, np.ones((len(X), 1))], axis=1)
+        reg = np.full(Xb.shape[1], 1.0 / self.C)
+        reg[-1] = 0.0  # intercept is not penalised
+
+        rows = 1 if len(classes) == 2 else len(classes)
+        if self.warm_start and self._W is not None and np.array_equal(classes, self.classes_) \
+                and self._W.shape == (rows, Xb.shape[1]):
+            W = self._W
+        else:
+            W = np.zeros((rows, Xb.shape[1]))
+
+        if rows == 1:
+            Y = (y_idx == 1).astype(float)[:, None]
+        else:
+            Y = np.eye(rows)[y_idx]
+        W = self._newton(Xb, Y, W, reg)
+
+        self.classes_ = classes
+        self._W = W
+        self.coef_ = W[:, :-1]
+        self.intercept_ = W[:, -1]
+        return self
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=float) @ self.coef_.T + self.intercept_
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        scores = self.decision_function(X)
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    @staticmethod
+    def _loss_grad_hess(Xb: np.ndarray, Y: np.ndarray, W: np.ndarray, reg: np.ndarray, hessian: bool = True):
+        Z = Xb @ W.T
+        penalty = 0.5 * (reg * W ** 2).sum()
+        if W.shape[0] == 1:
+            z = Z[:, 0]
+            loss = (np.logaddexp(0, z) - Y[:, 0] * z).sum() + penalty
+            if not hessian:
+                return loss
+            p = 1 / (1 + np.exp(-z))
+            grad = ((p - Y[:, 0]) @ Xb + reg * W[0])[None, :]
+            H = (Xb * (p * (1 - p))[:, None]).T @ Xb + np.diag(reg)
+            return loss, grad, H
+
+        log_norm = np.logaddexp.reduce(Z, axis=1, keepdims=True)
+        loss = -(Y * (Z - log_norm)).sum() + penalty
+        if not hessian:
+            return loss
+        P = np.exp(Z - log_norm)
+        K, d = W.shape
+        grad = (P - Y).T @ Xb + reg * W
+        S = P[:, :, None] * (np.eye(K)[None, :, :] - P[:, None, :])
+        H = np.tensordot(Xb, S[:, :, :, None] * Xb[:, None, None, :], axes=(0, 0))  # (d, K, K, d)
+        H = H.transpose(1, 0, 2, 3).reshape(K * d, K * d) + np.diag(np.tile(reg, K))
+        # Shifting every intercept by the same amount changes nothing, so H is singular
+        # along that direction. The gradient has no component there either, so adding
+        # it back with unit curvature gives the minimum-norm Newton step.
+        shift = np.zeros((K, d))
+        shift[:, -1] = 1 / np.sqrt(K)
+        H += np.outer(shift.ravel(), shift.ravel())
+        return loss, grad, H
+
+    def _newton(self, Xb: np.ndarray, Y: np.ndarray, W: np.ndarray, reg: np.ndarray) -> np.ndarray:
+        for _ in range(self.max_iter):
+            loss, grad, H = self._loss_grad_hess(Xb, Y, W, reg)
+            step = np.linalg.solve(H, grad.ravel()).reshape(W.shape)
+            slope = (grad * step).sum()
+            # Newton decrement: the loss is within slope / 2 of the optimum. Take the last
+            # step unchecked, the line search cannot see decreases below float resolution.
+            if slope / 2 <= self.tol:
+                return W - step
+            t = 1.0
+            while t > 1e-10:
+                candidate = W - t * step
+                if self._loss_grad_hess(Xb, Y, candidate, reg, hessian=False) <= loss - 1e-4 * t * slope:
+                    break
+                t *= 0.5
+            W = candidate
+        return W
+
+# ---------- INCREMENTAL AI MODEL ----------
+class RunningScaler:
+    """
+    StandardScaler over the rows of a ring buffer. Mean and M2 slide with a
+    one-in/one-out Welford update and are recomputed every `capacity` pushes
+    so rounding does not accumulate.
+    """
+    def __init__(self, capacity: int, n_features: int):
+        self.capacity = capacity
+        self.rows = np.zeros((capacity, n_features))
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.pushes = 0
+        self.mean_ = np.zeros(self.rows.shape[1])
+        self.m2 = np.zeros(self.rows.shape[1])
+
+    def push(self, slot: int, x: np.ndarray):
+        """
+        Writes `x` to `slot`, evicting the row stored there once the buffer is full.
+        """
+        if self.count < self.capacity:
+            self.rows[slot] = x
+            self.count += 1
+            delta = x - self.mean_
+            self.mean_ = self.mean_ + delta / self.count
+            self.m2 = self.m2 + delta * (x - self.mean_)
+        else:
+            old = self.rows[slot].copy()
+            self.rows[slot] = x
+            old_mean = self.mean_
+            self.mean_ = old_mean + (x - old) / self.count
+            self.m2 = self.m2 + (x - old) * (x - self.mean_ + old - old_mean)
+
+        self.pushes += 1
+        if self.pushes % self.capacity == 0:
+            rows = self.rows[:self.count]
+            self.mean_ = rows.mean(axis=0)
+            self.m2 = ((rows - self.mean_) ** 2).sum(axis=0)
+
+    @property
+    def scale_(self) -> np.ndarray:
+        var = np.maximum(self.m2 / self.count, 0)
+        scale = np.sqrt(var)
+        # Same handling of constant features as StandardScaler
+        scale[var < 10 * np.finfo(float).eps * np.maximum(self.mean_ ** 2, 1)] = 1.0
+        return scale
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (X - self.mean_) / self.scale_
+
+class SlidingKNN:
+    """
+    Brute-force KNN training set kept as a tensor of per-feature squared
+    differences between every pair of ring slots. A push rewrites one row and
+    one column, so rescaling (the scaler moves every candle) only costs a
+    weighted sum over the tensor instead of rebuilding it.
+    """
+    MAX_CAPACITY = 1024  # the tensor is capacity^2 * n_features floats
+
+    def __init__(self, capacity: int, n_features: int):
+        self.capacity = capacity
+        self.sq_diff = np.zeros((capacity, capacity, n_features))
+
+    def push(self, slot: int, rows: np.ndarray):
+        """
+        Updates the pair differences of `slot` after rows[slot] was replaced.
+        """
+        diff = (rows - rows[slot]) ** 2
+        self.sq_diff[slot] = diff
+        self.sq_diff[:, slot] = diff
+
+    def predict_proba(self, distances: np.ndarray, labels: np.ndarray, classes: np.ndarray, k: int) -> np.ndarray:
+        """
+        Class shares among the k nearest training rows of each query. `distances`
+        is (queries x training rows); ties go to the older row.
+        """
+        nearest = BruteIndex.nearest(distances, min(k, distances.shape[1]))
+        return NumpyKNN.vote(nearest, np.searchsorted(classes, labels), len(classes))
+
+class IncrementalModel:
+    """
+    Sliding-window version of AIModel's scaler -> KNN -> logistic smoothing.
+    Each candle pushes the newest training row and evicts the oldest instead
+    of refitting from scratch; the logistic smoother is warm-started from the
+    previous candle's coefficients. Labels are re-read every candle, since the
+    Lorentzian threshold in label_candles moves with the window.
+    """
+    INPUT_RTOL = 1e-9
+
+    def __init__(self, config: StrategyConfig, features: list):
+        self.config = config
+        self.capacity = config.window_size_AI
+        self.scaler = RunningScaler(self.capacity, len(features))
+        self.knn = SlidingKNN(self.capacity, len(features))
+        self.smoothers = {}  # class set -> warm-started LogisticRegression
+        self.timestamps = deque(maxlen=self.capacity)
+        self.next_slot = 0
+
+    def reset(self):
+        self.scaler.reset()
+        self.timestamps.clear()
+        self.next_slot = 0
+
+    def __getstate__(self) -> dict:
+        # The pair tensor is capacity^2 * n_features floats; rebuild it from the rows instead
+        state = self.__dict__.copy()
+        state["knn"] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        rows = self.scaler.rows
+        self.knn = SlidingKNN(self.capacity, rows.shape[1])
+        self.knn.sq_diff[:] = (rows[:, None, :] - rows[None, :, :]) ** 2
+
+    def _push(self, ts, x: np.ndarray):
+        slot = self.next_slot
+        self.scaler.push(slot, x)
+        self.knn.push(slot, self.scaler.rows)
+        self.timestamps.append(ts)
+        self.next_slot = (slot + 1) % self.capacity
+
+    def _sync(self, timestamps: np.ndarray, X: np.ndarray):
+        """
+        Brings the ring in line with the training window: one push when it
+        slid by a candle, a full reload when it jumped or the stored rows
+        no longer match.
+        """
+        if len(self.timestamps) == self.capacity and self.timestamps[-1] == timestamps[-2] \
+                and self.timestamps[1] == timestamps[0]:
+            if np.allclose(self._chronological(self.scaler.rows)[1:], X[:-1], rtol=self.INPUT_RTOL, atol=0):
+                self._push(timestamps[-1], X[-1])
+                return
+        elif len(self.timestamps) == self.capacity and self.timestamps[-1] == timestamps[-1]:
+            if np.allclose(self._chronological(self.scaler.rows), X, rtol=self.INPUT_RTOL, atol=0):
+                return
+
+        self.reset()
+        for ts, x in zip(timestamps, X):
+            self._push(ts, x)
+
+    def _order(self) -> np.ndarray:
+        # Ring slots from oldest to newest
+        return (self.next_slot + np.arange(self.capacity)) % self.capacity
+
+    def _chronological(self, rows: np.ndarray) -> np.ndarray:
+        return rows[self._order()]
+
+    def fit_predict(self, timestamps: np.ndarray, X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, k: int):
+        self._sync(timestamps, np.asarray(X_train, dtype=float))
+        X_test = np.asarray(X_test, dtype=float)
+
+        order = self._order()
+        classes = np.unique(y_train)
+        inv_var = 1.0 / self.scaler.scale_ ** 2
+
+        X_train_scaled = self.scaler.transform(self.scaler.rows[order])
+        X_test_scaled = self.scaler.transform(X_test)
+
+        train_dist = (self.knn.sq_diff @ inv_var)[np.ix_(order, order)]
+        test_dist = ((self.scaler.rows[order] - X_test) ** 2) @ inv_var
+        knn_proba_test = self.knn.predict_proba(test_dist[None, :], y_train, classes, k)
+
+        if not self.config.use_logistic_smoothing or len(classes) < 2:
+            return classes[np.argmax(knn_proba_test[0])]
+
+        knn_proba_train = self.knn.predict_proba(train_dist, y_train, classes, k)
+        key = tuple(classes)
+        if key not in self.smoothers:
+            if self.config.use_numpy_model:
+                self.smoothers[key] = NumpyLogistic(warm_start=True)
+            else:
+                self.smoothers[key] = LogisticRegression(random_state=self.config.random_state, warm_start=True)
+        lr = self.smoothers[key]
+        lr.fit(np.concatenate([X_train_scaled, knn_proba_train], axis=1), y_train)
+        return lr.predict(np.concatenate([X_test_scaled, knn_proba_test], axis=1))[0]
+
+class WalkForwardKNN:
+    """
+    NumpyKNN (brute force, Euclidean) refit at every step of a walk-forward,
+    finding the same neighbors without recomputing the window's distances.
+    The per-feature squared differences live in a SlidingKNN tensor, so a
+    step adds one row and reweights by the new scale. Where that shortcut
+    leaves the k-th neighbor within rounding of the next one, the row is
+    redone with the exact scaled distances, so votes match NumpyKNN's.
+    """
+    TIE_RTOL = 1e-9
+
+    def __init__(self, X: np.ndarray, window: int):
+        self.X = X
+        self.window = window
+        self.knn = SlidingKNN(window, X.shape[1])
+        self.rows = np.zeros((window, X.shape[1]))
+        self.step = None  # the ring holds rows step - window .. step - 1
+        self.next_slot = 0
+
+    def _slide(self, t: int):
+        if self.step == t - 1:
+            slot = self.next_slot
+            self.rows[slot] = self.X[t - 1]
+            self.knn.push(slot, self.rows)
+            self.next_slot = (slot + 1) % self.window
+        elif self.step != t:
+            self.rows[:] = self.X[t - self.window:t]
+            self.knn.sq_diff[:] = (self.rows[:, None, :] - self.rows[None, :, :]) ** 2
+            self.next_slot = 0
+        self.step = t
+
+    def predict_proba(self, t: int, scale: np.ndarray, X_train_scaled: np.ndarray, X_test_scaled: np.ndarray,
+                      y_train: np.ndarray, k: int, train: bool = True) -> tuple:
+        """
+        KNN class shares of the training rows (only with `train`) and the test
+        row of step `t`, given the scale NumpyScaler fitted on the window.
+        Returns (classes, train proba or None, test proba).
+        """
+        self._slide(t)
+        order = (self.next_slot + np.arange(self.window)) % self.window  # slot of each training row
+        classes, y_idx = np.unique(y_train, return_inverse=True)
+        one_hot = np.zeros((self.window, len(classes)))
+        one_hot[order, y_idx] = 1
+
+        inv_var = 1.0 / scale ** 2
+        # Queries are the training rows in chronological order and the test row,
+        # their neighbors are numbered by ring slot
+        fast = (((self.rows - self.X[t]) ** 2) @ inv_var)[None, :]
+        queries = X_test_scaled
+        if train:
+            fast = np.concatenate([(self.knn.sq_diff @ inv_var)[order], fast])
+            queries = np.concatenate([X_train_scaled, X_test_scaled])
+
+        if k < self.window:
+            part = np.partition(fast, k, axis=1)
+            kth = part[:, :k].max(axis=1)
+            chosen = fast <= kth[:, None]
+            unsure = np.flatnonzero(part[:, k] - kth <= self.TIE_RTOL * (1 + part[:, k]))
+        else:
+            chosen = np.ones(fast.shape, dtype=bool)
+            unsure = []
+
+        for i in unsure:
+            nearest = BruteIndex.nearest(pairwise_distances(queries[i:i + 1], X_train_scaled), k)[0]
+            chosen[i] = False
+            chosen[i, order[nearest]] = True
+
+        proba = (chosen @ one_hot) / k
+        return classes, (proba[:-1] if train else None), proba[-1:]
+
+# ---------- AI MODEL ----------
 class AIModel:
-    def __init__(self, config: StrategyConfig):
+    FEATURES = ['close', 'volume', 'RSI', 'CCI', 'EMA', 'SMA', 'ATR', 'ADX', 'WT', 'ROC', 'Lorentzian_Distance']
+
+    def __init__(self, config: StrategyConfig, connect_db: bool = True):
         self.config = config
-        self.client = MongoClient(self.config.mongo_uri)
-        self.db = self.client[self.config.db_name]
-        self.collection = self.db[self.config.collection_name]
+        if connect_db:
+            self.client = MongoClient(self.config.mongo_uri)
+            self.db = self.client[self.config.db_name]
+            self.collection = self.db[self.config.collection_name]
 
         self.use_logistic_smoothing = self.config.use_logistic_smoothing
 
-        self.knn = KNeighborsClassifier()
-        self.lr = LogisticRegression(random_state=self.config.random_state)
-        self.scaler = StandardScaler()
+        if self.config.use_numpy_model:
+            self.knn = NumpyKNN(algorithm=self.config.KNN_BACKEND, metric=self.config.KNN_METRIC)
+            # Warm start only changes where Newton starts, not the optimum it converges to
+            self.lr = NumpyLogistic(warm_start=True)
+            self.scaler = NumpyScaler()
+        else:
+            metric = lorentzian_metric if self.config.KNN_METRIC == 'lorentzian' else 'minkowski'
+            self.knn = KNeighborsClassifier(metric=metric)
+            self.lr = LogisticRegression(random_state=self.config.random_state)
+            self.scaler = StandardScaler()
+
+        self.incremental = None
+        if config.use_incremental_model:
+            if config.KNN_METRIC != 'euclidean' or config.window_size_AI > SlidingKNN.MAX_CAPACITY:
+                logger.warning(f"[{config.SYMBOL} {config.TIMEFRAME}] Incremental model needs the euclidean metric "
+                               f"and window_size_AI <= {SlidingKNN.MAX_CAPACITY}; refitting every candle instead.")
+            else:
+                self.incremental = IncrementalModel(config, self.FEATURES)
+
+    def state(self) -> dict:
+        """
+        What a restart needs to pick up where this model left off: the warm-start
+        smoother and, in incremental mode, the training ring.
+        """
+        return {"lr": self.lr, "incremental": self.incremental}
+
+    def load_state(self, state: dict):
+        if type(state["lr"]) is type(self.lr):
+            self.lr = state["lr"]
+        if self.incremental is not None and state["incremental"] is not None:
+            self.incremental = state["incremental"]
+            self.incremental.config = self.config
 
     def train_and_predict(self, df: pd.DataFrame) -> pd.DataFrame:
         logger.info("Training on the last window_size_AI candles & predicting the next candle...")
 
-        features = ['close', 'volume', 'RSI', 'CCI', 'EMA', 'SMA', 'ATR', 'ADX', 'WT', 'ROC', 'Lorentzian_Distance']
+        features = self.FEATURES
         needed_cols = features + ['Candle_Label', 'Lookahead_Period']
         
         df.dropna(subset=needed_cols, inplace=True)
@@ -505,45 +2519,267 @@ class AIModel:
         train_data = df.iloc[-(window_size+1):-1].copy()  
         test_data  = df.iloc[-1:].copy()   
 
+        # Dynamic k for KNN based on Lookahead_Period
+        k_neighbors = int(train_data['Lookahead_Period'].mean())
+        if k_neighbors < 1:
+            k_neighbors = 1
+
         X_train = train_data[features].values
         y_train = train_data['Candle_Label'].values
         X_test  = test_data[features].values
-        
+
+        if self.incremental is not None:
+            final_pred = self.incremental.fit_predict(train_data['timestamp'].to_numpy(), X_train, y_train,
+                                                      X_test, k_neighbors)
+            if self.config.verify_incremental_model:
+                batch_pred = self.fit_predict(X_train, y_train, X_test, k_neighbors)
+                if batch_pred != final_pred:
+                    logger.warning(f"[{self.config.SYMBOL} {self.config.TIMEFRAME}] Incremental model predicted "
+                                   f"{final_pred}, batch refit {batch_pred}.")
+        else:
+            final_pred = self.fit_predict(X_train, y_train, X_test, k_neighbors)
+
+        df['prediction'] = np.nan
+        df.loc[df.index[-1], 'prediction'] = final_pred
+        return df
+
+    def fit_predict(self, X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, k_neighbors: int):
+        """
+        Fits scaler, KNN and smoother on one training window and predicts the
+        first test row.
+        """
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled  = self.scaler.transform(X_test)
 
-        # Dynamic k for KNN based on Lookahead_Period
-        k_neighbors = int(train_data['Lookahead_Period'].mean())
-        if k_neighbors < 1:
-            k_neighbors = 1
         self.knn.set_params(n_neighbors=k_neighbors)
         self.knn.fit(X_train_scaled, y_train)
 
-        # Optional Logistic Smoothing
-        if self.use_logistic_smoothing:
+        # Optional Logistic Smoothing. It needs two classes; a window labeled with one
+        # (all neutral) predicts that class, as the KNN does.
+        if self.use_logistic_smoothing and len(self.knn.classes_) > 1:
             knn_proba_train = self.knn.predict_proba(X_train_scaled)
             X_train_smooth  = np.concatenate([X_train_scaled, knn_proba_train], axis=1)
             self.lr.fit(X_train_smooth, y_train)
 
             knn_proba_test = self.knn.predict_proba(X_test_scaled)
             X_test_smooth  = np.concatenate([X_test_scaled, knn_proba_test], axis=1)
-            final_pred = self.lr.predict(X_test_smooth)[0]
-        else:
-            final_pred = self.knn.predict(X_test_scaled)[0]
+            return self.lr.predict(X_test_smooth)[0]
+        return self.knn.predict(X_test_scaled)[0]
 
-        df['prediction'] = np.nan
-        df.loc[df.index[-1], 'prediction'] = final_pred
-        return df
+    WALK_FORWARD_CHUNK = 4096  # steps whose training labels are built at once
+
+    def walk_forward(self, df: pd.DataFrame, labeled: int = None, start: int = None, stop: int = None) -> np.ndarray:
+        """
+        The prediction the live loop would have made at every candle in
+        [start, stop) of a feature frame (FeatureGraph output), in one pass.
+        Each candle is taken as the latest of a window holding the `labeled`
+        rows up to it (default: what LIMIT keeps after the warmup trims), so
+        its labels use that window's Lorentzian threshold and the model trains
+        on the window_size_AI rows before it. Candles without a full window
+        stay NaN. Labels, k and windows come from sliding views instead of a
+        relabeled copy per candle; the incremental model slides as it does
+        live, and the NumPy brute-force KNN reuses its pair differences
+        between steps (WalkForwardKNN). The smoother is warm-started from step
+        to step like the live one, so predictions match step by step.
+        Features come from one pass over the whole series; they equal the
+        live window's once LIMIT covers the warmup (WarmupCalculator), as the
+        default and the derived LIMIT do.
+        """
+        config = self.config
+        window = config.window_size_AI
+        if labeled is None:
+            labeled = config.LIMIT - 1 - FeatureGraph.for_config(config).trimmed_rows()
+        predictions = np.full(len(df), np.nan)
+        start = max(window, labeled - 1, start or 0)
+        stop = len(df) if stop is None else min(stop, len(df))
+        if start >= stop:
+            return predictions
+
+        X = df[self.FEATURES].to_numpy(dtype=float)
+        timestamps = df['timestamp'].to_numpy()
+        base = CandelLabeling.base_labels(df).to_numpy()
+        lorentzian = df['Lorentzian_Distance'].to_numpy()
+        breakout = df['Breakout_Confirm'].to_numpy()
+        low_conf = CandelLabeling.low_confidence(df)
+        lookahead = df['Lookahead_Period'].to_numpy(dtype=float)
+        thresholds = df['Lorentzian_Distance'].rolling(labeled).quantile(0.80).to_numpy()
+
+        walker = None
+        if self.incremental is None and self.config.use_numpy_model and self.config.KNN_METRIC == 'euclidean' \
+                and self.knn.select_algorithm(window, X.shape[1]) == 'brute':
+            walker = WalkForwardKNN(X, window)
+
+        for chunk_start in range(start, stop, self.WALK_FORWARD_CHUNK):
+            steps = np.arange(chunk_start, min(chunk_start + self.WALK_FORWARD_CHUNK, stop))
+            # Row t trains on rows t - window .. t - 1
+            windows = lambda values: sliding_window_view(values, window)[steps - window]
+            y = CandelLabeling.apply_outliers(windows(base), windows(lorentzian), windows(breakout),
+                                              windows(low_conf), thresholds[steps, None])
+            k = np.maximum(windows(lookahead).mean(axis=1).astype(int), 1)
+
+            for t, y_train, k_neighbors in zip(steps, y, k):
+                train = slice(t - window, t)
+                if self.incremental is not None:
+                    predictions[t] = self.incremental.fit_predict(timestamps[train], X[train], y_train,
+                                                                  X[t:t + 1], k_neighbors)
+                elif walker is not None:
+                    predictions[t] = self._walk_forward_step(walker, t, X, y_train, k_neighbors)
+                else:
+                    predictions[t] = self.fit_predict(X[train], y_train, X[t:t + 1], k_neighbors)
+        return predictions
+
+    def _walk_forward_step(self, walker: WalkForwardKNN, t: int, X: np.ndarray, y_train: np.ndarray, k_neighbors: int):
+        window = self.config.window_size_AI
+        X_train_scaled = self.scaler.fit_transform(X[t - window:t])
+        X_test_scaled = self.scaler.transform(X[t:t + 1])
+        classes, knn_proba_train, knn_proba_test = walker.predict_proba(
+            t, self.scaler.scale_, X_train_scaled, X_test_scaled, y_train, k_neighbors,
+            train=self.use_logistic_smoothing)
+
+        if self.use_logistic_smoothing and len(classes) > 1:
+            self.lr.fit(np.concatenate([X_train_scaled, knn_proba_train], axis=1), y_train)
+            return self.lr.predict(np.concatenate([X_test_scaled, knn_proba_test], axis=1))[0]
+        return classes[np.argmax(knn_proba_test[0])]
+
+# ---------- BACKEND OUTBOX ----------
+class BackendOutbox:
+    """
+    Durable queue of trade notifications for the backend. An event is
+    committed to a local SQLite file before the trading loop moves on, and
+    delivered by one dispatcher thread per lane. The lane is the runner's
+    "SYMBOL TF" label, which also labels its metrics. There is one lane per
+    symbol, so a symbol's events arrive in order, and a slow close for one
+    symbol (the backend waits per subscriber) never holds up another. Requests share a pooled session and
+    carry an Idempotency-Key. Connection errors, timeouts, 408/429 and 5xx
+    are retried with backoff; other responses complete the event. Events
+    still pending at shutdown are delivered after the next start.
+    """
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 300    # close_trade sleeps 10s per subscriber before answering
+    MAX_BACKOFF = 300     # seconds between retries of a failing event
+    POOL_MAXSIZE = 16
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path: str = OUTBOX_PATH, base_url: str = None):
+        self.base_url = base_url or f"http://{backend_uri}:{backend_port}"
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_MAXSIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lane TEXT NOT NULL,
+                path TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            )""")
+        self._lanes = {}  # lane -> threading.Event that wakes its dispatcher
+        pending = self._db.execute("SELECT lane, COUNT(*) FROM outbox GROUP BY lane").fetchall()
+        for lane, count in pending:
+            logger.info(f"[{lane}] Resuming {count} undelivered backend notifications.")
+            self._wake(lane)
+
+    @classmethod
+    def get(cls) -> "BackendOutbox":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def enqueue(self, lane: str, path: str, payload: dict, idempotency_key: str):
+        """
+        Stores the event and returns; delivery happens on the lane's thread.
+        An event whose key is already stored is ignored.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO outbox (lane, path, payload, idempotency_key, created) VALUES (?, ?, ?, ?, ?)",
+                (lane, path, json.dumps(payload), idempotency_key, time.time())
+            )
+        self._wake(lane)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _wake(self, lane: str):
+        with self._lock:
+            event = self._lanes.get(lane)
+            if event is None:
+                event = self._lanes[lane] = threading.Event()
+                threading.Thread(target=self._dispatch, args=(lane, event),
+                                 name=f"outbox-{lane}", daemon=True).start()
+        event.set()
+
+    def _dispatch(self, lane: str, event: threading.Event):
+        while True:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT id, path, payload, idempotency_key, attempts FROM outbox WHERE lane = ? ORDER BY id LIMIT 1",
+                    (lane,)
+                ).fetchone()
+            if row is None:
+                event.wait()
+                event.clear()
+                continue
+
+            event_id, path, payload, key, attempts = row
+            if self._deliver(lane, path, json.loads(payload), key):
+                with self._lock:
+                    self._db.execute("DELETE FROM outbox WHERE id = ?", (event_id,))
+                continue
+
+            attempts += 1
+            Metrics.increment(lane, "notify_retries")
+            with self._lock:
+                self._db.execute("UPDATE outbox SET attempts = ? WHERE id = ?", (attempts, event_id))
+            delay = min(2 ** attempts, self.MAX_BACKOFF)
+            logger.warning(f"[{lane}] Backend {path} retry {attempts} in {delay}s.")
+            time.sleep(delay)
+
+    def _deliver(self, lane: str, path: str, payload: dict, key: str) -> bool:
+        """
+        Posts one event. Returns False when it should be retried.
+        """
+        try:
+            with stage(lane, "notify"):
+                response = self.session.post(
+                    self.base_url + path, json=payload, headers={"Idempotency-Key": key},
+                    timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+                )
+        except requests.RequestException as e:
+            logger.warning(f"[{lane}] Backend {path} unreachable: {e}")
+            return False
+
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            logger.warning(f"[{lane}] Backend {path} answered {response.status_code}.")
+            return False
+        try:
+            message = response.json().get("message", response.text)
+        except ValueError:
+            message = response.text
+        if response.status_code == 200 or response.status_code == 404:
+            # 404 is "no subscribers for this bot", which is final too
+            logger.info(f"[{lane}] Backend {path}: {message}")
+        else:
+            logger.error(f"[{lane}] Backend {path} rejected the event ({response.status_code}): {message}")
+        return True
 
 # ---------- Api Calls  ----------
 
-def user_trade_open(trade_data):
+def user_trade_open(trade_data, label: str = None):
     """
-    Sends selected trade data to the backend when a trade is opened.
+    Queues selected trade data for the backend when a trade is opened, in the
+    outbox lane of `label` (the runner's "SYMBOL TF"; the symbol by default).
     """
-    # Construct the endpoints using the environment variables
-    open_trade_endpoint = f"http://{backend_uri}:{backend_port}/opentrades/open_trade"
-
     # Extract only the required fields and convert to standard Python types
     payload = {
         "symbol": str(trade_data["symbol"]),
@@ -553,60 +2789,133 @@ def user_trade_open(trade_data):
         "investment_per_trade": float(trade_data["investment_per_trade"]),
         "amount_multiplier": float(trade_data["amount_multiplier"]), 
     }
+    trade_id = trade_data.get("_id") or uuid.uuid4().hex
+    BackendOutbox.get().enqueue(label or payload["symbol"], "/opentrades/open_trade", payload, f"{trade_id}:open")
 
-    # Send POST request with JSON body
-    response = requests.post(open_trade_endpoint, json=payload)
-
-    # Handle the response
-    if response.status_code == 200:
-        data = response.json()
 
-        print("####################")
-        print(data["message"])
-        print("####################")
-        
-        
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-
-
-def user_trade_close(symbol, direction,reason):
-    # Construct the endpoint using the environment variables
-    close_trade_endpoint = f"http://{backend_uri}:{backend_port}/closetrades/close_trade"
-    
+def user_trade_close(symbol, direction, reason, trade_id=None, label: str = None):
+    """
+    Queues the close of a trade for the backend, in the same lane as its open.
+    """
     # Prepare the payload with symbol and direction
     payload = {
         "symbol": symbol,
         "direction": direction,
         "reason": reason
     }
-    
-    # Send the POST request with JSON data
-    response = requests.post(close_trade_endpoint, json=payload)
-    data = response.json()
+    trade_id = trade_id or uuid.uuid4().hex
+    BackendOutbox.get().enqueue(label or symbol, "/closetrades/close_trade", payload, f"{trade_id}:close")
+
 
-    print("###############################")
-    print(data["message"])
-    print("###############################")
+# ---------- WRITE-BEHIND PERSISTENCE ----------
+class WriteBehindQueue:
+    """
+    Process-wide FIFO of Mongo writes, drained by one background thread so
+    the signal path never waits on a round-trip. Writes run in submission
+    order. A write that loses the connection is retried with backoff before
+    anything behind it runs; any other error is logged and the write dropped.
+    Inserts carry a client-side _id, so a retried insert that had in fact
+    gone through is recognised (DuplicateKeyError) instead of doubled.
+    A write submitted with a `fence` is dropped instead of run (or retried)
+    once the fence returns False, i.e. its shard lease was lost.
+    Pending writes are flushed at interpreter exit.
+    """
+    MAX_BACKOFF = 30      # seconds between retries of a failing write
+    FLUSH_TIMEOUT = 60    # seconds to wait for pending writes at exit
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.pending = queue.Queue()
+        self._thread = threading.Thread(target=self._drain, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def get(cls) -> "WriteBehindQueue":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, fn, *args, fence=None, **kwargs):
+        self.pending.put((fn, args, kwargs, fence))
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Blocks until every submitted write has run (or `timeout` passes).
+        Returns whether the queue was drained.
+        """
+        timeout = self.FLUSH_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while self.pending.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                logger.error(f"Write-behind flush timed out with {self.pending.unfinished_tasks} writes pending.")
+                return False
+            time.sleep(0.01)
+        return True
 
+    def _drain(self):
+        while True:
+            fn, args, kwargs, fence = self.pending.get()
+            attempt = 0
+            while True:
+                if fence is not None and not fence():
+                    logger.warning(f"Write-behind {fn.__name__} dropped: shard lease lost.")
+                    break
+                try:
+                    fn(*args, **kwargs)
+                    break
+                except DuplicateKeyError:
+                    break
+                except ConnectionFailure as e:
+                    attempt += 1
+                    delay = min(2 ** attempt, self.MAX_BACKOFF)
+                    logger.warning(f"Write-behind {fn.__name__} failed ({e}); retry {attempt} in {delay}s.")
+                    time.sleep(delay)
+                except Exception:
+                    logger.exception(f"Write-behind {fn.__name__} failed; dropped.")
+                    break
+            self.pending.task_done()
 
 # ---------- TRADING SIMULATION ----------
 class TradingSimulation:
-    def __init__(self, config: StrategyConfig):
+    """
+    Opens, reverses and closes one symbol's simulated trades. The open trade
+    and the risk percent are loaded from Mongo once and then kept in memory;
+    trade writes and the analysis that follows a close go through the
+    WriteBehindQueue, so handle_signal does no Mongo round-trip. `lock`
+    serialises handle_signal with closes from the ExitMonitor. In sharded
+    mode `fence` returns whether this node still holds the symbol's lease;
+    it gates both trading and the queued trade writes.
+    """
+    def __init__(self, config: StrategyConfig, fence=None):
         self.config = config
+        self.lock = threading.RLock()
+        self.fence = fence
         self.client = MongoClient(self.config.mongo_uri)
         self.db = self.client[self.config.db_name]
         self.trades_collection = self.db[self.config.collection_name]
+        self.writer = WriteBehindQueue.get()
+        self.trade_analysis = TradeAnalysys(self.db, self.config)
 
         self.symbol = self.config.SYMBOL
+        self.label = f"{self.config.SYMBOL} {self.config.TIMEFRAME}"
         self.initial_balance = self.config.initial_balance
         self.current_risk_percent = self.config.risk_per_trade
 
         self._resume_risk_from_last_trade()
+        self.open_trade_doc = self.trades_collection.find_one({"status": "OPEN"})
 
     def filter_signal(self, row) -> bool:
         return True
 
+    def lease_lost(self) -> bool:
+        if self.fence is None or self.fence():
+            return False
+        logger.warning(f"[{self.symbol}] Shard lease lost; not trading.")
+        return True
+
     def _resume_risk_from_last_trade(self):
         last_closed_trade = self.trades_collection.find_one(
             {"status": {"$in": ["TP", "SL"]}},
@@ -617,11 +2926,11 @@ class TradingSimulation:
             last_trade_status = last_closed_trade["status"]
             last_investment = last_closed_trade.get("investment_per_trade", self.config.risk_per_trade)
             if last_trade_status == "SL":
-                self.current_investment_per_trade = last_investment * 2
+                self.current_risk_percent = last_investment * self.config.risk_multiplier
             elif last_trade_status == "TP":
-                self.current_investment_per_trade = self.config.risk_per_trade
+                self.current_risk_percent = self.config.risk_per_trade
         else:
-            self.current_investment_per_trade = self.config.risk_per_trade
+            self.current_risk_percent = self.config.risk_per_trade
 
     def update_investment_per_trade(self, last_trade_status: str):
         if last_trade_status in ["SL"]:
@@ -659,9 +2968,13 @@ class TradingSimulation:
         return profit, net_pnl, total_fee, amount_multiplier
 
     def get_open_trade(self):
-        return self.trades_collection.find_one({"status": "OPEN"})
+        return self.open_trade_doc
 
-    def open_trade(self, row):
+    def new_trade(self, row) -> dict:
+        """
+        The trade document for a position opened at `row`'s close in the predicted
+        direction, with ATR-based SL/TP and the current risk percent.
+        """
         direction_str = "LONG" if row["prediction"] == 1 else "SHORT"
         entry_price = row["close"]
         atr = row["ATR"]
@@ -693,21 +3006,34 @@ class TradingSimulation:
             "pnl": 0,
             "net_pnl": 0
         }
+        return trade_data
 
-        self.trades_collection.insert_one(trade_data)
+    def open_trade(self, row):
+        trade_data = self.new_trade(row)
+        trade_data["_id"] = ObjectId()
+        direction_str = trade_data["direction"]
+        entry_price = trade_data["entry_price"]
+        stop_loss = trade_data["stop_loss"]
+        take_profit = trade_data["take_profit"]
+
+        self.open_trade_doc = trade_data
+        self.writer.submit(self.trades_collection.insert_one, dict(trade_data), fence=self.fence)
         logger.info(
             f"Opened {direction_str} trade @ {entry_price:.2f} | SL={stop_loss:.2f}, TP={take_profit:.2f}, risk%={self.current_risk_percent}"
         )
 
         # Call the dummy user trade open function
-        user_trade_open(trade_data)
+        user_trade_open(trade_data, self.label)
 
-    def close_trade(self, open_trade, reason: str, row, forced_exit_price=None):
+    def closing_update(self, open_trade, reason: str, row, forced_exit_price=None) -> dict:
+        """
+        The fields a close at `row` sets on `open_trade`: exit at the SL/TP level
+        when given, otherwise at the candle's close.
+        """
         if forced_exit_price is not None:
             exit_price = forced_exit_price
         else:
             exit_price = row["close"]
-        symbol=open_trade["symbol"]
         direction = open_trade["direction"]
         entry_price = open_trade["entry_price"]
         profit, net_pnl, total_fee, final_amount_multiplier = self.calculate_pnl(entry_price, exit_price, direction)
@@ -721,17 +3047,29 @@ class TradingSimulation:
             "total_fees": total_fee,
             "amount_multiplier": final_amount_multiplier
         }
-        self.trades_collection.update_one({"_id": open_trade["_id"]}, {"$set": update_data})
+        return update_data
+
+    def close_trade(self, open_trade, reason: str, row, forced_exit_price=None):
+        update_data = self.closing_update(open_trade, reason, row, forced_exit_price)
+        symbol = open_trade["symbol"]
+        direction = open_trade["direction"]
+        exit_price = update_data["exit_price"]
+        profit = update_data["pnl"]
+        net_pnl = update_data["net_pnl"]
+        total_fee = update_data["total_fees"]
+        open_trade.update(update_data)
+        self.open_trade_doc = None
+        self.writer.submit(self.trades_collection.update_one, {"_id": open_trade["_id"]}, {"$set": update_data},
+                           fence=self.fence)
 
         logger.info(
             f"Closed trade OF {symbol} -> {direction}  with status={reason} @ {exit_price:.2f}. PNL={profit:.2f}, NetPNL={net_pnl:.2f}, Fees={total_fee:.2f}"
         )
 
         # Call the dummy user trade close function
-        user_trade_close(symbol,direction,reason)
+        user_trade_close(symbol, direction, reason, open_trade["_id"], self.label)
         self.update_investment_per_trade(reason)
-        trade_analysis = TradeAnalysys(self.db, self.config)
-        trade_analysis.analyze_and_store()
+        self.writer.submit(self.trade_analysis.record_close, dict(open_trade), fence=self.fence)
 
     def check_sl_tp(self, open_trade, row):
         direction = open_trade["direction"]
@@ -786,104 +3124,122 @@ class TradingSimulation:
             logger.info("TP or SL not HIT.")
             return False
 
-    def handle_signal(self, row):
-        open_trade = self.get_open_trade()
-        trade_closed = False
-
-        if open_trade:
-            logger.info("Checking if open trade hit TP or SL.")
-            trade_closed = self.check_sl_tp(open_trade, row)
-
-        if not self.filter_signal(row):
-            logger.info("Signal is skipped.")
-            return
-
-        if not open_trade or trade_closed:
-            logger.info("No open trade or the trade was just closed. Opening a new trade.")
-            self.open_trade(row)
-        else:
-            current_dir = open_trade["direction"]
-            new_dir = "LONG" if row["prediction"] == 1 else "SHORT"
+    @staticmethod
+    def reversal_reason(open_trade, exit_price) -> str:
+        """
+        A trade closed by an opposite signal counts as TP when it is in profit
+        at the close, SL otherwise.
+        """
+        entry_price = open_trade["entry_price"]
+        if open_trade["direction"] == "LONG":
+            return "TP" if exit_price > entry_price else "SL"
+        return "TP" if exit_price < entry_price else "SL"
 
-            if current_dir == new_dir:
-                logger.info(f"Signal is {new_dir}, but we already have OPEN {current_dir}. Skipping.")
+    def handle_signal(self, row):
+        with self.lock:
+            if self.lease_lost():
+                return
+            open_trade = self.get_open_trade()
+            trade_closed = False
+
+            if open_trade:
+                logger.info("Checking if open trade hit TP or SL.")
+                trade_closed = self.check_sl_tp(open_trade, row)
+
+            if not self.filter_signal(row):
+                logger.info("Signal is skipped.")
+                return
+
+            if not open_trade or trade_closed:
+                logger.info("No open trade or the trade was just closed. Opening a new trade.")
+                self.open_trade(row)
             else:
-                logger.info(f"Signal is {new_dir}, but open trade is {current_dir}. Reversing...")
-                exit_price = row["close"]
-                entry_price = open_trade["entry_price"]
-                if current_dir == "LONG":
-                    close_reason = "TP" if exit_price > entry_price else "SL"
+                current_dir = open_trade["direction"]
+                new_dir = "LONG" if row["prediction"] == 1 else "SHORT"
+
+                if current_dir == new_dir:
+                    logger.info(f"Signal is {new_dir}, but we already have OPEN {current_dir}. Skipping.")
                 else:
-                    close_reason = "TP" if exit_price < entry_price else "SL"
-                self.close_trade(open_trade, reason=close_reason, row=row)
-                self.open_trade(row)
+                    logger.info(f"Signal is {new_dir}, but open trade is {current_dir}. Reversing...")
+                    close_reason = self.reversal_reason(open_trade, row["close"])
+                    self.close_trade(open_trade, reason=close_reason, row=row)
+                    self.open_trade(row)
 
 # ---------- TRADE ANALYSIS ----------
-class TradeAnalysys:
-    def __init__(self, db, config: StrategyConfig):
-        self.db = db
-        self.config = config
-        self.trades_collection = db[self.config.collection_name]
-        self.analysis_collection = db[f"Analysis_{self.config.collection_name}"]
-
-    def analyze_and_store(self):
-        closed_trades_cursor = self.trades_collection.find(
-            {"status": {"$ne": "OPEN"}}
-        ).sort("exit_time", 1)
-        closed_trades = list(closed_trades_cursor)
-
-        if not closed_trades:
-            logger.info("No closed trades yet. Skipping analysis.")
-            return
-
-        total_trades = len(closed_trades)
-        winners = [t for t in closed_trades if t["status"] == "TP"]
-        losers  = [t for t in closed_trades if t["status"] == "SL"]
-
-        winning_trades = len(winners)
-        losing_trades  = len(losers)
-
-        max_winning_streak = 0
-        max_losing_streak  = 0
-        current_win_streak = 0
-        current_loss_streak = 0
+class TradeAccumulator:
+    """
+    Running totals behind the TradeAnalysys metrics: counts, PnL and fee sums
+    and the current and longest streaks. add() is O(1) per closed trade and
+    the state is a plain dict, so it can be stored in the Analysis document.
+    """
+    INITIAL_STATE = {
+        "total_trades": 0,
+        "winning_trades": 0,
+        "losing_trades": 0,
+        "current_win_streak": 0,
+        "current_loss_streak": 0,
+        "max_winning_streak": 0,
+        "max_losing_streak": 0,
+        "sum_net_pnl": 0.0,
+        "sum_profit": 0.0,
+        "sum_win_net_pnl": 0.0,
+        "sum_loss_net_pnl": 0.0,
+        "total_fees_paid": 0.0,
+        "last_trade_id": None
+    }
 
-        for trade in closed_trades:
-            if trade["status"] == "TP":
-                current_win_streak += 1
-                max_winning_streak = max(max_winning_streak, current_win_streak)
-                current_loss_streak = 0
-            elif trade["status"] == "SL":
-                current_loss_streak += 1
-                max_losing_streak = max(max_losing_streak, current_loss_streak)
-                current_win_streak = 0
-            else:
-                current_win_streak = 0
-                current_loss_streak = 0
-
-        sum_net_pnl = sum(t.get("net_pnl", 0) for t in closed_trades)
-        sum_profit  = sum(t.get("pnl", 0) for t in closed_trades)
-        avg_profit = np.mean([t["net_pnl"] for t in winners]) if winning_trades > 0 else 0.0
-        avg_loss   = np.mean([t["net_pnl"] for t in losers]) if losing_trades > 0 else 0.0
-        total_fees_paid = sum(t.get("total_fees", 0) for t in closed_trades)
-        break_even_win_rate = 100 * (1 / (1 + self.config.reward_to_risk_ratio))
-        win_rate = (winning_trades / total_trades) * 100.0
-
-        initial_balance = self.config.initial_balance
-        net_balance = initial_balance + sum_net_pnl
-        balance     = initial_balance + sum_profit
+    def __init__(self, state: dict = None):
+        self.state = {**self.INITIAL_STATE, **(state or {})}
+
+    def add(self, trade: dict):
+        state = self.state
+        state["total_trades"] += 1
+        if trade["status"] == "TP":
+            state["winning_trades"] += 1
+            state["sum_win_net_pnl"] += trade["net_pnl"]
+            state["current_win_streak"] += 1
+            state["max_winning_streak"] = max(state["max_winning_streak"], state["current_win_streak"])
+            state["current_loss_streak"] = 0
+        elif trade["status"] == "SL":
+            state["losing_trades"] += 1
+            state["sum_loss_net_pnl"] += trade["net_pnl"]
+            state["current_loss_streak"] += 1
+            state["max_losing_streak"] = max(state["max_losing_streak"], state["current_loss_streak"])
+            state["current_win_streak"] = 0
+        else:
+            state["current_win_streak"] = 0
+            state["current_loss_streak"] = 0
+
+        state["sum_net_pnl"] += trade.get("net_pnl", 0)
+        state["sum_profit"] += trade.get("pnl", 0)
+        state["total_fees_paid"] += trade.get("total_fees", 0)
+        state["last_trade_id"] = trade.get("_id")
+
+    def metrics(self, config: StrategyConfig) -> dict:
+        state = self.state
+        total_trades = state["total_trades"]
+        winning_trades = state["winning_trades"]
+        losing_trades = state["losing_trades"]
+
+        avg_profit = state["sum_win_net_pnl"] / winning_trades if winning_trades > 0 else 0.0
+        avg_loss   = state["sum_loss_net_pnl"] / losing_trades if losing_trades > 0 else 0.0
+        break_even_win_rate = 100 * (1 / (1 + config.reward_to_risk_ratio))
+        win_rate = (winning_trades / total_trades) * 100.0 if total_trades > 0 else 0.0
+
+        initial_balance = config.initial_balance
+        net_balance = initial_balance + state["sum_net_pnl"]
+        balance     = initial_balance + state["sum_profit"]
         roi         = ((net_balance - initial_balance) / initial_balance) * 100.0
 
-        analysis_result = {
-            "timestamp": datetime.now(),
+        return {
             "Total Trades": total_trades,
             "Winning Trades": winning_trades,
             "Losing Trades": losing_trades,
-            "Max Winning Streak": int(max_winning_streak),
-            "Max Losing Streak": int(max_losing_streak),
+            "Max Winning Streak": int(state["max_winning_streak"]),
+            "Max Losing Streak": int(state["max_losing_streak"]),
             "Avg Profit Per Trade": float(avg_profit),
             "Avg Loss Per Trade": float(avg_loss),
-            "Total Fees Paid": float(total_fees_paid),
+            "Total Fees Paid": float(state["total_fees_paid"]),
             "Break-even Win Rate (%)": float(break_even_win_rate),
             "Win Rate (%)": float(win_rate),
             "ROI (%)": float(roi),
@@ -891,6 +3247,53 @@ class TradeAnalysys:
             "Final Balance": float(balance)
         }
 
+class TradeAnalysys:
+    """
+    Keeps the Analysis_<collection> document up to date. record_close() folds
+    one closed trade into a TradeAccumulator whose state is stored with the
+    metrics; analyze_and_store() rebuilds it from every closed trade (see
+    rebuild_analysis.py).
+    """
+    def __init__(self, db, config: StrategyConfig):
+        self.db = db
+        self.config = config
+        self.trades_collection = db[self.config.collection_name]
+        self.analysis_collection = db[f"Analysis_{self.config.collection_name}"]
+        self.accumulator = None
+
+    def record_close(self, trade: dict):
+        """
+        Adds a just-closed trade. Safe to repeat for the same trade, as the
+        write-behind queue does when a write is retried.
+        """
+        if self.accumulator is None:
+            stored = self.analysis_collection.find_one({"analysis_id": 1}, {"accumulator": 1})
+            if stored is None or "accumulator" not in stored:
+                # First close, or a document written before the accumulator existed
+                self.analyze_and_store()
+            else:
+                self.accumulator = TradeAccumulator(stored["accumulator"])
+
+        if trade.get("_id") is None or trade["_id"] != self.accumulator.state["last_trade_id"]:
+            self.accumulator.add(trade)
+        self._store()
+
+    def analyze_and_store(self):
+        self.accumulator = TradeAccumulator()
+        closed_trades = self.trades_collection.find({"status": {"$ne": "OPEN"}}).sort("exit_time", 1)
+        for trade in closed_trades:
+            self.accumulator.add(trade)
+        self._store()
+
+    def _store(self):
+        if self.accumulator.state["total_trades"] == 0:
+            logger.info("No closed trades yet. Skipping analysis.")
+            return
+
+        analysis_result = {"timestamp": datetime.now()}
+        analysis_result.update(self.accumulator.metrics(self.config))
+        analysis_result["accumulator"] = self.accumulator.state
+
         self.analysis_collection.update_one(
             {"analysis_id": 1},
             {"$set": analysis_result},
@@ -898,48 +3301,1015 @@ class TradeAnalysys:
         )
         #logger.info(f"Trade Analysis stored: {analysis_result}")
 
+    @staticmethod
+    def compute_metrics(closed_trades: list, config: StrategyConfig) -> dict:
+        """
+        Summary statistics over closed trades in exit order. Shared by the live
+        analysis and the backtester.
+        """
+        accumulator = TradeAccumulator()
+        for trade in closed_trades:
+            accumulator.add(trade)
+        return accumulator.metrics(config)
+
+# ---------- SNAPSHOTS ----------
+class SnapshotStore:
+    """
+    Keeps a SymbolRunner's warm state (candle buffer, indicator state, rank
+    caches, model state) between restarts: one snapshot per symbol and
+    timeframe, either in SNAPSHOT_DIR or in the Snapshots collection. A
+    snapshot is an .npz archive holding the arrays and a JSON header; objects
+    are stored as their fields and rebuilt only as one of CLASSES. Nothing is
+    unpickled, so a tampered snapshot can at worst fail to load. The loop
+    thread only encodes the state. Compressing and writing go through the
+    WriteBehindQueue, and a newer snapshot replaces one still waiting there.
+    Snapshots of another VERSION, or taken with different strategy
+    parameters, are ignored.
+    """
+    COLLECTION = "Snapshots"
+    VERSION = 1
+    # The only classes a snapshot can hold. The runner's StrategyConfig is left out and set back on restore.
+    CLASSES = {cls.__name__: cls for cls in (
+        RollingMean, EWMMean, RSIState, CCIState, ADXState, WaveTrendState, IndicatorState,
+        SortedWindow, RollingStatCache, NumpyLogistic, LogisticRegression,
+        RunningScaler, SlidingKNN, IncrementalModel
+    )}
+
+    def __init__(self, config: StrategyConfig, kind: str = SNAPSHOT_STORE, directory: str = SNAPSHOT_DIR):
+        self.kind = kind
+        self.key = f"{config.SYMBOL.replace('/', '_')}_{config.TIMEFRAME}"
+        self.fingerprint = SnapshotStore.config_fingerprint(config)
+        self._pending = None  # the newest encoded snapshot not written yet
+        self._lock = threading.Lock()
+        if kind == "mongo":
+            self.collection = MongoClient(config.mongo_uri)[config.db_name][self.COLLECTION]
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f"{self.key}.npz")
+
+    @staticmethod
+    def config_fingerprint(config: StrategyConfig) -> str:
+        params = {
+            name: value for name, value in vars(config).items()
+            if isinstance(value, (int, float, str, bool, list)) and name not in ("mongo_uri", "db_name")
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def save(self, last_ts: pd.Timestamp, state: dict):
+        """
+        Encodes `state` (copying its arrays, since the runner keeps mutating
+        them) and queues the write.
+        """
+        arrays = {}
+        header = {"version": self.VERSION, "fingerprint": self.fingerprint, "last_ts": str(last_ts),
+                  "state": self.encode(state, arrays)}
+        with self._lock:
+            queued = self._pending is not None
+            self._pending = (last_ts, header, arrays)
+        if not queued:
+            WriteBehindQueue.get().submit(self._write)
+
+    def _write(self):
+        with self._lock:
+            pending = self._pending
+        last_ts, header, arrays = pending
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, header=np.array(json.dumps(header)), **arrays)
+        if self.kind == "mongo":
+            self.collection.update_one(
+                {"_id": self.key},
+                {"$set": {"version": self.VERSION, "fingerprint": self.fingerprint,
+                          "last_ts": last_ts.to_pydatetime(), "state": buffer.getvalue()}},
+                upsert=True
+            )
+        else:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, self.path)
+
+        with self._lock:
+            newer = self._pending is not pending
+            if not newer:
+                self._pending = None
+        if newer:
+            WriteBehindQueue.get().submit(self._write)
+
+    def load(self) -> Optional[dict]:
+        """
+        Returns the stored state, or None when there is none, it cannot be
+        read, or it was taken by another version or with different strategy
+        parameters.
+        """
+        if self.kind == "mongo":
+            doc = self.collection.find_one({"_id": self.key})
+            if doc is None or doc.get("version") != self.VERSION:
+                return None
+            blob = doc["state"]
+        else:
+            if not os.path.exists(self.path):
+                return None
+            with open(self.path, "rb") as f:
+                blob = f.read()
+
+        try:
+            with np.load(io.BytesIO(blob), allow_pickle=False) as archive:
+                header = json.loads(str(archive["header"]))
+                arrays = {name: archive[name] for name in archive.files if name != "header"}
+            if header["version"] != self.VERSION:
+                return None
+            if header["fingerprint"] != self.fingerprint:
+                logger.info(f"Snapshot {self.key} was taken with other strategy parameters; ignoring it.")
+                return None
+            return self.decode(header["state"], arrays)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            logger.warning(f"Snapshot {self.key} could not be read ({e!r}); ignoring it.")
+            return None
+
+    @classmethod
+    def encode(cls, value, arrays: dict):
+        """
+        JSON form of `value`. Arrays are added to `arrays` and referenced by name.
+        """
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, np.datetime64):
+            return {"__datetime64__": str(value)}
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            if value.dtype == object:
+                raise TypeError("Cannot snapshot an object array")
+            name = f"a{len(arrays)}"
+            arrays[name] = value.copy()
+            return {"__array__": name}
+        if isinstance(value, pd.Timestamp):
+            return {"__timestamp__": str(value)}
+        if isinstance(value, pd.DataFrame):
+            return {"__frame__": [[column, cls.encode(value[column].to_numpy(), arrays)] for column in value.columns]}
+        if isinstance(value, deque):
+            return {"__deque__": cls.encode(list(value), arrays), "maxlen": value.maxlen}
+        if isinstance(value, tuple):
+            return {"__tuple__": [cls.encode(item, arrays) for item in value]}
+        if isinstance(value, list):
+            # Runs of floats, float tuples (indicator rows) or candle timestamps are stored as one array
+            if value and all(isinstance(item, float) for item in value):
+                return {"__list__": cls.encode(np.array(value, dtype=float), arrays), "of": "float"}
+            if value and all(isinstance(item, tuple) for item in value) \
+                    and all(isinstance(x, float) for item in value for x in item):
+                return {"__list__": cls.encode(np.array(value, dtype=float), arrays), "of": "tuple"}
+            if value and all(type(item) is pd.Timestamp for item in value):
+                return {"__list__": cls.encode(pd.DatetimeIndex(value).to_numpy(), arrays), "of": "timestamp"}
+            if value and all(isinstance(item, np.datetime64) for item in value):
+                return {"__list__": cls.encode(np.array(value), arrays), "of": "datetime64"}
+            return [cls.encode(item, arrays) for item in value]
+        if isinstance(value, dict):
+            return {"__dict__": [[cls.encode(k, arrays), cls.encode(v, arrays)] for k, v in value.items()]}
+        if isinstance(value, StrategyConfig):
+            return {"__config__": None}
+        if cls.CLASSES.get(type(value).__name__) is type(value):
+            return {"__object__": type(value).__name__, "fields": cls.encode(vars(value), arrays)}
+        raise TypeError(f"Cannot snapshot a {type(value).__name__}")
+
+    @classmethod
+    def decode(cls, value, arrays: dict):
+        if isinstance(value, list):
+            return [cls.decode(item, arrays) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "__array__" in value:
+            return arrays[value["__array__"]]
+        if "__datetime64__" in value:
+            return np.datetime64(value["__datetime64__"])
+        if "__timestamp__" in value:
+            return pd.Timestamp(value["__timestamp__"])
+        if "__frame__" in value:
+            return pd.DataFrame({column: cls.decode(data, arrays) for column, data in value["__frame__"]})
+        if "__list__" in value:
+            items = cls.decode(value["__list__"], arrays)
+            if value["of"] == "timestamp":
+                return list(pd.DatetimeIndex(items))
+            if value["of"] == "tuple":
+                return [tuple(row) for row in items.tolist()]
+            if value["of"] == "datetime64":
+                return list(items)
+            return items.tolist()
+        if "__deque__" in value:
+            return deque(cls.decode(value["__deque__"], arrays), maxlen=value["maxlen"])
+        if "__tuple__" in value:
+            return tuple(cls.decode(value["__tuple__"], arrays))
+        if "__dict__" in value:
+            return {cls.decode(k, arrays): cls.decode(v, arrays) for k, v in value["__dict__"]}
+        if "__config__" in value:
+            return None
+        if "__object__" in value:
+            obj = cls.CLASSES[value["__object__"]].__new__(cls.CLASSES[value["__object__"]])
+            obj.__dict__.update(cls.decode(value["fields"], arrays))
+            return obj
+        raise ValueError(f"Unknown snapshot value {sorted(value)}")
+
 # ---------- LIVE TRADING LOOP ----------
-def run_live_trading(config: StrategyConfig):
-    # Optional: Delete existing database if needed
-    # MarketDataFetcher.delete_database(config.db_name)
+class SymbolRunner:
+    """
+    Per-config pipeline state (candle buffer, model, trade simulation).
+    Shared by the polling loop and the streaming mode. With trading=False it
+    only predicts (the process-mode workers), without Mongo or backend I/O.
+    `fence` is passed on to the TradingSimulation (see ShardManager).
+    """
+    def __init__(self, config: StrategyConfig, trading: bool = True, fence=None):
+        self.config = config
+        self.label = f"{config.SYMBOL} {config.TIMEFRAME}"
+        WarmupCalculator.resolve_limit(config)
+        self.ai_model = AIModel(config, connect_db=trading)
+        self.trading_sim = TradingSimulation(config, fence) if trading else None
+        if trading and EXIT_MONITOR:
+            ExitMonitor.get().watch(self.trading_sim)
+        self.candle_buffer = CandleBuffer.get(config.SYMBOL, config.TIMEFRAME, config.LIMIT)
+        self.indicator_state = IndicatorState(config)
+        self.feature_graph = FeatureGraph.for_config(config)
+        self.volatility_cache = RollingStatCache(config.VOLATILITY_WINDOW, config.LIMIT, q=config.VOLATILITY_PERCENTILE)
+        self.atr_rank_cache = RollingStatCache(config.Lookahead_window, config.LIMIT)
+        self.momentum_rank_cache = RollingStatCache(config.Lookahead_window, config.LIMIT)
+        self.last_processed_ts = None
+
+        self.snapshots = SnapshotStore(config) if SNAPSHOT_STORE and trading else None
+        if self.snapshots is not None:
+            self.restore_snapshot()
+
+    def close(self):
+        if self.trading_sim is not None and EXIT_MONITOR:
+            ExitMonitor.get().unwatch(self.trading_sim)
+
+    def snapshot_state(self) -> dict:
+        return {
+            "last_processed_ts": self.last_processed_ts,
+            "candles": self.candle_buffer.df,
+            "indicator_state": self.indicator_state,
+            "volatility_cache": self.volatility_cache,
+            "atr_rank_cache": self.atr_rank_cache,
+            "momentum_rank_cache": self.momentum_rank_cache,
+            "model": self.ai_model.state()
+        }
 
-    ai_model = AIModel(config)
-    trading_sim = TradingSimulation(config)
-    tf_minutes = MarketDataFetcher.timeframe_to_minutes(config.TIMEFRAME)
-    last_processed_ts = None
-    while True:
-        MarketDataFetcher.sleep_until_candle_close(tf_minutes)
-
-        df = MarketDataFetcher.fetch_binance_futures_ohlcv(
-            symbol=config.SYMBOL,
-            timeframe=config.TIMEFRAME,
-            limit=config.LIMIT,
-            last_known_ts=last_processed_ts
-        )
+    def restore_snapshot(self):
+        """
+        Resumes from the last snapshot when the candles missed since it still fit
+        in the buffer; the first poll then only fetches those. Anything older
+        (or from other parameters) is a cold start.
+        """
+        config = self.config
+        state = self.snapshots.load()
+        if state is None or state["candles"] is None:
+            return
+
+        last_ts = state["candles"]["timestamp"].iloc[-1]
+        now = pd.Timestamp(Clock.current.now()).tz_localize(None)
+        missed = int((now - last_ts) / self.candle_buffer.tf_delta) - 1
+        if missed > self.candle_buffer.capacity:
+            logger.info(f"[{config.SYMBOL} {config.TIMEFRAME}] Snapshot at {last_ts} is {missed} candles old; cold start.")
+            return
+
+        self.candle_buffer.replace(state["candles"])
+        for name in ("indicator_state", "volatility_cache", "atr_rank_cache", "momentum_rank_cache"):
+            setattr(self, name, state[name])
+        self.indicator_state.config = config
+        self.ai_model.load_state(state["model"])
+        self.last_processed_ts = state["last_processed_ts"]
+        logger.info(f"[{config.SYMBOL} {config.TIMEFRAME}] Resumed from snapshot at {last_ts} ({missed} candles behind).")
+
+    def poll(self):
+        """
+        Brings the candle buffer up to date over REST and processes the latest candle.
+        """
+        with Profiler.candle(self.label, self.config.SYMBOL):
+            self.process(self.candle_buffer.update())
+
+    def on_closed_candle(self, candle: pd.DataFrame):
+        """
+        Appends a confirmed candle pushed by the stream. A gap (missed events or
+        an empty buffer) is backfilled over REST before processing.
+        """
+        with Profiler.candle(self.label, self.config.SYMBOL):
+            if self.candle_buffer.last_ts is not None and self.candle_buffer.append(candle):
+                df = self.candle_buffer.window()
+            else:
+                df = self.candle_buffer.update()
+            self.process(df)
+
+    def process(self, df: Optional[pd.DataFrame]):
+        """
+        Predicts, trades and snapshots one candle window; callers wrap it in
+        the candle's Profiler.candle().
+        """
+        latest_row = self.predict(df)
+        if latest_row is None:
+            return
+
+        self.handle_signal(latest_row)
+
+        if self.snapshots is not None:
+            self.snapshots.save(self.last_processed_ts, self.snapshot_state())
+
+    def handle_signal(self, latest_row: pd.Series):
+        """
+        Trades the prediction and records how long after its candle closed it was traded.
+        """
+        with stage(self.label, "handle_signal"):
+            self.trading_sim.handle_signal(latest_row)
+        candle_close = (latest_row["timestamp"] + self.candle_buffer.tf_delta).tz_localize("UTC").timestamp()
+        Metrics.observe(self.label, "close_to_signal", Clock.current.now().timestamp() - candle_close)
+        Metrics.set_gauge(self.label, "last_candle_close", candle_close)
+
+    def predict(self, df: Optional[pd.DataFrame]) -> Optional[pd.Series]:
+        """
+        Runs the feature pipeline and the model over a candle window and returns
+        the latest row with its prediction, or None when there is nothing new.
+        """
+        config = self.config
 
         if df is None or df.empty:
             logger.warning("No data fetched. Skipping iteration.")
-            continue
+            return None
+
+        if df.iloc[-1]["timestamp"] == self.last_processed_ts:
+            logger.warning("No new closed candle since the last iteration. Skipping.")
+            return None
 
-        last_processed_ts = df.iloc[-1]["timestamp"]
-        #logger.info(f"New data up to: {last_processed_ts}")
+        self.last_processed_ts = df.iloc[-1]["timestamp"]
+        #logger.info(f"New data up to: {self.last_processed_ts}")
 
         # Pipeline: Calculate indicators and features
-        df = TechnicalIndicators.calculate_indicators(df, config)
-        df = DerivedFeatures.calculate_features(df, config)
-        df = LabelingFeature.compute_lookahead_period(df, config)
-        df = LabelingFeature.compute_market_structure(df, config)
-        df = LabelingFeature.compute_momentum_features(df, config)
-        #logger.info(f"After compute_lookahead_period ({len(df)} rows). Last ts: {df.iloc[-1]['timestamp']}")
-        df = LabelingFeature.compute_lorentzian_distance(df, config)
-        df = CandelLabeling.label_candles(df, config)
-        df = ai_model.train_and_predict(df)
+        if config.use_incremental_indicators:
+            with stage(self.label, "indicators"):
+                df = self.indicator_state.apply(df)
+            if config.verify_incremental_indicators:
+                self.indicator_state.verify(df)
+        if config.use_feature_graph:
+            df = self.feature_graph.compute(df, caches={
+                'ATR_Percentile': self.atr_rank_cache,
+                'Momentum_Confirm': self.momentum_rank_cache
+            }, timer=partial(stage, self.label))
+        else:
+            with stage(self.label, "indicators"):
+                df = TechnicalIndicators.calculate_indicators(df, config)
+            with stage(self.label, "derived_features"):
+                df = DerivedFeatures.calculate_features(df, config, self.volatility_cache)
+            with stage(self.label, "labeling_features"):
+                df = LabelingFeature.compute_lookahead_period(df, config, self.atr_rank_cache)
+                df = LabelingFeature.compute_market_structure(df, config)
+                df = LabelingFeature.compute_momentum_features(df, config, self.momentum_rank_cache)
+                #logger.info(f"After compute_lookahead_period ({len(df)} rows). Last ts: {df.iloc[-1]['timestamp']}")
+                df = LabelingFeature.compute_lorentzian_distance(df, config)
+        with stage(self.label, "labeling"):
+            df = CandelLabeling.label_candles(df, config)
+        with stage(self.label, "train_predict"):
+            df = self.ai_model.train_and_predict(df)
 
         latest_row = df.iloc[-1]
 
         logger.info(f"[{config.SYMBOL} {config.TIMEFRAME}] Latest candle prediction => {latest_row.get('prediction', np.nan)}")
         print("Latest row ",latest_row["timestamp"])
-        trading_sim.handle_signal(latest_row)
+        return latest_row
+
+def run_live_trading(config: StrategyConfig, stop: threading.Event = None, fence=None):
+    """
+    Polls at every candle close until `stop` is set. The loop notices it
+    after the current sleep; `fence` keeps it from trading meanwhile.
+    """
+    # Optional: Delete existing database if needed
+    # MarketDataFetcher.delete_database(config.db_name)
+
+    runner = SymbolRunner(config, fence=fence)
+    tf_minutes = MarketDataFetcher.timeframe_to_minutes(config.TIMEFRAME)
+    try:
+        while stop is None or not stop.is_set():
+            MarketDataFetcher.sleep_until_candle_close(tf_minutes)
+            if stop is not None and stop.is_set():
+                break
+            runner.poll()
+    finally:
+        runner.close()
+
+# ---------- STREAMING MODE ----------
+class BybitStream:
+    """
+    Bybit v5 public WebSocket client. Handlers are registered per topic and run
+    on the stream's event loop, so they must hand work off instead of blocking.
+    Subscriptions are re-sent after every reconnect and the reconnect callbacks
+    run so callers can backfill what they missed over REST.
+    """
+    PING_INTERVAL = 20    # seconds; Bybit drops connections idle for longer
+    MAX_BACKOFF = 60      # seconds between reconnect attempts
+    SUBSCRIBE_BATCH = 10  # Bybit accepts at most 10 topics per request
+
+    def __init__(self, url: str = BYBIT_WS_URL):
+        self.url = url
+        self.handlers = {}
+        self.reconnect_callbacks = []
+        self._lock = threading.Lock()
+        self._ws = None
+        self._loop = None
+
+    def subscribe(self, topic: str, handler):
+        """
+        Adds a handler. A new topic is also subscribed on the live connection,
+        so topics can be added from other threads while the stream runs.
+        """
+        with self._lock:
+            new_topic = topic not in self.handlers
+            self.handlers.setdefault(topic, []).append(handler)
+            ws, loop = self._ws, self._loop
+        if new_topic and ws is not None:
+            asyncio.run_coroutine_threadsafe(ws.send_json({"op": "subscribe", "args": [topic]}), loop)
+
+    def on_reconnect(self, callback):
+        self.reconnect_callbacks.append(callback)
+
+    def run_forever(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        backoff = 1
+        connected_before = False
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url) as ws:
+                        with self._lock:
+                            topics = list(self.handlers)
+                            self._ws, self._loop = ws, asyncio.get_running_loop()
+                        await self._subscribe_all(ws, topics)
+                        logger.info(f"Streaming {len(self.handlers)} topics from {self.url}")
+                        backoff = 1
+                        if connected_before:
+                            for callback in self.reconnect_callbacks:
+                                callback()
+                        connected_before = True
+                        await self._consume(ws)
+                logger.warning("Stream closed by the server.")
+            except Exception as e:
+                logger.error(f"Stream error: {e}")
+            finally:
+                with self._lock:
+                    self._ws = None
+            logger.info(f"Reconnecting in {backoff} seconds...")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    async def _subscribe_all(self, ws, topics: list):
+        for i in range(0, len(topics), self.SUBSCRIBE_BATCH):
+            await ws.send_json({"op": "subscribe", "args": topics[i:i + self.SUBSCRIBE_BATCH]})
+
+    async def _consume(self, ws):
+        ping_task = asyncio.create_task(self._ping(ws))
+        try:
+            while True:
+                # Pongs count as traffic, so a silent socket means a dead connection
+                msg = await ws.receive(timeout=self.PING_INTERVAL * 3)
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._dispatch(json.loads(msg.data))
+                elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    return
+        finally:
+            ping_task.cancel()
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(self.PING_INTERVAL)
+            await ws.send_json({"op": "ping"})
+
+    def _dispatch(self, message: dict):
+        topic = message.get("topic")
+        if topic is None:
+            if message.get("op") == "subscribe" and not message.get("success", True):
+                logger.error(f"Subscription rejected: {message.get('ret_msg')}")
+            return
+        for handler in list(self.handlers.get(topic, [])):
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Error handling {topic} message: {e}")
+
+def closed_klines(message: dict) -> Optional[pd.DataFrame]:
+    """
+    Extracts the confirmed candles of a kline message as OHLCV rows.
+    """
+    rows = [
+        [item["start"], item["open"], item["high"], item["low"], item["close"], item["volume"]]
+        for item in message.get("data", []) if item.get("confirm")
+    ]
+    if not rows:
+        return None
+    df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df[['open', 'high', 'low', 'close', 'volume']] = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
+    df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'), unit='ms')
+    return df
+
+def run_streaming(configs: list):
+    """
+    Runs the pipeline the moment the stream confirms a candle closed instead of
+    sleeping until the close and polling REST. Each config gets its own worker
+    thread so candles of one symbol are processed in order without blocking the
+    stream.
+    """
+    stream = BybitStream(BYBIT_WS_URL)
+
+    for conf in configs:
+        runner = SymbolRunner(conf)
+        worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=conf.collection_name)
+        # Preload the window over REST; the first candle is traded on its close event
+        worker.submit(runner.candle_buffer.update)
+
+        def on_kline(message, runner=runner, worker=worker):
+            candle = closed_klines(message)
+            if candle is not None:
+                worker.submit(runner.on_closed_candle, candle)
+
+        interval = MarketDataFetcher.timeframe_to_bybit_interval(conf.TIMEFRAME)
+        symbol = MarketDataFetcher.to_futures_symbol(conf.SYMBOL)
+        stream.subscribe(f"kline.{interval}.{symbol}", on_kline)
+        stream.on_reconnect(lambda runner=runner, worker=worker: worker.submit(runner.poll))
+
+    stream.run_forever()
+
+# ---------- EXIT MONITOR ----------
+def stream_prices(message: dict) -> list:
+    """
+    (timestamp in ms, price) pairs of a publicTrade or tickers message.
+    """
+    data = message.get("data")
+    if isinstance(data, dict):
+        # tickers deltas only carry the fields that changed
+        price = data.get("lastPrice")
+        return [(int(message["ts"]), float(price))] if price else []
+    return [(int(item["T"]), float(item["p"])) for item in data or []]
+
+class ExitMonitor:
+    """
+    Closes open trades as soon as a streamed price crosses their SL or TP
+    instead of at the next candle close. Every simulation of a symbol shares
+    one subscription. Levels are compared without locking; on a hit the
+    simulation's lock is taken and the trade re-checked, so a close cannot
+    race handle_signal. The candle high/low check stays as the fallback for
+    prices missed while the stream was down. Exits fill at the SL/TP level,
+    as they do at the candle close.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, url: str = BYBIT_WS_URL, topic: str = EXIT_MONITOR):
+        self.stream = BybitStream(url)
+        self.topic = topic
+        self.simulations = {}  # futures symbol -> simulations trading it
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def get(cls) -> "ExitMonitor":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def watch(self, simulation: "TradingSimulation"):
+        symbol = MarketDataFetcher.to_futures_symbol(simulation.symbol)
+        with self._lock:
+            subscribed = symbol in self.simulations
+            # Replaced rather than appended to, so the stream thread can iterate without the lock
+            self.simulations[symbol] = self.simulations.get(symbol, []) + [simulation]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.stream.run_forever, name="exit-monitor", daemon=True)
+                self._thread.start()
+        if not subscribed:
+            self.stream.subscribe(f"{self.topic}.{symbol}", lambda message, symbol=symbol: self.on_prices(symbol, message))
+            logger.info(f"[{simulation.symbol}] Exit monitor subscribed to {self.topic}.{symbol}")
+
+    def unwatch(self, simulation: "TradingSimulation"):
+        """
+        Stops checking `simulation`; the symbol stays subscribed for the next one.
+        """
+        symbol = MarketDataFetcher.to_futures_symbol(simulation.symbol)
+        with self._lock:
+            self.simulations[symbol] = [sim for sim in self.simulations.get(symbol, []) if sim is not simulation]
+
+    def on_prices(self, symbol: str, message: dict):
+        for timestamp, price in stream_prices(message):
+            for simulation in self.simulations.get(symbol, ()):
+                self.check(simulation, timestamp, price)
+
+    @staticmethod
+    def crossed(open_trade: dict, price: float):
+        """
+        The (reason, level) the price crossed, SL first, or None.
+        """
+        sl = open_trade["stop_loss"]
+        tp = open_trade["take_profit"]
+        if open_trade["direction"] == "LONG":
+            if price <= sl:
+                return "SL", sl
+            if price >= tp:
+                return "TP", tp
+        else:
+            if price >= sl:
+                return "SL", sl
+            if price <= tp:
+                return "TP", tp
+        return None
+
+    def check(self, simulation: "TradingSimulation", timestamp: int, price: float):
+        open_trade = simulation.get_open_trade()
+        if open_trade is None or self.crossed(open_trade, price) is None:
+            return
+        with simulation.lock:
+            if simulation.get_open_trade() is not open_trade or simulation.lease_lost():
+                return
+            reason, level = self.crossed(open_trade, price)
+            logger.info(f"[{simulation.symbol}] {reason} HIT by the price stream @ {price}")
+            row = {"timestamp": pd.Timestamp(timestamp, unit="ms"), "close": price}
+            simulation.close_trade(open_trade, reason=reason, row=row, forced_exit_price=level)
+
+# ---------- ASYNC SCHEDULER ----------
+class AsyncScheduler:
+    """
+    One event loop for every config instead of a thread per symbol. It wakes
+    once per timeframe boundary, fetches all symbols due at that boundary
+    concurrently through the shared async ccxt client (whose rate limiter is
+    shared by every request) and hands the windows to a thread pool for the
+    pandas/sklearn stage.
+    """
+    SETTLE_DELAY = 6            # seconds after the close, same as the polling loop
+    MAX_CONCURRENT_FETCHES = 20
+
+    def __init__(self, configs: list, compute_workers: int = None):
+        self.runners = [SymbolRunner(conf) for conf in configs]
+        self.compute_pool = ThreadPoolExecutor(
+            max_workers=compute_workers or min(len(configs), os.cpu_count() or 1),
+            thread_name_prefix="compute"
+        )
+        self.pending = {}  # runner -> compute future of its last candle
+
+    def run_forever(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        fetch_limiter = asyncio.Semaphore(self.MAX_CONCURRENT_FETCHES)
+        try:
+            while True:
+                due = await self._sleep_until_next_close()
+                # Cheap while the markets are fresh; reloads them every MARKETS_TTL
+                exchange = await ExchangeRegistry.get_async('bybit', 'linear')
+                windows = await asyncio.gather(*(self._fetch(exchange, runner, fetch_limiter) for runner in due))
+                for runner, df in zip(due, windows):
+                    if df is not None:
+                        self._dispatch(runner, df)
+        finally:
+            await ExchangeRegistry.close_async()
+
+    def _dispatch(self, runner: SymbolRunner, df: pd.DataFrame):
+        self.pending[runner] = self.compute_pool.submit(runner.process, df)
+
+    async def _sleep_until_next_close(self) -> list:
+        """
+        Sleeps until the next timeframe boundary of any config and returns the
+        runners whose candle closes at it.
+        """
+        now = time.time()
+        closes = {}
+        for runner in self.runners:
+            tf_seconds = MarketDataFetcher.timeframe_to_minutes(runner.config.TIMEFRAME) * 60
+            next_close = (int(now) // tf_seconds + 1) * tf_seconds
+            closes.setdefault(next_close, []).append(runner)
+        next_close = min(closes)
+
+        total_sleep = next_close + self.SETTLE_DELAY - now
+        logger.info("---------------------------------------------------")
+        logger.info(f"Sleeping {total_sleep:.0f} seconds until the {len(closes[next_close])} candles closing next...")
+        await asyncio.sleep(total_sleep)
+        return closes[next_close]
+
+    async def _fetch(self, exchange, runner: SymbolRunner, fetch_limiter: asyncio.Semaphore) -> Optional[pd.DataFrame]:
+        pending = self.pending.get(runner)
+        if pending is not None and not pending.done():
+            # Its buffer catches up with a delta fetch on the next boundary
+            logger.warning(f"[{runner.config.SYMBOL} {runner.config.TIMEFRAME}] Previous candle still computing. Skipping.")
+            return None
+        async with fetch_limiter:
+            return await runner.candle_buffer.update_async(exchange)
+
+# ---------- PROCESS MODE ----------
+class SharedCandleRing:
+    """
+    Closed candles of one (symbol, timeframe) in shared memory for the
+    process-mode workers. The ring is mirrored (row i is also written at
+    i + capacity), so the current window is always one contiguous slice that
+    workers wrap in read-only numpy views without copying. Only the main
+    process writes, and only while the symbol's worker is idle.
+    """
+    FIELDS = ['open', 'high', 'low', 'close', 'volume']
+    HEADER = 3  # head, count, last timestamp in ms
+
+    def __init__(self, capacity: int, name: str = None):
+        self.capacity = capacity
+        self.owner = name is None
+        size = 8 * (self.HEADER + 2 * capacity * (1 + len(self.FIELDS)))
+        # Workers are spawned from the main process and share its resource tracker,
+        # so attaching does not hand ownership (or the unlink) to the worker
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+
+        buf = self.shm.buf
+        self.header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=buf)
+        self.timestamps = np.ndarray((2 * capacity,), dtype=np.int64, buffer=buf, offset=8 * self.HEADER)
+        self.values = np.ndarray((2 * capacity, len(self.FIELDS)), dtype=np.float64, buffer=buf,
+                                 offset=8 * (self.HEADER + 2 * capacity))
+        if self.owner:
+            self.header[:] = (0, 0, -1)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def sync(self, df: pd.DataFrame):
+        """
+        Appends the candles of `df` newer than the last one in the ring, or
+        rewrites the ring when `df` does not continue it (first load, gap reload).
+        """
+        timestamps = df["timestamp"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+        values = df[self.FIELDS].to_numpy(dtype=np.float64)
+        _, count, last_ts = self.header
+        known = np.flatnonzero(timestamps == last_ts) if count else []
+        if len(known):
+            start = known[0] + 1
+        else:
+            self.header[:] = (0, 0, -1)
+            start = 0
+        for i in range(max(start, len(timestamps) - self.capacity), len(timestamps)):
+            self._append(timestamps[i], values[i])
+
+    def _append(self, timestamp: int, row: np.ndarray):
+        head, count, _ = self.header
+        if count < self.capacity:
+            pos = (head + count) % self.capacity
+            count += 1
+        else:
+            pos = head
+            head = (head + 1) % self.capacity
+        self.timestamps[pos] = self.timestamps[pos + self.capacity] = timestamp
+        self.values[pos] = self.values[pos + self.capacity] = row
+        self.header[:] = (head, count, timestamp)
+
+    def window(self) -> pd.DataFrame:
+        """
+        The buffered candles as a DataFrame over read-only views of the ring.
+        """
+        head, count, _ = self.header
+        timestamps = self.timestamps[head:head + count].view("datetime64[ms]")
+        values = self.values[head:head + count]
+        columns = {"timestamp": timestamps}
+        for j, field in enumerate(self.FIELDS):
+            columns[field] = values[:, j]
+        for column in columns.values():
+            column.flags.writeable = False
+        return pd.DataFrame(columns, copy=False)
+
+    def close(self):
+        self.header = self.timestamps = self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+# Worker-process state, kept across tasks: a symbol is always sent to the same worker
+_worker_runners = {}
+_worker_rings = {}
+
+def _predict_in_worker(config: StrategyConfig, ring_name: str, capacity: int) -> tuple:
+    """
+    The latest row with its prediction, and the stage timings recorded for it.
+    """
+    key = (config.SYMBOL, config.TIMEFRAME)
+    runner = _worker_runners.get(key)
+    if runner is None:
+        runner = _worker_runners[key] = SymbolRunner(config, trading=False)
+    ring = _worker_rings.get(ring_name)
+    if ring is None:
+        ring = _worker_rings[ring_name] = SharedCandleRing(capacity, name=ring_name)
+    return runner.predict(ring.window()), Metrics.export(runner.label)
+
+class ProcessScheduler(AsyncScheduler):
+    """
+    The async fetch loop, with each symbol's pipeline in a worker process so
+    pandas and the model use every core instead of sharing one GIL. Fetched
+    candles go into a SharedCandleRing per symbol. Symbols are pinned
+    round-robin to single-process executors, so their incremental state stays
+    in one interpreter and a slow symbol only delays the symbols sharing its
+    worker. Predictions come back to the main process, which keeps the Mongo
+    and backend I/O (on the thread pool) and the health endpoint.
+    """
+    def __init__(self, configs: list, workers: int = None):
+        super().__init__(configs)
+        context = multiprocessing.get_context("spawn")
+        workers = workers or min(len(configs), os.cpu_count() or 1)
+        self.workers = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(workers)]
+        self.affinity = {runner: self.workers[i % workers] for i, runner in enumerate(self.runners)}
+        self.rings = {runner: SharedCandleRing(runner.candle_buffer.capacity) for runner in self.runners}
+
+    def run_forever(self):
+        try:
+            super().run_forever()
+        finally:
+            for worker in self.workers:
+                worker.shutdown(cancel_futures=True)
+            for ring in self.rings.values():
+                ring.close()
+
+    def _dispatch(self, runner: SymbolRunner, df: pd.DataFrame):
+        ring = self.rings[runner]
+        ring.sync(df)
+        future = self.affinity[runner].submit(_predict_in_worker, runner.config, ring.name, ring.capacity)
+        self.pending[runner] = future
+        future.add_done_callback(lambda f: self.compute_pool.submit(self._handle_prediction, runner, f))
+
+    def _handle_prediction(self, runner: SymbolRunner, future):
+        try:
+            latest_row, timings = future.result()
+        except Exception as e:
+            logger.error(f"[{runner.config.SYMBOL} {runner.config.TIMEFRAME}] Worker failed: {e}")
+            return
+        Metrics.merge(timings)
+        if latest_row is not None:
+            runner.last_processed_ts = latest_row["timestamp"]
+            runner.handle_signal(latest_row)
+
+# ---------- SHARDING ----------
+class ShardManager:
+    """
+    Spreads the configs over every node running in sharded mode. A shard is
+    one symbol, since trades are stored per symbol.
+    Each shard has a lease document in Mongo: a node owns it until
+    `expires_at` and renews it on every heartbeat. Nodes announce themselves
+    in shard_nodes and hold at most their fair share of the shards, so a
+    joining node is handed shards by the others and a dead node's leases are
+    taken over once they expire. Every acquisition bumps the lease's fencing
+    token, and a runner only trades, and its queued trade writes only run,
+    while its node holds the lease with the token it started under, so a
+    node that missed its heartbeats (paused, cut off from Mongo) cannot
+    trade a symbol another node took over. The check is local: a node
+    trusts a lease until one HEARTBEAT before the expiry it last wrote.
+    Expiry times come from the nodes' clocks, which must agree to well
+    within HEARTBEAT.
+    """
+    LEASE_TTL = 30   # seconds a lease lasts without a renewal
+    HEARTBEAT = 10   # seconds between renewals
+
+    def __init__(self, configs: list, node_id: str = BOT_NODE_ID, mongo_uri: str = MONGO_URI, db_name: str = DB_NAME):
+        self.shards = {}  # symbol -> its configs
+        for conf in configs:
+            self.shards.setdefault(conf.SYMBOL, []).append(conf)
+        self.node_id = node_id
+        self.client = MongoClient(mongo_uri)
+        db = self.client[db_name]
+        self.leases = db["shard_leases"]
+        self.nodes = db["shard_nodes"]
+        self.held = {}     # symbol -> {"token", "valid_until", "stop", "threads"}
+        self.retired = {}  # symbol -> threads of a released shard that have not exited yet
+
+    def run_forever(self, stop: threading.Event = None):
+        atexit.register(self.release_all)
+        stop = stop or threading.Event()
+        try:
+            while True:
+                try:
+                    self.heartbeat()
+                except ConnectionFailure as e:
+                    logger.error(f"Shard heartbeat failed: {e}")
+                if stop.wait(self.HEARTBEAT):
+                    break
+        finally:
+            self.release_all()
+
+    def heartbeat(self):
+        """
+        Renews the held leases, sheds shards beyond this node's share and
+        claims free or expired ones up to it.
+        """
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        self.nodes.update_one({"_id": self.node_id}, {"$set": {"seen_at": now}}, upsert=True)
+        live = self.nodes.count_documents({"seen_at": {"$gt": now - timedelta(seconds=self.LEASE_TTL)}})
+        share = math.ceil(len(self.shards) / max(live, 1))
+
+        for symbol in list(self.held):
+            self._renew(symbol, now, started)
+        self.release(*sorted(self.held)[share:])
+
+        for symbol in self.shards:
+            if len(self.held) >= share:
+                break
+            if symbol in self.held or self._retiring(symbol):
+                continue
+            token = self._acquire(symbol, now)
+            if token is not None:
+                self._start(symbol, token, started)
+
+    def holds(self, symbol: str, token: int) -> bool:
+        """
+        The fence: whether this node still holds `symbol` under `token`.
+        Answered from the last successful renewal, without a Mongo round trip.
+        """
+        lease = self.held.get(symbol)
+        if lease is None or lease["token"] != token:
+            return False
+        return time.monotonic() < lease["valid_until"]
+
+    def release(self, *symbols: str):
+        """
+        Stops the shards' runners, flushes their pending trade writes once for
+        all of them (at most one HEARTBEAT, while their fences still hold) and
+        frees the leases for other nodes.
+        """
+        if not symbols:
+            return
+        for symbol in symbols:
+            self.held[symbol]["stop"].set()
+        if WriteBehindQueue._instance is not None:
+            WriteBehindQueue._instance.flush(self.HEARTBEAT)
+        for symbol in symbols:
+            lease = self._stop(symbol)
+            self.leases.update_one(
+                {"_id": symbol, "owner": self.node_id, "token": lease["token"]},
+                {"$set": {"owner": None, "expires_at": datetime.now(timezone.utc)}}
+            )
+            logger.info(f"[{symbol}] Shard released by {self.node_id}.")
+
+    def release_all(self):
+        try:
+            self.release(*self.held)
+            self.nodes.delete_one({"_id": self.node_id})
+        except ConnectionFailure as e:
+            logger.error(f"Could not release shard leases: {e}")
+
+    def _acquire(self, symbol: str, now: datetime) -> Optional[int]:
+        """
+        Takes the lease if it is free or expired and returns its new token.
+        """
+        expires_at = now + timedelta(seconds=self.LEASE_TTL)
+        lease = self.leases.find_one_and_update(
+            {"_id": symbol, "$or": [{"owner": None}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": self.node_id, "expires_at": expires_at}, "$inc": {"token": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if lease is not None:
+            return lease["token"]
+        try:
+            self.leases.insert_one({"_id": symbol, "owner": self.node_id, "expires_at": expires_at, "token": 1})
+        except DuplicateKeyError:
+            return None  # held by a live node
+        return 1
+
+    def _renew(self, symbol: str, now: datetime, started: float):
+        lease = self.held[symbol]
+        renewed = self.leases.update_one(
+            {"_id": symbol, "owner": self.node_id, "token": lease["token"]},
+            {"$set": {"expires_at": now + timedelta(seconds=self.LEASE_TTL)}}
+        )
+        if renewed.matched_count:
+            lease["valid_until"] = self._valid_until(started)
+        else:
+            logger.warning(f"[{symbol}] Shard lease was taken over by another node.")
+            self._stop(symbol)
+
+    def _valid_until(self, renewed_at: float) -> float:
+        """
+        Monotonic time until which a lease renewed at `renewed_at` is trusted:
+        its expiry less one heartbeat of margin for clock skew between nodes.
+        """
+        return renewed_at + self.LEASE_TTL - self.HEARTBEAT
+
+    def _start(self, symbol: str, token: int, renewed_at: float):
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=run_live_trading, name=f"{conf.collection_name}_{conf.TIMEFRAME}",
+                             args=(conf, stop, lambda: self.holds(symbol, token)), daemon=True)
+            for conf in self.shards[symbol]
+        ]
+        self.held[symbol] = {"token": token, "valid_until": self._valid_until(renewed_at), "stop": stop, "threads": threads}
+        for t in threads:
+            t.start()
+        logger.info(f"[{symbol}] Shard acquired by {self.node_id} (token {token}).")
+
+    def _stop(self, symbol: str) -> dict:
+        lease = self.held.pop(symbol)
+        lease["stop"].set()
+        self.retired[symbol] = lease["threads"]
+        return lease
+
+    def _retiring(self, symbol: str) -> bool:
+        """
+        Whether runners of an earlier lease on this symbol are still sleeping out their candle.
+        """
+        threads = [t for t in self.retired.pop(symbol, []) if t.is_alive()]
+        if threads:
+            self.retired[symbol] = threads
+        return bool(threads)
 
 # ---------- HEALTH CHECK ENDPOINT USING FLASK ----------
 app = Flask(__name__)
@@ -948,23 +4318,52 @@ app = Flask(__name__)
 def health_check():
     return "Bot is Running!", 200
 
+@app.route("/metrics")
+def metrics():
+    """
+    Per-symbol stage latencies (seconds), close-to-signal lag, fetch and
+    notify retry counts and the age of the last traded candle.
+    """
+    snapshot = Metrics.snapshot()
+    if BackendOutbox._instance is not None:
+        snapshot["outbox_pending"] = BackendOutbox._instance.pending()
+    return jsonify(snapshot), 200
+
 # ---------- MAIN ----------
 if __name__ == "__main__":
     # Define the list of coin/timeframe configurations
-    configs = [
-        StrategyConfig(SYMBOL='BTC/USDT', TIMEFRAME='5m'),
-        StrategyConfig(SYMBOL='ETH/USDT', TIMEFRAME='5m'),
-        StrategyConfig(SYMBOL='BNB/USDT', TIMEFRAME='5m'),
-        StrategyConfig(SYMBOL='SOL/USDT', TIMEFRAME='5m'),
-        StrategyConfig(SYMBOL='1000PEPE/USDT', TIMEFRAME='5m')
-    ]
+    configs = build_configs()
 
-    # Start trading bot threads for each configuration (set as daemon threads)
     trading_threads = []
-    for conf in configs:
-        t = threading.Thread(target=run_live_trading, args=(conf,), daemon=True)
+    if BOT_MODE == "async":
+        # One event loop fetching every symbol concurrently at each candle close
+        t = threading.Thread(target=AsyncScheduler(configs).run_forever, daemon=True)
+        t.start()
+        trading_threads.append(t)
+    elif BOT_MODE == "process":
+        # The async fetch loop, with every symbol's pipeline in a worker process
+        t = threading.Thread(target=ProcessScheduler(configs).run_forever, daemon=True)
         t.start()
         trading_threads.append(t)
+    elif BOT_MODE == "stream":
+        # One stream for all configurations, candles are pushed on close
+        t = threading.Thread(target=run_streaming, args=(configs,), daemon=True)
+        t.start()
+        trading_threads.append(t)
+    elif BOT_MODE == "sharded":
+        # This node's share of the configurations, leased in Mongo against the other nodes
+        t = threading.Thread(target=ShardManager(configs).run_forever, daemon=True)
+        t.start()
+        trading_threads.append(t)
+    else:
+        # Start trading bot threads for each configuration (set as daemon threads)
+        for conf in configs:
+            t = threading.Thread(target=run_live_trading, args=(conf,), daemon=True)
+            t.start()
+            trading_threads.append(t)
+
+    # SIGTERM (docker stop, systemd) exits normally, so pending trade writes are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     # Run the Flask app for the health-check endpoint
     app.run(host="0.0.0.0", port=PORT)
@@ -0,0 +1,29 @@
+"""
+Rebuilds the Analysis_<collection> documents from every closed trade.
+
+The bot updates them incrementally on each close; run this after editing
+trades by hand or to check the running totals against a full rescan.
+
+    python rebuild_analysis.py --symbol BTC/USDT ETH/USDT
+"""
+import argparse
+
+from pymongo import MongoClient
+
+from bot import StrategyConfig, TradeAnalysys, logger
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild trade analysis documents with a full rescan.")
+    parser.add_argument("--symbol", nargs="+", required=True, help="Symbols whose analysis to rebuild, e.g. BTC/USDT")
+    args = parser.parse_args()
+
+    for symbol in args.symbol:
+        config = StrategyConfig(SYMBOL=symbol, TIMEFRAME='5m')
+        client = MongoClient(config.mongo_uri)
+        analysis = TradeAnalysys(client[config.db_name], config)
+        before = analysis.analysis_collection.find_one({"analysis_id": 1}, {"accumulator": 1})
+        analysis.analyze_and_store()
+        state = analysis.accumulator.state
+        logger.info(f"[{symbol}] Rebuilt analysis over {state['total_trades']} closed trades.")
+        if before and "accumulator" in before and before["accumulator"]["total_trades"] != state["total_trades"]:
+            logger.warning(f"[{symbol}] Running totals had {before['accumulator']['total_trades']} trades.")
@@ -0,0 +1,572 @@
+"""
+Local stand-ins for the exchange, used to exercise the bot without Bybit.
+
+KlineReplayServer speaks the subset of the Bybit v5 public WebSocket protocol
+the bot uses (subscribe, ping/pong, kline.<interval>.<symbol> and
+publicTrade.<symbol> topics) and replays recorded candles: a few unconfirmed
+updates per candle, then the confirmed one. Trades walk each candle's
+open, low/high and close in between, for the exit monitor. Point the bot at it with
+
+    BOT_MODE=stream EXIT_MONITOR=publicTrade BYBIT_WS_URL=ws://127.0.0.1:8765/v5/public/linear
+
+and serve a pipeline dataset with
+
+    python replay.py --csv ../Others/Data/BTC_1h.csv --symbol BTC/USDT --timeframe 5m
+
+ReplayHarness instead runs the polling loop (run_live_trading) itself in
+virtual time, end to end: a ReplayExchange serves the candles, a
+VirtualClock replaces the candle-close sleeps, the simulations write to
+mongomock (or a given mongod) and trade notifications go through the outbox
+to a local BackendStub. It runs as fast as the CPU allows and reports
+candles per second over all symbols (mongomock comes with
+requirements-dev.txt):
+
+    python replay.py --harness --csv ../Others/Data/BTC_1h.csv ../Others/Data/ETH_1h.csv --candles 1000
+    python replay.py --harness --synthetic 8 --candles 1000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+import bot
+from bot import (
+    BackendOutbox, Clock, ExchangeRegistry, MarketDataFetcher, Metrics, StrategyConfig,
+    TradeAnalysys, WarmupCalculator, WriteBehindQueue, logger, require_unique_symbols, run_live_trading
+)
+
+# ---------- KLINE REPLAY SERVER ----------
+class KlineReplayServer:
+    """
+    Replays candles as Bybit kline messages to every subscribed client.
+    `candles` maps a (symbol, timeframe) pair to an OHLCV DataFrame. One
+    candle of every topic is confirmed each `candle_interval` seconds.
+    With `drop_after` set, all connections are closed once after that many
+    candles so the bot's reconnect and REST resync path can be exercised.
+    """
+    def __init__(self, candles: dict, host: str = "127.0.0.1", port: int = 8765,
+                 candle_interval: float = 1.0, updates_per_candle: int = 2, drop_after: int = None):
+        self.host = host
+        self.port = port
+        self.candle_interval = candle_interval
+        self.updates_per_candle = updates_per_candle
+        self.drop_after = drop_after
+
+        self.topics = {}
+        self.trade_topics = {}  # publicTrade topic -> the kline topic its prices come from
+        for (symbol, timeframe), df in candles.items():
+            interval = MarketDataFetcher.timeframe_to_bybit_interval(timeframe)
+            futures_symbol = MarketDataFetcher.to_futures_symbol(symbol)
+            topic = f"kline.{interval}.{futures_symbol}"
+            tf_ms = MarketDataFetcher.timeframe_to_minutes(timeframe) * 60 * 1000
+            self.topics[topic] = (interval, tf_ms, df.reset_index(drop=True))
+            self.trade_topics.setdefault(f"publicTrade.{futures_symbol}", topic)
+
+        self.subscriptions = {}  # websocket -> set of topics
+        self.position = 0
+        self.finished = threading.Event()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/v5/public/linear"
+
+    def start(self) -> str:
+        """
+        Starts the server on a background thread and returns its URL.
+        """
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.url
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get("/v5/public/linear", self._handle)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self._loop.create_task(self._replay())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.subscriptions[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                request_data = msg.json()
+                op = request_data.get("op")
+                if op == "ping":
+                    await ws.send_json({"success": True, "ret_msg": "pong", "op": "pong"})
+                elif op == "subscribe":
+                    args = request_data.get("args", [])
+                    known = [topic for topic in args if topic in self.topics or topic in self.trade_topics]
+                    unknown = [topic for topic in args if topic not in known]
+                    self.subscriptions[ws].update(known)
+                    await ws.send_json({
+                        "success": not unknown,
+                        "ret_msg": f"unknown topics {unknown}" if unknown else "",
+                        "op": "subscribe"
+                    })
+        finally:
+            self.subscriptions.pop(ws, None)
+        return ws
+
+    async def _replay(self):
+        # Start the clock once somebody listens, so the first candles are not lost
+        while not any(self.subscriptions.values()):
+            await asyncio.sleep(0.01)
+
+        length = max(len(df) for _, _, df in self.topics.values())
+        dropped = False
+        while self.position < length:
+            steps = self.updates_per_candle + 1
+            for step in range(steps):
+                await self._broadcast(step, steps)
+                await asyncio.sleep(self.candle_interval / steps)
+            self.position += 1
+
+            if self.drop_after is not None and not dropped and self.position >= self.drop_after:
+                dropped = True
+                logger.info(f"Replay server dropping all connections after {self.position} candles.")
+                for ws in list(self.subscriptions):
+                    await ws.close()
+        self.finished.set()
+
+    async def _broadcast(self, step: int, steps: int):
+        confirm = step == steps - 1
+        messages = {}
+        for topic, (interval, tf_ms, df) in self.topics.items():
+            if self.position < len(df):
+                messages[topic] = self.kline_message(topic, interval, tf_ms, df.iloc[self.position], confirm)
+        for trade_topic, topic in self.trade_topics.items():
+            _, tf_ms, df = self.topics[topic]
+            if self.position < len(df):
+                message = self.trade_message(trade_topic, tf_ms, df.iloc[self.position], step, steps)
+                if message is not None:
+                    messages[trade_topic] = message
+
+        for topic, message in messages.items():
+            for ws, topics in list(self.subscriptions.items()):
+                if topic in topics and not ws.closed:
+                    await ws.send_json(message)
+
+    @staticmethod
+    def kline_message(topic: str, interval: str, tf_ms: int, row, confirm: bool) -> dict:
+        start = int(pd.Timestamp(row["timestamp"]).value // 1_000_000)
+        now_ms = int(time.time() * 1000)
+        return {
+            "topic": topic,
+            "type": "snapshot",
+            "ts": now_ms,
+            "data": [{
+                "start": start,
+                "end": start + tf_ms - 1,
+                "interval": interval,
+                "open": str(row["open"]),
+                "close": str(row["close"]),
+                "high": str(row["high"]),
+                "low": str(row["low"]),
+                "volume": str(row["volume"]),
+                "turnover": "0",
+                "confirm": confirm,
+                "timestamp": now_ms
+            }]
+        }
+
+    @staticmethod
+    def trade_message(topic: str, tf_ms: int, row, step: int, steps: int) -> dict:
+        """
+        The trades of step `step` of a candle's price path: open, then the
+        extreme against the candle's direction, the other extreme and the close.
+        """
+        if row["close"] >= row["open"]:
+            path = [row["open"], row["low"], row["high"], row["close"]]
+        else:
+            path = [row["open"], row["high"], row["low"], row["close"]]
+        points = [i for i in range(len(path)) if i * steps // len(path) == step]
+        if not points:
+            return None
+        start = int(pd.Timestamp(row["timestamp"]).value // 1_000_000)
+        symbol = topic.split(".", 1)[1]
+        return {
+            "topic": topic,
+            "type": "snapshot",
+            "ts": int(time.time() * 1000),
+            "data": [{
+                "T": start + (tf_ms - 1) * i // (len(path) - 1),
+                "s": symbol,
+                "S": "Buy",
+                "v": "0",
+                "p": str(path[i]),
+                "BT": False
+            } for i in points]
+        }
+
+# ---------- VIRTUAL CLOCK ----------
+class ReplayFinished(Exception):
+    """
+    Raised by VirtualClock.sleep when the wake-up lies past the replayed candles.
+    """
+
+class VirtualClock(Clock):
+    """
+    Discrete-event clock shared by `participants` trading threads. Time only
+    moves once every participant sleeps, and then jumps to the earliest
+    wake-up, so no thread waits real time and each sees the candle closes in
+    the order it would live. A sleep past `end` raises ReplayFinished and the
+    thread stops taking part.
+    """
+    def __init__(self, start: datetime, end: datetime, participants: int):
+        self._now = start
+        self.end = end
+        self.participants = participants
+        self._wakeups = []  # wake-up times of the sleeping participants
+        self._cond = threading.Condition()
+
+    def now(self) -> datetime:
+        with self._cond:
+            return self._now
+
+    def sleep(self, seconds: float):
+        with self._cond:
+            wakeup = self._now + timedelta(seconds=seconds)
+            if wakeup > self.end:
+                self._leave()
+                raise ReplayFinished()
+            self._wakeups.append(wakeup)
+            self._advance()
+            while self._now < wakeup:
+                self._cond.wait()
+            self._wakeups.remove(wakeup)
+
+    def leave(self):
+        """
+        Called by a participant that stops without a final sleep (e.g. it failed).
+        """
+        with self._cond:
+            self._leave()
+
+    def _leave(self):
+        self.participants -= 1
+        self._advance()
+
+    def _advance(self):
+        # Woken participants keep their entry until they run, so stale entries are <= now
+        if self._wakeups and len(self._wakeups) >= self.participants:
+            self._now = max(self._now, min(self._wakeups))
+            self._cond.notify_all()
+
+# ---------- REPLAY EXCHANGE ----------
+class ReplayExchange:
+    """
+    Stand-in for the ccxt client behind ExchangeRegistry. fetch_ohlcv serves
+    the recorded candles opened up to the clock's now, the still-open one
+    included, as Bybit does.
+    """
+    id = "replay"
+    FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, candles: dict, clock: Clock):
+        self.clock = clock
+        self.markets = {}
+        self.requests = 0
+        self.series = {}  # (futures symbol, timeframe) -> (open times in ms, OHLCV rows)
+        for (symbol, timeframe), df in candles.items():
+            timestamps = df["timestamp"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+            self.series[(MarketDataFetcher.to_futures_symbol(symbol), timeframe)] = (
+                timestamps, df[self.FIELDS].to_numpy(dtype=float))
+
+    def load_markets(self, reload: bool = False) -> dict:
+        return self.markets
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: int = None, limit: int = None) -> list:
+        self.requests += 1
+        timestamps, rows = self.series[(symbol, timeframe)]
+        now_ms = int(self.clock.now().timestamp() * 1000)
+        end = int(np.searchsorted(timestamps, now_ms, side='right'))
+        if since is not None:
+            start = int(np.searchsorted(timestamps, since, side='left'))
+            if limit:
+                end = min(end, start + limit)
+        else:
+            start = max(0, end - limit) if limit else 0
+        return [[int(ts), *row] for ts, row in zip(timestamps[start:end], rows[start:end].tolist())]
+
+# ---------- BACKEND STUB ----------
+class BackendStub:
+    """
+    Answers the bot's open_trade and close_trade notifications with 200 and
+    counts them per path.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.received = {}
+        lock = threading.Lock()
+        received = self.received
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with lock:
+                    received[self.path] = received.get(self.path, 0) + 1
+                body = json.dumps({"message": f"Replay backend received {self.path}"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------- REPLAY HARNESS ----------
+class ReplayHarness:
+    """
+    Runs run_live_trading for every (symbol, timeframe) of `candles` in
+    virtual time, one thread each as in the bot. The first LIMIT - 1 candles
+    fill the buffers; every later candle is traded except the last, which the
+    fetcher takes for the still-open one. Series recorded over different
+    dates are shifted in time so their first traded closes coincide. Trades are written
+    to mongomock unless `mongo_uri` is given (its `db_name` is dropped first,
+    so open trades of an earlier run are not resumed).
+    """
+    SETTLE = 30           # seconds of virtual time around the first and last close
+    DRAIN_TIMEOUT = 60    # seconds to wait for pending writes and notifications
+
+    def __init__(self, candles: dict, mongo_uri: str = None, db_name: str = "replay"):
+        self.candles = {key: df.reset_index(drop=True) for key, df in candles.items()}
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self.configs = []
+        for symbol, timeframe in self.candles:
+            config = StrategyConfig(SYMBOL=symbol, TIMEFRAME=timeframe)
+            WarmupCalculator.resolve_limit(config)
+            config.db_name = db_name
+            if mongo_uri:
+                config.mongo_uri = mongo_uri
+            self.configs.append(config)
+        require_unique_symbols(self.configs)
+
+    def _window(self) -> tuple:
+        """
+        Aligns the series and returns the virtual start (just before the
+        close that completes the first full buffer) and end (just after the
+        last close common to every series).
+        """
+        for config in self.configs:
+            df = self.candles[(config.SYMBOL, config.TIMEFRAME)]
+            if len(df) < config.LIMIT:
+                raise ValueError(f"{config.SYMBOL} {config.TIMEFRAME}: {len(df)} candles, LIMIT is {config.LIMIT}.")
+        first_closes = {config: self.candles[(config.SYMBOL, config.TIMEFRAME)]["timestamp"].iloc[config.LIMIT - 1]
+                        for config in self.configs}
+        # The latest first close sits on the boundary of its timeframe, so the
+        # shifted series stay aligned to theirs as long as it is the longest
+        anchor = max(first_closes.values())
+        ends = []
+        for config in self.configs:
+            key = (config.SYMBOL, config.TIMEFRAME)
+            df = self.candles[key].copy()
+            df["timestamp"] += anchor - first_closes[config]
+            self.candles[key] = df
+            tf_delta = pd.Timedelta(minutes=MarketDataFetcher.timeframe_to_minutes(config.TIMEFRAME))
+            ends.append(df["timestamp"].iloc[-1] + tf_delta)
+        settle = timedelta(seconds=self.SETTLE)
+        return (anchor.tz_localize(timezone.utc).to_pydatetime() - settle,
+                min(ends).tz_localize(timezone.utc).to_pydatetime() + settle)
+
+    def _trade(self, clock: VirtualClock, config: StrategyConfig):
+        try:
+            run_live_trading(config)
+        except ReplayFinished:
+            pass
+        except Exception:
+            logger.exception(f"[{config.SYMBOL} {config.TIMEFRAME}] Replay thread failed.")
+            clock.leave()
+
+    def _mongo(self) -> tuple:
+        """
+        The client the simulations will use, and the context that makes them use it.
+        """
+        if self.mongo_uri:
+            client = bot.MongoClient(self.mongo_uri)
+            client.drop_database(self.db_name)
+            return client, contextlib.nullcontext()
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError("The replay harness needs mongomock (pip install -r requirements-dev.txt) or --mongo-uri.")
+        client = mongomock.MongoClient()
+        return client, mock.patch.object(bot, "MongoClient", lambda *args, **kwargs: client)
+
+    def run(self) -> dict:
+        start, end = self._window()
+        clock = VirtualClock(start, end, participants=len(self.configs))
+        exchange = ReplayExchange(self.candles, clock)
+        backend = BackendStub()
+        outbox_dir = tempfile.TemporaryDirectory()
+        previous_clock = Clock.install(clock)
+        previous_outbox = BackendOutbox._instance
+
+        client, use_client = self._mongo()
+        with use_client:
+            try:
+                ExchangeRegistry.register(exchange)
+                BackendOutbox._instance = BackendOutbox(os.path.join(outbox_dir.name, "outbox.sqlite3"), backend.start())
+
+                started = time.perf_counter()
+                threads = [threading.Thread(target=self._trade, args=(clock, config), daemon=True)
+                           for config in self.configs]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                traded = time.perf_counter() - started
+
+                WriteBehindQueue.get().flush(self.DRAIN_TIMEOUT)
+                deadline = time.monotonic() + self.DRAIN_TIMEOUT
+                while BackendOutbox._instance.pending() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                elapsed = time.perf_counter() - started
+                return self._report(client[self.db_name], exchange, backend, traded, elapsed)
+            finally:
+                Clock.install(previous_clock)
+                BackendOutbox._instance = previous_outbox
+                backend.stop()
+                outbox_dir.cleanup()
+
+    def _report(self, db, exchange: ReplayExchange, backend: BackendStub, traded: float, elapsed: float) -> dict:
+        symbols = Metrics.snapshot()["symbols"]
+        rows = []
+        for config in self.configs:
+            label = f"{config.SYMBOL} {config.TIMEFRAME}"
+            stages = symbols.get(label, {}).get("stages", {})
+            analysis = TradeAnalysys(db, config).analysis_collection.find_one({"analysis_id": 1}) or {}
+            rows.append({
+                "symbol": label,
+                "candles": stages.get("handle_signal", {}).get("count", 0),
+                "trades": db[config.collection_name].count_documents({}),
+                "closed_trades": analysis.get("Total Trades", 0),
+                "roi": analysis.get("ROI (%)"),
+                "stage_means": {name: round(stats["mean"], 6) for name, stats in stages.items()
+                                if name != "close_to_signal"}
+            })
+        candles = sum(row["candles"] for row in rows)
+        return {
+            "symbols": rows,
+            "candles": candles,
+            "seconds": round(elapsed, 3),
+            "candles_per_second": candles / traded if traded else 0.0,
+            "exchange_requests": exchange.requests,
+            "backend_requests": dict(backend.received)
+        }
+
+# ---------- MAIN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay pipeline CSVs as a Bybit kline stream, "
+                                                 "or through the trading loop in virtual time (--harness).")
+    parser.add_argument("--csv", nargs="+", default=[], help="Others/Data/{SYMBOL}_{interval}.csv datasets")
+    parser.add_argument("--symbol", help="Symbol the bot subscribes to, e.g. BTC/USDT")
+    parser.add_argument("--timeframe", default="5m", help="Timeframe the bot subscribes to")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between confirmed candles")
+    parser.add_argument("--drop-after", type=int, default=None, help="Drop all connections once after N candles")
+    harness_args = parser.add_argument_group("harness")
+    harness_args.add_argument("--harness", action="store_true", help="Run the trading loop over the candles")
+    harness_args.add_argument("--synthetic", type=int, default=0, help="Add N seeded synthetic 5m symbols")
+    harness_args.add_argument("--seed", type=int, default=7)
+    harness_args.add_argument("--candles", type=int, default=None, help="Trade at most N candles per symbol")
+    harness_args.add_argument("--mongo-uri", default=None, help="mongod to write trades to instead of mongomock")
+    harness_args.add_argument("--db", default="replay", help="Database the harness writes (and drops) on --mongo-uri")
+    harness_args.add_argument("--verbose", action="store_true", help="Keep the pipeline's per-candle logging")
+    args = parser.parse_args()
+
+    if args.harness:
+        from backtest import config_for_csv
+        from benchmark import synthetic_candles
+
+        candles = {}
+        for path in args.csv:
+            config = config_for_csv(path)
+            candles[(config.SYMBOL, config.TIMEFRAME)] = MarketDataFetcher.load_pipeline_csv(path)
+        for i in range(args.synthetic):
+            config = StrategyConfig(SYMBOL=f"SYN{i}/USDT", TIMEFRAME="5m")
+            limit = WarmupCalculator.resolve_limit(config)
+            candles[(config.SYMBOL, config.TIMEFRAME)] = synthetic_candles(
+                limit - 1 + (args.candles or 1000), args.seed + i, config.TIMEFRAME)
+        if not candles:
+            parser.error("--harness needs --csv and/or --synthetic")
+        if args.candles:
+            limit = max(WarmupCalculator.resolve_limit(StrategyConfig(SYMBOL=symbol, TIMEFRAME=timeframe))
+                        for symbol, timeframe in candles)
+            candles = {key: df.iloc[:limit - 1 + args.candles] for key, df in candles.items()}
+
+        try:
+            harness = ReplayHarness(candles, args.mongo_uri, args.db)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.verbose:
+            report = harness.run()
+        else:
+            logging.disable(logging.INFO)
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = harness.run()
+            logging.disable(logging.NOTSET)
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        if len(args.csv) != 1 or not args.symbol:
+            parser.error("Serving a kline stream needs one --csv and --symbol")
+        server = KlineReplayServer(
+            {(args.symbol, args.timeframe): MarketDataFetcher.load_pipeline_csv(args.csv[0])},
+            port=args.port,
+            candle_interval=args.interval,
+            drop_after=args.drop_after
+        )
+        logger.info(f"Replaying {args.csv[0]} on {server.start()}")
+        server.finished.wait()
+        logger.info("Replay finished.")
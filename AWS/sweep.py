@@ -0,0 +1,278 @@
+"""
+Parameter sweeps over StrategyConfig, backtested on the pipeline datasets.
+
+Every point of a grid (or a random sample of a search space) is a set of
+StrategyConfig overrides. Points are grouped by what each backtest stage
+reads: features are computed once per dataset and indicator parameters,
+predictions once per feature group and model parameters, and only the
+trading simulation (milliseconds) runs per point. Prediction groups are
+fanned out over a process pool. Predictions and results are stored under a
+key hashed from the dataset contents and the fields the stage reads, so a
+repeated or extended sweep only computes the points it has not seen. A group
+that raises is logged and its points are written with an error column;
+they are not cached, so the next run retries them.
+
+    python sweep.py --csv ../Others/Data/BTC_1h.csv \\
+        --param stop_atr_multiplier=0.5,0.75,1.0 reward_atr_multiplier=0.5,0.75,1.5 window_size_AI=100,200
+    python sweep.py --csv ../Others/Data/ETH_1h.csv --random 200 --seed 7 \\
+        --param stop_atr_multiplier=0.25:2.0 risk_multiplier=1,1.5,2
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtester, BacktestSimulation, config_for_csv
+from bot import MarketDataFetcher, StrategyConfig, TradeAnalysys, WarmupCalculator, logger
+
+# StrategyConfig fields the feature graph reads
+FEATURE_FIELDS = [
+    'RSI_PERIOD', 'CCI_PERIOD', 'EMA_PERIOD', 'SMA_PERIOD', 'ATR_PERIOD', 'ADX_PERIOD',
+    'WT_CHANNEL_LENGTH', 'WT_ATR_LENGTH', 'EMA_LONG', 'SMA_SHORT', 'LORENTZIAN_FEATURES',
+    'VOLATILITY_WINDOW', 'VOLATILITY_PERCENTILE', 'Lookahead_window'
+]
+# ... plus what labeling and the model read. Every other field only changes the simulation.
+MODEL_FIELDS = FEATURE_FIELDS + [
+    'window_size_AI', 'LIMIT', 'use_logistic_smoothing', 'random_state',
+    'use_numpy_model', 'KNN_BACKEND', 'KNN_METRIC'
+]
+
+# ---------- SEARCH SPACE ----------
+def parse_param(spec: str) -> tuple:
+    """
+    'name=v1,v2,...' is a set of choices, 'name=lo:hi' a uniform range
+    (integers when both ends are). Values are JSON where they parse as JSON.
+    """
+    name, _, values = spec.partition('=')
+    if not values:
+        raise ValueError(f"Expected name=values, got {spec!r}")
+
+    def value(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    if ':' in values:
+        low, high = (value(v) for v in values.split(':', 1))
+        return name, (low, high)
+    return name, [value(v) for v in values.split(',')]
+
+def expand(space: dict, samples: int = None, seed: int = None) -> list:
+    """
+    The grid over `space`, or `samples` random points of it. Ranges are only
+    allowed in random search.
+    """
+    names = list(space)
+    if samples is None:
+        ranges = [name for name in names if isinstance(space[name], tuple)]
+        if ranges:
+            raise ValueError(f"Ranges need --random: {ranges}")
+        return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+    rng = random.Random(seed)
+    points = []
+    seen = set()
+    for _ in range(samples * 10):
+        if len(points) == samples:
+            break
+        point = {}
+        for name in names:
+            choices = space[name]
+            if isinstance(choices, list):
+                point[name] = rng.choice(choices)
+            elif all(isinstance(end, int) for end in choices):
+                point[name] = rng.randint(*choices)
+            else:
+                point[name] = rng.uniform(*choices)
+        key = json.dumps(point, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            points.append(point)
+    return points
+
+def make_config(symbol: str, timeframe: str, params: dict) -> StrategyConfig:
+    config = StrategyConfig(SYMBOL=symbol, TIMEFRAME=timeframe)
+    for name, value in params.items():
+        if not hasattr(config, name):
+            raise ValueError(f"StrategyConfig has no field {name!r}")
+        setattr(config, name, value)
+    if 'reward_to_risk_ratio' not in params:
+        config.reward_to_risk_ratio = config.reward_atr_multiplier / config.stop_atr_multiplier
+    if config.LIMIT is None:
+        config.LIMIT = WarmupCalculator.required_limit(config)
+    return config
+
+# ---------- RESULT CACHE ----------
+class SweepCache:
+    """
+    Content-addressed store for predictions (.npy) and results (.json).
+    A key hashes the dataset contents and the config fields the stage reads.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "predictions"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "results"), exist_ok=True)
+
+    @staticmethod
+    def key(dataset: str, config: StrategyConfig, fields: list = None) -> str:
+        if fields is None:
+            fields = [name for name, value in vars(config).items()
+                      if isinstance(value, (int, float, str, bool, list)) and name not in ("mongo_uri", "db_name")]
+        params = {name: getattr(config, name) for name in fields}
+        return hashlib.sha1(json.dumps([dataset, params], sort_keys=True).encode()).hexdigest()
+
+    def _path(self, kind: str, key: str, ext: str) -> str:
+        return os.path.join(self.directory, kind, f"{key}{ext}")
+
+    def _write(self, path: str, write):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def load_predictions(self, key: str):
+        path = self._path("predictions", key, ".npy")
+        return np.load(path) if os.path.exists(path) else None
+
+    def save_predictions(self, key: str, predictions: np.ndarray):
+        self._write(self._path("predictions", key, ".npy"), lambda f: np.save(f, predictions))
+
+    def load_result(self, key: str):
+        path = self._path("results", key, ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_result(self, key: str, result: dict):
+        self._write(self._path("results", key, ".json"), lambda f: f.write(json.dumps(result).encode()))
+
+# ---------- SWEEP ----------
+def dataset_id(path: str, start: str = None, end: str = None) -> str:
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return f"{digest}:{start}:{end}"
+
+def evaluate_group(features: pd.DataFrame, configs: list, dataset: str, cache_dir: str) -> list:
+    """
+    Runs in a worker: predictions for one dataset and model group (from the
+    cache when present), then one simulation per config.
+    """
+    cache = SweepCache(cache_dir)
+    prediction_key = SweepCache.key(dataset, configs[0], MODEL_FIELDS)
+    predictions = cache.load_predictions(prediction_key)
+    if predictions is None:
+        predictions = Backtester(configs[0], features).predictions(features)
+        cache.save_predictions(prediction_key, predictions)
+
+    results = []
+    for config in configs:
+        simulation = BacktestSimulation(config)
+        simulation.run(features, predictions)
+        result = TradeAnalysys.compute_metrics(simulation.closed_trades(), config)
+        cache.save_result(SweepCache.key(dataset, config), result)
+        results.append(result)
+    return results
+
+def sweep(paths: list, points: list, workers: int = None, cache_dir: str = "sweep_cache",
+          start: str = None, end: str = None) -> pd.DataFrame:
+    cache = SweepCache(cache_dir)
+    rows = []
+    tasks = []
+
+    for path in paths:
+        base = config_for_csv(path)
+        dataset = dataset_id(path, start, end)
+        configs = [make_config(base.SYMBOL, base.TIMEFRAME, params) for params in points]
+
+        pending = {}
+        cached = 0
+        for params, config in zip(points, configs):
+            row = {"dataset": os.path.basename(path), **params}
+            result = cache.load_result(SweepCache.key(dataset, config))
+            if result is not None:
+                rows.append({**row, **result})
+                cached += 1
+                continue
+            feature_key = SweepCache.key(dataset, config, FEATURE_FIELDS)
+            model_key = SweepCache.key(dataset, config, MODEL_FIELDS)
+            pending.setdefault(feature_key, {}).setdefault(model_key, []).append((row, config))
+        logger.info(f"{os.path.basename(path)}: {cached} of {len(points)} points cached, "
+                    f"{sum(len(groups) for groups in pending.values())} prediction groups to run.")
+        if not pending:
+            continue
+
+        candles = MarketDataFetcher.load_pipeline_csv(path)
+        if start:
+            candles = candles[candles['timestamp'] >= pd.Timestamp(start)]
+        if end:
+            candles = candles[candles['timestamp'] < pd.Timestamp(end)]
+        candles = candles.reset_index(drop=True)
+
+        for model_groups in pending.values():
+            # Indicator columns are shared by every model group with these indicator params
+            first_config = next(iter(model_groups.values()))[0][1]
+            features = Backtester(first_config, candles).features()
+            for group in model_groups.values():
+                tasks.append((features, group, dataset))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(evaluate_group, features, [config for _, config in group], dataset, cache_dir): group
+            for features, group, dataset in tasks
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            group = futures[future]
+            try:
+                group_results = future.result()
+            except Exception as e:
+                # One failing group must not throw away the rest of an unattended sweep
+                logger.error(f"Prediction group {done}/{len(tasks)} failed ({len(group)} points): {e!r}")
+                rows.extend({**row, "error": repr(e)} for row, _ in group)
+                continue
+            for (row, _), result in zip(group, group_results):
+                rows.append({**row, **result})
+            logger.info(f"Prediction group {done}/{len(tasks)} done ({time.perf_counter() - started:.0f}s).")
+
+    results = pd.DataFrame(rows)
+    if "ROI (%)" in results:
+        results.sort_values("ROI (%)", ascending=False, inplace=True, ignore_index=True)
+    return results
+
+# ---------- MAIN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep StrategyConfig parameters with backtests.")
+    parser.add_argument("--csv", nargs="+", required=True, help="Others/Data/{SYMBOL}_{interval}.csv datasets")
+    parser.add_argument("--param", nargs="+", required=True,
+                        help="name=v1,v2,... choices or name=lo:hi ranges (random search only)")
+    parser.add_argument("--random", type=int, default=None, help="Sample N random points instead of the full grid")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--start", default=None, help="First candle to load, e.g. 2024-01-01")
+    parser.add_argument("--end", default=None, help="Load candles before this date")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--cache", default="sweep_cache", help="Directory of cached predictions and results")
+    parser.add_argument("--out", default="sweep_results.csv")
+    parser.add_argument("--top", type=int, default=10, help="Rows to print")
+    args = parser.parse_args()
+
+    try:
+        space = dict(parse_param(spec) for spec in args.param)
+        points = expand(space, args.random, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = sweep(args.csv, points, args.workers, args.cache, args.start, args.end)
+    results.to_csv(args.out, index=False)
+    logger.info(f"{len(results)} results written to {args.out}")
+    if "error" in results:
+        logger.warning(f"{results['error'].notna().sum()} points failed; see the error column.")
+    print(results.head(args.top).to_string())
@@ -0,0 +1,10 @@
+"""
+benchmark() sizes shorter than a live window.
+"""
+from benchmark import WINDOW_STAGES, benchmark
+
+def test_short_sizes_skip_the_window_stages():
+    results = benchmark([500], ["indicators"] + WINDOW_STAGES, repeat=1)
+
+    assert list(results["500"]) == ["indicators"]
+    assert results["500"]["indicators"]["seconds"] > 0
@@ -0,0 +1,135 @@
+"""
+NumpyScaler, NumpyKNN and NumpyLogistic against the sklearn estimators they
+replace, and the recall of the approximate neighbor index.
+"""
+import os
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+
+from benchmark import synthetic_candles
+from bot import (
+    AIModel, BruteIndex, CandelLabeling, FeatureGraph, IVFIndex, MarketDataFetcher, NumpyKNN, NumpyLogistic,
+    NumpyScaler, StrategyConfig, logger
+)
+from test_predictions import DATA_DIR
+
+def training_window(n_classes: int = 3, n: int = 200, seed: int = 11):
+    """
+    Features on very different scales (price, volume, oscillators), one
+    constant column, and labels loosely tied to the first two features.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(60000, 800, n),
+        rng.lognormal(20, 1, n),
+        rng.uniform(0, 100, n),
+        rng.normal(0, 120, n),
+        np.full(n, 7.0),
+        rng.normal(0, 1, (n, 6)),
+    ])
+    score = (X[:, 0] - 60000) / 800 + X[:, 5] + rng.normal(0, 1, n)
+    y = np.digitize(score, np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1])) - (n_classes == 3)
+    return X[:-1], y[:-1], X[-1:]
+
+def test_scaler_matches_standard_scaler():
+    X, _, X_test = training_window()
+    numpy_scaler, sklearn_scaler = NumpyScaler(), StandardScaler()
+
+    np.testing.assert_allclose(numpy_scaler.fit_transform(X), sklearn_scaler.fit_transform(X), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(numpy_scaler.scale_, sklearn_scaler.scale_, rtol=1e-12)
+    np.testing.assert_allclose(numpy_scaler.transform(X_test), sklearn_scaler.transform(X_test), rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("algorithm", ["brute", "tree"])
+@pytest.mark.parametrize("k", [1, 7, 14])
+def test_knn_matches_kneighbors_classifier(algorithm, k):
+    X, y, X_test = training_window()
+    X = StandardScaler().fit_transform(X)
+    queries = np.vstack([X, X_test])
+
+    numpy_knn = NumpyKNN(k, algorithm=algorithm).fit(X, y)
+    sklearn_knn = KNeighborsClassifier(n_neighbors=k).fit(X, y)
+
+    np.testing.assert_array_equal(numpy_knn.classes_, sklearn_knn.classes_)
+    np.testing.assert_allclose(numpy_knn.predict_proba(queries), sklearn_knn.predict_proba(queries))
+    np.testing.assert_array_equal(numpy_knn.predict(queries), sklearn_knn.predict(queries))
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_logistic_matches_logistic_regression(n_classes):
+    X, y, X_test = training_window(n_classes)
+    X = StandardScaler().fit_transform(X)
+
+    numpy_lr = NumpyLogistic().fit(X, y)
+    sklearn_lr = LogisticRegression(random_state=42, tol=1e-10, max_iter=1000).fit(X, y)
+
+    numpy_scores = numpy_lr.decision_function(X)
+    sklearn_scores = sklearn_lr.decision_function(X).reshape(len(X), -1)
+    # Multinomial scores are only defined up to a shift shared by the classes
+    if n_classes > 2:
+        numpy_scores = numpy_scores - numpy_scores.mean(axis=1, keepdims=True)
+        sklearn_scores = sklearn_scores - sklearn_scores.mean(axis=1, keepdims=True)
+    np.testing.assert_allclose(numpy_scores, sklearn_scores, atol=1e-5)
+    np.testing.assert_array_equal(numpy_lr.predict(X), sklearn_lr.predict(X))
+
+def test_model_predictions_match_sklearn_on_btc_windows():
+    """
+    The whole AIModel fit (scale -> KNN -> logistic smoothing) with each
+    backend on consecutive BTC_1h training windows.
+    """
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    candles = MarketDataFetcher.load_pipeline_csv(os.path.join(DATA_DIR, "BTC_1h.csv")).iloc[-1500:]
+    features = FeatureGraph.for_config(config).compute(candles.copy()).reset_index(drop=True)
+    features = CandelLabeling.label_candles(features, config)
+    X = features[AIModel.FEATURES].to_numpy()
+    y = features['Candle_Label'].to_numpy()
+    window = config.window_size_AI
+
+    numpy_model = AIModel(config, connect_db=False)
+    config_sklearn = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    config_sklearn.use_numpy_model = False
+    sklearn_model = AIModel(config_sklearn, connect_db=False)
+
+    for t in range(len(X) - 100, len(X)):
+        k = int(features['Lookahead_Period'].iloc[t - window:t].mean())
+        args = (X[t - window:t], y[t - window:t], X[t:t + 1], k)
+        assert numpy_model.fit_predict(*args) == sklearn_model.fit_predict(*args), f"row {t}"
+
+@pytest.fixture(scope="module")
+def scaled_features():
+    """
+    Scaled model features of the BTC_1h dataset and of 8k synthetic candles.
+    """
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    datasets = {
+        "BTC_1h": MarketDataFetcher.load_pipeline_csv(os.path.join(DATA_DIR, "BTC_1h.csv")),
+        "synthetic": synthetic_candles(8600, 5, "1h"),
+    }
+    return {
+        name: NumpyScaler().fit_transform(
+            FeatureGraph.for_config(config).compute(candles.copy())[AIModel.FEATURES].to_numpy())
+        for name, candles in datasets.items()
+    }
+
+@pytest.mark.parametrize("dataset", ["BTC_1h", "synthetic"])
+@pytest.mark.parametrize("metric", ["euclidean", "lorentzian"])
+def test_approx_index_recall(scaled_features, dataset, metric):
+    X = scaled_features[dataset]
+    train, queries = X[:-300], X[-300:]
+    k = 10
+
+    exact = BruteIndex(metric).fit(train).query(queries, k)
+    approx = IVFIndex(metric).fit(train).query(queries, k)
+
+    recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)])
+    assert recall >= 0.95
+
+def test_auto_logs_the_switch_to_approx(caplog):
+    X, y, _ = training_window(n=NumpyKNN.BRUTE_MAX_ROWS + 2)
+    knn = NumpyKNN(7, metric='lorentzian')
+    with caplog.at_level("INFO", logger=logger.name):
+        knn.fit(StandardScaler().fit_transform(X), y)
+    assert knn.algorithm_ == 'approx'
+    assert "approximate IVF index" in caplog.text
@@ -0,0 +1,128 @@
+"""
+BackendOutbox against a local backend stub: which answers are retried, lane
+ordering, and delivery of events left pending by a previous run.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bot import BackendOutbox
+
+class ScriptedBackend:
+    """
+    Records every request as (path, Idempotency-Key, payload, arrival time) and
+    answers with `respond(path, payload, attempt)` -> (status, seconds to wait),
+    where `attempt` counts the requests seen for that key.
+    """
+    def __init__(self, respond=lambda path, payload, attempt: (200, 0)):
+        self.respond = respond
+        self.requests = []
+        lock = threading.Lock()
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                key = self.headers.get("Idempotency-Key")
+                with lock:
+                    attempt = sum(1 for request in backend.requests if request[1] == key)
+                    backend.requests.append((self.path, key, payload, time.monotonic()))
+                status, delay = backend.respond(self.path, payload, attempt)
+                time.sleep(delay)
+                body = json.dumps({"message": f"stub answered {status}"}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def keys(self) -> list:
+        return [key for _, key, _, _ in self.requests]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def backend():
+    backend = ScriptedBackend()
+    yield backend
+    backend.stop()
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(BackendOutbox, "MAX_BACKOFF", 0.01)
+
+def drained(outbox: BackendOutbox, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while outbox.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return outbox.pending() == 0
+
+def open_event(n: int) -> tuple:
+    return "/opentrades/open_trade", {"symbol": "BTC/USDT", "n": n}, f"trade-{n}:open"
+
+@pytest.mark.parametrize("status", [500, 503, 408, 429])
+def test_transient_answers_are_retried(tmp_path, backend, status):
+    backend.respond = lambda path, payload, attempt: (status if attempt == 0 else 200, 0)
+    outbox = BackendOutbox(str(tmp_path / "outbox.sqlite3"), backend.url)
+
+    outbox.enqueue("BTC/USDT 1h", *open_event(1))
+
+    assert drained(outbox)
+    assert backend.keys() == ["trade-1:open", "trade-1:open"]
+
+@pytest.mark.parametrize("status", [200, 400, 404])
+def test_final_answers_complete_the_event(tmp_path, backend, status):
+    backend.respond = lambda path, payload, attempt: (status, 0)
+    outbox = BackendOutbox(str(tmp_path / "outbox.sqlite3"), backend.url)
+
+    outbox.enqueue("BTC/USDT 1h", *open_event(1))
+
+    assert drained(outbox)
+    time.sleep(0.1)
+    assert backend.keys() == ["trade-1:open"]
+
+def test_lane_order_and_lane_independence(tmp_path, backend):
+    # The first BTC event is slow; the ETH lane must not wait for it
+    backend.respond = lambda path, payload, attempt: (200, 0.5 if payload["n"] == 1 else 0)
+    outbox = BackendOutbox(str(tmp_path / "outbox.sqlite3"), backend.url)
+
+    outbox.enqueue("BTC/USDT 1h", *open_event(1))
+    outbox.enqueue("BTC/USDT 1h", "/closetrades/close_trade", {"symbol": "BTC/USDT", "n": 2}, "trade-1:close")
+    outbox.enqueue("ETH/USDT 1h", "/opentrades/open_trade", {"symbol": "ETH/USDT", "n": 3}, "trade-3:open")
+
+    assert drained(outbox)
+    arrivals = {key: arrived for _, key, _, arrived in backend.requests}
+    assert arrivals["trade-1:open"] < arrivals["trade-1:close"]
+    # The close was only sent once the slow open had been answered
+    assert arrivals["trade-1:close"] - arrivals["trade-1:open"] >= 0.5
+    assert arrivals["trade-3:open"] < arrivals["trade-1:open"] + 0.5
+
+def test_pending_events_are_delivered_after_a_restart(tmp_path, backend):
+    path = str(tmp_path / "outbox.sqlite3")
+    crashed = BackendOutbox(path, backend.url)
+    crashed._wake = lambda lane: None  # the process dies before delivering anything
+    for n in range(3):
+        crashed.enqueue("BTC/USDT 1h", *open_event(n))
+    crashed.enqueue("BTC/USDT 1h", *open_event(0))  # a repeated key is stored once
+    assert crashed.pending() == 3 and backend.requests == []
+
+    restarted = BackendOutbox(path, backend.url)
+
+    assert drained(restarted)
+    assert backend.keys() == ["trade-0:open", "trade-1:open", "trade-2:open"]
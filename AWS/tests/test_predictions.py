@@ -0,0 +1,30 @@
+"""
+The live pipeline against predictions recorded from the original one
+(sequential feature stages, sklearn scaler/KNN/logistic, LIMIT=1001) on the
+last 400 BTC_1h candles of Others/Data.
+"""
+import json
+import os
+
+from bot import MarketDataFetcher, StrategyConfig, SymbolRunner
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "Others", "Data")
+BASELINE = os.path.join(os.path.dirname(__file__), "data", "BTC_1h_baseline_predictions.json")
+
+def live_predictions(config: StrategyConfig, candles, count: int) -> dict:
+    runner = SymbolRunner(config, trading=False)
+    capacity = runner.candle_buffer.capacity
+    predictions = {}
+    for end in range(len(candles) - count + 1, len(candles) + 1):
+        row = runner.predict(candles.iloc[end - capacity:end].reset_index(drop=True))
+        predictions[str(row["timestamp"])] = float(row["prediction"])
+    return predictions
+
+def test_default_config_matches_baseline_predictions():
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    candles = MarketDataFetcher.load_pipeline_csv(os.path.join(DATA_DIR, "BTC_1h.csv"))
+
+    predictions = live_predictions(StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h"), candles, len(baseline))
+
+    assert predictions == baseline
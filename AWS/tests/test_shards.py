@@ -0,0 +1,118 @@
+"""
+ShardManager leases over mongomock: acquisition up to the fair share,
+takeover of a dead node's expired leases, the fence, and the trade writes
+it gates. Heartbeats are driven by hand; runners just wait to be stopped.
+"""
+import threading
+import time
+
+import pytest
+
+from bot import ShardManager, StrategyConfig, WriteBehindQueue
+
+mongomock = pytest.importorskip("mongomock")
+
+SYMBOLS = ["BTC/USDT", "ETH/USDT", "SOL/USDT", "BNB/USDT"]
+
+@pytest.fixture
+def node(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr("bot.MongoClient", lambda *args, **kwargs: client)
+    monkeypatch.setattr("bot.run_live_trading", lambda config, stop, fence: stop.wait())
+    monkeypatch.setattr(ShardManager, "LEASE_TTL", 0.5)
+    monkeypatch.setattr(ShardManager, "HEARTBEAT", 0.1)
+    configs = [StrategyConfig(SYMBOL=symbol, TIMEFRAME="1h") for symbol in SYMBOLS]
+    nodes = []
+
+    def start(node_id: str) -> ShardManager:
+        nodes.append(ShardManager(configs, node_id))
+        return nodes[-1]
+
+    yield start
+    for manager in nodes:
+        manager.release_all()
+
+def tokens(manager: ShardManager) -> dict:
+    return {symbol: lease["token"] for symbol, lease in manager.held.items()}
+
+def test_shards_are_split_by_fair_share(node, monkeypatch):
+    a, b = node("A"), node("B")
+    writer = WriteBehindQueue.get()
+    flushes = []
+    monkeypatch.setattr(writer, "flush", lambda timeout=None: flushes.append(timeout) or True)
+
+    a.heartbeat()
+    assert sorted(a.held) == sorted(SYMBOLS)
+    b.heartbeat()  # everything is leased to a live node
+    assert b.held == {}
+    a.heartbeat()  # two live nodes: A sheds half
+    b.heartbeat()
+
+    # One bounded flush for both shed shards
+    assert flushes == [ShardManager.HEARTBEAT]
+    assert len(a.held) == len(b.held) == 2
+    assert sorted([*a.held, *b.held]) == sorted(SYMBOLS)
+    # A released its leases, so B's acquisition bumped their token
+    assert set(tokens(b).values()) == {2}
+
+def test_dead_nodes_leases_are_taken_over_after_expiry(node):
+    a, b = node("A"), node("B")
+    a.heartbeat()
+    held_by_a = tokens(a)
+    b.heartbeat()
+    assert b.held == {}
+
+    time.sleep(ShardManager.LEASE_TTL)  # A misses its heartbeats
+    b.heartbeat()
+
+    assert tokens(b) == {symbol: token + 1 for symbol, token in held_by_a.items()}
+    # A's fences closed before B could take the leases...
+    assert not any(a.holds(symbol, token) for symbol, token in held_by_a.items())
+    # ...and A's next heartbeat finds them gone
+    a.heartbeat()
+    assert a.held == {}
+
+def test_fence_checks_token_and_expiry(node):
+    a = node("A")
+    a.heartbeat()
+    symbol, token = next(iter(tokens(a).items()))
+
+    assert a.holds(symbol, token)
+    assert not a.holds(symbol, token + 1)
+    assert not a.holds("XRP/USDT", token)
+
+    time.sleep(ShardManager.LEASE_TTL - ShardManager.HEARTBEAT)
+    assert not a.holds(symbol, token)
+    a.heartbeat()  # renewed
+    assert a.holds(symbol, token)
+
+def test_writes_of_a_lost_lease_are_dropped():
+    writer = WriteBehindQueue.get()
+    written = []
+
+    writer.submit(written.append, "lost", fence=lambda: False)
+    writer.submit(written.append, "held", fence=lambda: True)
+    writer.submit(written.append, "unfenced")
+    assert writer.flush(5)
+
+    assert written == ["held", "unfenced"]
+
+def test_shed_shards_flush_their_writes_before_the_fence_closes(node):
+    a = node("A")
+    a.heartbeat()
+    symbol, token = next(iter(tokens(a).items()))
+    written = []
+    started = threading.Event()
+
+    def slow_write():
+        started.set()
+        time.sleep(0.05)
+    WriteBehindQueue.get().submit(slow_write)
+    assert started.wait(5)
+    # Queued behind the slow write while the lease is held
+    WriteBehindQueue.get().submit(written.append, symbol, fence=lambda: a.holds(symbol, token))
+
+    a.release(symbol)
+
+    assert written == [symbol]
+    assert not a.holds(symbol, token)
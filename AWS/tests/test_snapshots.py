@@ -0,0 +1,76 @@
+"""
+SnapshotStore round trips: a runner restored from a snapshot predicts what
+the one that took it does, and a snapshot naming any other class is refused.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from bot import (
+    CandleBuffer, Clock, MarketDataFetcher, SnapshotStore, StrategyConfig, SymbolRunner, WriteBehindQueue
+)
+from test_predictions import DATA_DIR
+
+class FixedClock(Clock):
+    def __init__(self, now):
+        self._now = now
+
+    def now(self):
+        return self._now
+
+@pytest.fixture
+def candles():
+    return MarketDataFetcher.load_pipeline_csv(os.path.join(DATA_DIR, "BTC_1h.csv"))
+
+@pytest.mark.parametrize("kind", ["disk", "mongo"])
+@pytest.mark.parametrize("incremental", [False, True])
+def test_restored_runner_predicts_like_the_original(candles, tmp_path, monkeypatch, kind, incremental):
+    if kind == "mongo":
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+        monkeypatch.setattr("bot.MongoClient", lambda *args, **kwargs: client)
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    config.use_incremental_model = incremental
+    original = SymbolRunner(config, trading=False)
+    capacity = original.candle_buffer.capacity
+    split = len(candles) - 20
+
+    for end in range(split - 5, split):
+        original.predict(original.candle_buffer.replace(candles.iloc[end - capacity:end]))
+    store = SnapshotStore(config, kind, str(tmp_path))
+    store.save(original.last_processed_ts, original.snapshot_state())
+    assert WriteBehindQueue.get().flush(30)
+
+    CandleBuffer._buffers.clear()
+    restored = SymbolRunner(config, trading=False)
+    restored.snapshots = store
+    previous = Clock.install(FixedClock(candles["timestamp"].iloc[split].tz_localize("UTC").to_pydatetime()))
+    try:
+        restored.restore_snapshot()
+    finally:
+        Clock.install(previous)
+    assert restored.last_processed_ts == original.last_processed_ts
+
+    for end in range(split, len(candles) + 1):
+        window = candles.iloc[end - capacity:end]
+        expected = original.predict(original.candle_buffer.replace(window))
+        actual = restored.predict(restored.candle_buffer.replace(window))
+        assert actual["prediction"] == expected["prediction"]
+        np.testing.assert_array_equal(np.array(restored.indicator_state.values), np.array(original.indicator_state.values))
+
+def test_snapshot_naming_another_class_is_refused(tmp_path):
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    store = SnapshotStore(config, "disk", str(tmp_path))
+    header = {"version": SnapshotStore.VERSION, "fingerprint": store.fingerprint, "last_ts": "2024-01-01",
+              "state": {"__object__": "Popen", "fields": {"__dict__": [["args", "touch pwned"]]}}}
+    with open(store.path, "wb") as f:
+        np.savez(f, header=np.array(json.dumps(header)))
+
+    assert store.load() is None
+    assert not os.path.exists("pwned")
+
+def test_unsupported_values_are_not_snapshotted():
+    with pytest.raises(TypeError):
+        SnapshotStore.encode({"callback": print}, {})
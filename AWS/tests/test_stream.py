@@ -0,0 +1,109 @@
+"""
+BybitStream against the local KlineReplayServer: after the server drops the
+connection the stream reconnects, subscribes again and its reconnect
+callback backfills the candles it missed over REST, as in run_streaming.
+"""
+import asyncio
+import contextlib
+import socket
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from benchmark import synthetic_candles
+from bot import BybitStream, CandleBuffer, Clock, ExchangeRegistry, closed_klines
+from replay import KlineReplayServer, ReplayExchange
+
+CANDLES = 12
+DROP_AFTER = 4
+
+class ServerClock(Clock):
+    """
+    Puts "now" at the close of the candle the server is replaying, so REST
+    serves every candle the stream has confirmed.
+    """
+    def __init__(self, server: KlineReplayServer, timestamps: pd.Series, tf_delta: pd.Timedelta):
+        self.server = server
+        self.timestamps = timestamps
+        self.tf_delta = tf_delta
+
+    def now(self):
+        position = min(self.server.position, len(self.timestamps) - 1)
+        return (self.timestamps.iloc[position] + self.tf_delta).tz_localize("UTC").to_pydatetime()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextlib.contextmanager
+def running(stream: BybitStream):
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(stream._run())
+
+    def run():
+        with contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(task)
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(5)
+
+def test_stream_reconnects_resubscribes_and_backfills():
+    candles = synthetic_candles(CANDLES, 3, "5m")
+    server = KlineReplayServer({("BTC/USDT", "5m"): candles}, port=free_port(),
+                               candle_interval=0.2, updates_per_candle=1, drop_after=DROP_AFTER)
+    buffer = CandleBuffer("BTC/USDT", "5m", CANDLES + 1)
+    previous_clock = Clock.install(ServerClock(server, candles["timestamp"], buffer.tf_delta))
+    previous_exchange = ExchangeRegistry._clients.get(("bybit", "linear"))
+    ExchangeRegistry.register(ReplayExchange({("BTC/USDT", "5m"): candles}, Clock.current))
+
+    streamed, backfilled = [], []
+
+    def on_kline(message):
+        # SymbolRunner.on_closed_candle without the pipeline
+        candle = closed_klines(message)
+        if candle is None:
+            return
+        streamed.extend(candle["timestamp"])
+        if buffer.last_ts is None or not buffer.append(candle):
+            buffer.update()
+
+    def on_reconnect():
+        buffer.update()
+        backfilled.append(buffer.last_ts)
+
+    stream = BybitStream(server.start())
+    stream.subscribe("kline.5.BTCUSDT", on_kline)
+    stream.on_reconnect(on_reconnect)
+    try:
+        with running(stream):
+            assert server.finished.wait(30)
+            time.sleep(0.2)
+    finally:
+        server.stop()
+        Clock.install(previous_clock)
+        if previous_exchange is None:
+            ExchangeRegistry._clients.pop(("bybit", "linear"), None)
+        else:
+            ExchangeRegistry._clients[("bybit", "linear")] = previous_exchange
+
+    expected = list(candles["timestamp"])
+    assert len(backfilled) == 1
+    # Candles confirmed while the stream was down never reached it...
+    missed = [ts for ts in expected if ts not in streamed]
+    assert missed and min(missed) >= expected[DROP_AFTER]
+    # ...the reconnect callback fetched them over REST...
+    assert backfilled[0] >= max(missed)
+    # ...and candles kept arriving after the reconnect, so it subscribed again
+    assert streamed[-1] == expected[-1]
+    assert list(buffer.df["timestamp"]) == expected
@@ -0,0 +1,115 @@
+"""
+TradingSimulation's in-memory trade state and the WriteBehindQueue behind it:
+what a restart resumes from Mongo, retried writes and the flush at exit.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from pymongo.errors import AutoReconnect
+
+import bot
+from bot import StrategyConfig, TradingSimulation, WriteBehindQueue
+
+mongomock = pytest.importorskip("mongomock")
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr("bot.MongoClient", lambda *args, **kwargs: client)
+    # Keep trade notifications out of the backend outbox
+    monkeypatch.setattr("bot.user_trade_open", lambda *args, **kwargs: None)
+    monkeypatch.setattr("bot.user_trade_close", lambda *args, **kwargs: None)
+    monkeypatch.setattr(WriteBehindQueue, "MAX_BACKOFF", 0.01)
+    return client
+
+@pytest.fixture
+def config(db):
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    config.db_name = "trading_simulation_test"
+    return config
+
+def closed_trade(status: str, investment: float, exit_time: datetime) -> dict:
+    return {"symbol": "BTC/USDT", "direction": "LONG", "status": status,
+            "investment_per_trade": investment, "exit_time": exit_time}
+
+def signal_row(prediction: int = 1, close: float = 100.0, timestamp: str = "2024-01-01 00:00") -> pd.Series:
+    return pd.Series({"timestamp": pd.Timestamp(timestamp), "prediction": prediction,
+                      "close": close, "high": close, "low": close, "ATR": 2.0})
+
+@pytest.mark.parametrize("history, expected", [
+    ([], "base"),
+    ([("TP", 3.0)], "base"),
+    ([("SL", 3.0)], "doubled"),
+    # Only the latest close counts
+    ([("SL", 3.0), ("TP", 1.5)], "base"),
+    ([("TP", 1.5), ("SL", 3.0)], "doubled"),
+])
+def test_restart_resumes_risk_from_the_last_close(db, config, history, expected):
+    trades = db[config.db_name][config.collection_name]
+    start = datetime(2024, 1, 1)
+    for i, (status, investment) in enumerate(history):
+        trades.insert_one(closed_trade(status, investment, start + timedelta(hours=i)))
+
+    simulation = TradingSimulation(config)
+
+    if expected == "base":
+        assert simulation.current_risk_percent == config.risk_per_trade
+    else:
+        # After an SL the next trade risks the last one's percent times risk_multiplier
+        assert simulation.current_risk_percent == 3.0 * config.risk_multiplier
+
+def test_restart_resumes_the_open_trade(db, config):
+    first = TradingSimulation(config)
+    first.open_trade(signal_row())
+    assert WriteBehindQueue.get().flush(5)
+
+    restarted = TradingSimulation(config)
+
+    assert restarted.get_open_trade() == first.get_open_trade()
+    assert restarted.get_open_trade()["status"] == "OPEN"
+
+def test_write_retried_after_connection_failure_is_not_duplicated(db, config):
+    simulation = TradingSimulation(config)
+    trades = simulation.trades_collection
+    insert_one = trades.insert_one
+    attempts = []
+
+    def insert_then_lose_the_reply(document):
+        attempts.append(document["_id"])
+        insert_one(document)
+        if len(attempts) == 1:
+            raise AutoReconnect("connection lost before the reply")
+
+    trades.insert_one = insert_then_lose_the_reply
+    simulation.open_trade(signal_row(prediction=1, close=100.0))
+    open_trade = simulation.get_open_trade()
+    simulation.close_trade(open_trade, "TP", signal_row(close=104.0, timestamp="2024-01-01 01:00"),
+                           forced_exit_price=104.0)
+    assert WriteBehindQueue.get().flush(5)
+
+    assert len(attempts) == 2
+    stored = list(trades.find({}))
+    assert len(stored) == 1
+    # The close queued behind the insert waited for its retry
+    assert stored[0]["status"] == "TP"
+
+def test_pending_writes_are_flushed_at_exit(tmp_path):
+    marker = tmp_path / "written"
+    script = textwrap.dedent(f"""
+        import time
+        from bot import WriteBehindQueue
+
+        def slow_write(path):
+            time.sleep(0.5)
+            open(path, "w").write("done")
+
+        WriteBehindQueue.get().submit(slow_write, {str(marker)!r})
+    """)
+    subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(bot.__file__), check=True, timeout=60)
+
+    assert marker.read_text() == "done"
@@ -0,0 +1,74 @@
+"""
+AIModel.walk_forward against the live loop, and training windows that hold a single class.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bot import AIModel, FeatureGraph, MarketDataFetcher, StrategyConfig, WarmupCalculator
+from test_predictions import BASELINE, DATA_DIR, live_predictions
+
+def walk_forward_predictions(config: StrategyConfig, candles: pd.DataFrame) -> dict:
+    WarmupCalculator.resolve_limit(config)
+    graph = FeatureGraph.for_config(config)
+    features = graph.compute(candles.copy()).reset_index(drop=True)
+    predictions = AIModel(config, connect_db=False).walk_forward(features, config.LIMIT - 1 - graph.trimmed_rows())
+    return {str(ts): float(p) for ts, p in zip(features['timestamp'], predictions)}
+
+@pytest.fixture(scope="module")
+def candles():
+    return MarketDataFetcher.load_pipeline_csv(os.path.join(DATA_DIR, "BTC_1h.csv"))
+
+def test_walk_forward_matches_baseline_predictions(candles):
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+
+    predictions = walk_forward_predictions(StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h"), candles)
+
+    assert {ts: predictions[ts] for ts in baseline} == baseline
+
+def test_walk_forward_matches_live_loop_at_derived_limit(candles):
+    config = StrategyConfig(SYMBOL="BTC/USDT", TIMEFRAME="1h")
+    config.LIMIT = None
+
+    predictions = walk_forward_predictions(config, candles)
+    live = live_predictions(config, candles, 100)
+
+    assert {ts: predictions[ts] for ts in live} == live
+
+def neutral_frame(n: int = 300) -> pd.DataFrame:
+    """
+    Feature rows whose ADX is below 20 everywhere, so every label is 0.
+    """
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(rng.normal(100, 5, (n, len(AIModel.FEATURES))), columns=AIModel.FEATURES)
+    df['timestamp'] = pd.date_range('2024-01-01', periods=n, freq='h')
+    df['ADX'] = 10.0
+    df['Support_Level'] = df['close'] - 10
+    df['Resistance_Level'] = df['close'] + 10
+    df['EMA_LONG'] = df['SMA_SHORT'] = df['close']
+    df['Breakout_Confirm'] = 0
+    df['Momentum_Confirm'] = 0
+    df['Lookahead_Period'] = 7
+    return df
+
+@pytest.mark.parametrize("overrides", [
+    {},
+    {"use_numpy_model": False},
+    {"use_incremental_model": True},
+    {"use_logistic_smoothing": False},
+])
+def test_single_class_window_predicts_that_class(overrides):
+    config = StrategyConfig(SYMBOL="SYN/USDT", TIMEFRAME="1h")
+    config.window_size_AI = 100
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    df = neutral_frame()
+
+    predictions = AIModel(config, connect_db=False).walk_forward(df, labeled=150)
+
+    assert np.all(predictions[149:] == 0)
+    assert np.isnan(predictions[:149]).all()
@@ -0,0 +1,87 @@
+from app import mongo
+from functools import wraps
+from datetime import datetime, timedelta, timezone
+from flask import request, jsonify, make_response
+from pymongo.errors import DuplicateKeyError
+
+class IdempotencyKey:
+    """
+    Idempotency-Key records for the bot's trade notifications. A key is
+    "pending" while its request runs and "done" once it answered 2xx; any
+    other outcome deletes the pending key so a retry is processed again.
+    Both states expire through a TTL index on expires_at.
+    """
+    PENDING_TTL = timedelta(minutes=15)  # frees keys of requests that died mid-way
+    DONE_TTL = timedelta(days=7)         # covers retries of a lost response, bot restarts included
+    _indexed = False
+
+    @staticmethod
+    def collection():
+        if not IdempotencyKey._indexed:
+            mongo.db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+            IdempotencyKey._indexed = True
+        return mongo.db.idempotency_keys
+
+    @staticmethod
+    def claim(key):
+        """
+        Record the key as pending. Returns None when claimed, else the status
+        of the existing record ("pending" or "done").
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            IdempotencyKey.collection().insert_one({
+                "_id": key,
+                "status": "pending",
+                "created_at": now,
+                "expires_at": now + IdempotencyKey.PENDING_TTL
+            })
+            return None
+        except DuplicateKeyError:
+            existing = IdempotencyKey.collection().find_one({"_id": key}, {"status": 1})
+            # Expired between the insert and the read; the retry will claim it
+            return existing.get("status", "done") if existing else "pending"
+
+    @staticmethod
+    def complete(key):
+        now = datetime.now(timezone.utc)
+        IdempotencyKey.collection().update_one(
+            {"_id": key},
+            {"$set": {"status": "done", "expires_at": now + IdempotencyKey.DONE_TTL}}
+        )
+
+    @staticmethod
+    def release(key):
+        IdempotencyKey.collection().delete_one({"_id": key, "status": "pending"})
+
+def idempotent(duplicate_message):
+    """
+    Process each Idempotency-Key once. A duplicate of a finished request gets
+    200 with duplicate_message; a duplicate of one still running gets 503 so
+    the bot retries it later. Requests without the header are not tracked.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if not key:
+                return view(*args, **kwargs)
+
+            status = IdempotencyKey.claim(key)
+            if status == "done":
+                return jsonify({"message": duplicate_message}), 200
+            if status == "pending":
+                return jsonify({"message": "Request with this Idempotency-Key is still being processed"}), 503
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                IdempotencyKey.release(key)
+                raise
+            if response.status_code < 300:
+                IdempotencyKey.complete(key)
+            else:
+                IdempotencyKey.release(key)
+            return response
+        return wrapper
+    return decorator
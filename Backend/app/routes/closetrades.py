@@ -11,6 +11,7 @@ from dotenv import load_dotenv
 from pymongo import MongoClient
 from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
+from app.models.idempotency import idempotent
 
 from pprint import pprint
 
@@ -317,6 +318,7 @@ CORS(closetrades_bp)
 # close_trade Route
 # -------------------------------------------------------------------
 @closetrades_bp.route('/close_trade', methods=['POST'])
+@idempotent("Duplicate close trade request ignored")
 def close_trade():
     data = request.get_json()
     symbol = data.get("symbol")
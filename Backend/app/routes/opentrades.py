@@ -11,6 +11,7 @@ from flask import Blueprint, request, jsonify
 from flask_cors import CORS
 from pymongo import MongoClient
 from bson import ObjectId
+from app.models.idempotency import idempotent
 
 # ------------------------------------------------------------------------------
 # Environment and Database Setup
@@ -313,6 +314,7 @@ def build_trade_info(trade_data: dict, sub: dict, user: dict) -> dict:
 # Flask Route: Open Trade
 # ------------------------------------------------------------------------------
 @opentrades_bp.route('/open_trade', methods=['POST'])
+@idempotent("Duplicate open trade request ignored")
 def open_trade():
     """
     Process the open trade request:
@@ -0,0 +1,91 @@
+"""
+The idempotent decorator and its IdempotencyKey records, on a throwaway Flask
+app over mongomock.
+"""
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, jsonify
+
+mongomock = pytest.importorskip("mongomock")
+
+from app.models import idempotency
+from app.models.idempotency import IdempotencyKey, idempotent
+
+@pytest.fixture
+def keys(monkeypatch):
+    db = mongomock.MongoClient().db
+    monkeypatch.setattr(idempotency, "mongo", SimpleNamespace(db=db))
+    monkeypatch.setattr(IdempotencyKey, "_indexed", False)
+    return db.idempotency_keys
+
+@pytest.fixture
+def view():
+    """
+    A route answering with whatever `view.answer` says and counting its calls.
+    """
+    state = SimpleNamespace(answer=({"message": "processed"}, 200), calls=0)
+    app = Flask(__name__)
+
+    @app.route("/trade", methods=["POST"])
+    @idempotent("Duplicate trade request ignored")
+    def trade():
+        state.calls += 1
+        body, status = state.answer
+        if isinstance(body, Exception):
+            raise body
+        return jsonify(body), status
+
+    state.client = app.test_client()
+    state.post = lambda key=None: state.client.post("/trade", headers={"Idempotency-Key": key} if key else {})
+    return state
+
+def test_repeated_key_is_processed_once(keys, view):
+    first = view.post("trade-1:open")
+    duplicate = view.post("trade-1:open")
+
+    assert first.status_code == 200 and first.json == {"message": "processed"}
+    assert duplicate.status_code == 200 and duplicate.json == {"message": "Duplicate trade request ignored"}
+    assert view.calls == 1
+    assert keys.find_one({"_id": "trade-1:open"})["status"] == "done"
+
+def test_duplicate_of_a_running_request_gets_503(keys, view):
+    assert IdempotencyKey.claim("trade-1:close") is None  # another worker is processing it
+
+    response = view.post("trade-1:close")
+
+    # 503 is retried by the bot's outbox, unlike a final 4xx
+    assert response.status_code == 503
+    assert view.calls == 0
+    assert keys.find_one({"_id": "trade-1:close"})["status"] == "pending"
+
+@pytest.mark.parametrize("answer, status", [
+    ((RuntimeError("Bybit unreachable"), None), 500),
+    (({"message": "error"}, 500), 500),
+    (({"message": "Missing required parameters"}, 400), 400),
+])
+def test_failed_request_releases_its_key(keys, view, answer, status):
+    view.answer = answer
+    assert view.post("trade-2:open").status_code == status
+    assert keys.find_one({"_id": "trade-2:open"}) is None
+
+    view.answer = ({"message": "processed"}, 200)
+    retry = view.post("trade-2:open")
+
+    assert retry.json == {"message": "processed"}
+    assert view.calls == 2
+
+def test_requests_without_a_key_are_not_tracked(keys, view):
+    view.post()
+    view.post()
+
+    assert view.calls == 2
+    assert keys.count_documents({}) == 0
+
+def test_keys_expire_through_a_ttl_index(keys, view):
+    view.post("trade-3:open")
+
+    index = keys.index_information()["expires_at_1"]
+    assert index["expireAfterSeconds"] == 0
+    record = keys.find_one({"_id": "trade-3:open"})
+    assert record["expires_at"] - record["created_at"] >= IdempotencyKey.DONE_TTL